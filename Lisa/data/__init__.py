@@ -20,3 +20,7 @@ if config_options.get("use_cython"):
 else:
     from .data import Data
     from .file import Axis, File, MultiFile, DataError, DataContainer, DataNotInFile
+from .cache import DatasetCache, dataset_cache
+from .catalog import Catalog
+from .writer import rechunk, reduce
+from .integrity import scan
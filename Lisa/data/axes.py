@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Axis values shared across groups and files.
+
+All groups of a result file use the same axis datasets (/Info/AxisValues_t, _z, _E, _f). Lisa.File
+reads each axis once and uses the same read only array for every group. Arrays with identical
+values and attributes (e.g. the axes of a current scan in many files) are kept only once per
+process by `axis_store`, also when converted to a unit.
+
+The store only keeps weak references, the arrays are owned by the File objects using them.
+"""
+
+import hashlib
+import threading
+import weakref
+
+import numpy as np
+
+from .views import scale
+
+
+def _attrs_key(attrs):
+    return tuple(sorted((k, repr(np.asarray(v).tolist())) for k, v in attrs.items()))
+
+
+class AxisStore(object):
+    """
+    Deduplicates axis arrays (AttributedNPArray) by content.
+    """
+    def __init__(self):
+        self._arrays = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def share(self, array):
+        """
+        Get the shared array with the values and attributes of array
+        :param array: AttributedNPArray with the axis values
+        :return: a read only AttributedNPArray (array itself if it is the first of its kind)
+        """
+        key = (array.name, array.shape, array.dtype.str, _attrs_key(array.attrs),
+               hashlib.blake2b(np.ascontiguousarray(array).tobytes(), digest_size=16).digest())
+        with self._lock:
+            shared = self._arrays.get(key)
+            if shared is None:
+                array.flags.writeable = False
+                array.axis_key = key
+                self._arrays[key] = shared = array
+        return shared
+
+    def converted(self, array, factor, dtype):
+        """
+        Get the shared array of axis values converted to a unit
+        :param array: a shared axis array (see AxisStore.share)
+        :param factor: the conversion factor (None for 1.0)
+        :param dtype: dtype of the converted values
+        :return: read only AttributedNPArray
+        """
+        factor = np.float64(1.0) if factor is None else factor
+        dtype = np.dtype(dtype)
+        key = (array.axis_key, repr(factor), dtype.str)
+        with self._lock:
+            shared = self._arrays.get(key)
+            if shared is None:
+                shared = scale(array, factor, dtype)
+                shared.flags.writeable = False
+                shared.axis_key = key
+                self._arrays[key] = shared
+        return shared
+
+
+axis_store = AxisStore()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Reader backends for the file layouts of the different Inovesa versions.
+
+A backend knows the names of the h5 groups of one layout and how datasets of that layout are
+turned into what Lisa.File returns (including corrections of data that old Inovesa versions
+saved wrongly). The backend of a file is chosen once when it is opened (see backend_for), so
+accessing data does not compare versions. All corrections are lazy (see Lisa.data.virtual),
+only the requested part of a dataset is read.
+
+To support a new layout subclass Backend and add it to `backends`.
+"""
+
+import numpy as np
+
+from .utils import InovesaVersion, version9_1, version13_0, version14_1
+from .virtual import OffsetDataset, TransformedDataset, BunchLengthDataset
+
+# first version with correctly saved bunch lengths (Inovesa bug 24)
+version15_2 = InovesaVersion(0, 15, -2)
+
+
+class Backend(object):
+    """
+    Layout of Inovesa 0.15.-2 and later. Datasets are used as they are saved.
+    """
+    def __init__(self, version):
+        """
+        :param version: the InovesaVersion of the file
+        """
+        self.version = version
+        self.groups = self._group_names()
+
+    @classmethod
+    def handles(cls, version):
+        """
+        :return: True if files written by Inovesa version use this layout
+        """
+        return version >= version15_2
+
+    def _group_names(self):
+        """
+        :return: dictionary method name (e.g. bunch_profile) -> group name (e.g. BunchProfile)
+        """
+        groups = {
+            "energy_spread": "EnergySpread",
+            "bunch_length": "BunchLength",
+            "bunch_position": "BunchPosition",
+            "bunch_population": "BunchPopulation",
+            "bunch_profile": "BunchProfile",
+            "csr_intensity": "CSR/Intensity",
+            "csr_spectrum": "CSR/Spectrum",
+            "energy_profile": "EnergyProfile",
+            "impedance": "Impedance",
+            "particles": "Particles",
+            "phase_space": "PhaseSpace",
+            "wake_potential": "WakePotential",
+            "parameters": "Info/Parameters"
+        }
+        if self.version > version13_0:
+            groups.update({"source_map": "SourceMap"})
+        return groups
+
+    def axis(self, file, elem, obj):
+        """
+        Get the values of an axis
+        :param file: the Lisa.File
+        :param elem: the axis (e.g. Axis.TIME)
+        :param obj: the h5py Dataset of the axis
+        """
+        return file._axis(obj)
+
+    def dataset(self, file, what, elem, obj):
+        """
+        Get the object to return for a dataset that is not an axis
+        :param file: the Lisa.File
+        :param what: the group (e.g. bunch_length)
+        :param elem: the element in the group (e.g. Axis.DATA)
+        :param obj: the h5py Dataset
+        """
+        return file._open_dataset(obj)
+
+    def parameter(self, file, name):
+        """
+        Get the value of an Inovesa parameter
+        :param file: the Lisa.File
+        :param name: name of the parameter (e.g. BunchCurrent)
+        :return: the value or None if it is not saved
+        """
+        return file.file.get("Info/Parameters").attrs.get(name)
+
+
+class Inovesa14Backend(Backend):
+    """
+    Layout of Inovesa 0.14.-1 up to 0.15.-1. Saved bunch lengths are wrong (Inovesa bug 24),
+    they are calculated from the bunch profiles instead.
+    """
+    @classmethod
+    def handles(cls, version):
+        return version14_1 <= version < version15_2
+
+    def dataset(self, file, what, elem, obj):
+        if what == "bunch_length" and elem == file.select_axis.DATA:
+            profile = file._group_dict("bunch_profile", [file.select_axis.XAXIS,
+                                                         file.select_axis.DATA])[0]
+            return BunchLengthDataset(profile[file.select_axis.DATA],
+                                      profile[file.select_axis.XAXIS], obj.attrs, obj.name)
+        return file._open_dataset(obj)
+
+
+class Inovesa13Backend(Backend):
+    """
+    Layout of Inovesa versions before 0.14.-1 (except 0.9.1). Bunch lengths are saved squared
+    (Inovesa bug 24).
+    """
+    @classmethod
+    def handles(cls, version):
+        return version < version14_1 and version != version9_1
+
+    def dataset(self, file, what, elem, obj):
+        if what == "bunch_length" and elem == file.select_axis.DATA:
+            return TransformedDataset(file._open_dataset(obj), np.sqrt)
+        return file._open_dataset(obj)
+
+
+class Inovesa9Backend(Backend):
+    """
+    Layout of Inovesa 0.9.1. Groups have their own axes and some different names. The first
+    entry of time axes and of time dependent data and all but the first row of other axes are
+    not part of the data. Bunch lengths are saved squared. BunchCurrent and RevolutionFrequency
+    are read from the .cfg file.
+    """
+    @classmethod
+    def handles(cls, version):
+        return version == version9_1
+
+    def _group_names(self):
+        groups = super(Inovesa9Backend, self)._group_names()
+        groups.update({"csr_intensity": "CSRPower"})
+        groups.update({"csr_spectrum": "CSRSpectrum"})
+        groups.update({"bunch_population": "BunchCurrent"})
+        del groups["particles"]
+        del groups["parameters"]
+        del groups["energy_profile"]
+        return groups
+
+    def axis(self, file, elem, obj):
+        return file._axis(obj, "[1:]" if elem == file.select_axis.TIME else "[0]")
+
+    def dataset(self, file, what, elem, obj):
+        if elem != file.select_axis.DATA or \
+                file.select_axis.TIME not in file.select_axis.all_for(what):
+            return file._open_dataset(obj)
+        data = OffsetDataset(file._open_dataset(obj), 1, attrs=obj.attrs, name=obj.name)
+        if what == "bunch_length":
+            return TransformedDataset(data, np.sqrt)
+        return data
+
+    def parameter(self, file, name):
+        if name == "BunchCurrent":
+            value = file._read_from_cfg(name)
+            if value is None:
+                value = file.file.get("BunchCurrent/data")[0]
+            return value
+        if name == "RevolutionFrequency":
+            return file._read_from_cfg(name)
+        return super(Inovesa9Backend, self).parameter(file, name)
+
+
+# checked in this order, the first backend handling a version is used
+backends = [Backend, Inovesa14Backend, Inovesa13Backend, Inovesa9Backend]
+
+
+def backend_for(version):
+    """
+    Get the backend for files written by an Inovesa version
+    :param version: the InovesaVersion of the file
+    :return: Backend instance
+    """
+    for backend in backends:
+        if backend.handles(version):
+            return backend(version)
+    return Backend(version)
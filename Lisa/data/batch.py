@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Batched reads of scattered rows (time steps) of a dataset.
+
+Reading e.g. every 50th snapshot or a list of burst onsets one index at a time costs one HDF5
+read per index. The rows are sorted and coalesced into as few reads as possible instead:
+
+  - arithmetic progressions (consecutive or strided rows, at least min_run rows) are read with
+    one strided hyperslab each, also across chunk boundaries
+  - all remaining rows are read with a single sorted point selection
+
+So every chunk is visited in increasing order and decompressed once (the chunk cache holds at
+least one snapshot, see Lisa.data.chunkcache). The result is returned in the order (and with the
+duplicates) the rows were requested.
+"""
+
+import numbers
+
+import numpy as np
+
+
+def normalize_rows(indices, length):
+    """
+    Convert an index specification for the first axis to an array of row numbers
+    :param indices: integer, list/array of integers (negative counts from the end), boolean mask,
+            range or slice
+    :param length: length of the first axis
+    :return: int64 array of rows in the requested order
+    """
+    if isinstance(indices, slice):
+        return np.arange(*indices.indices(length), dtype=np.int64)
+    if isinstance(indices, numbers.Integral):
+        indices = [indices]
+    rows = np.asarray(indices)
+    if rows.dtype == bool:
+        if rows.shape != (length,):
+            raise IndexError("boolean index has to have the length of the time axis "
+                             "({} instead of {})".format(length, rows.shape))
+        return np.flatnonzero(rows).astype(np.int64)
+    if rows.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    if rows.ndim != 1 or rows.dtype.kind not in "iu":
+        raise IndexError("indices have to be a one dimensional list of integers")
+    rows = rows.astype(np.int64)
+    rows = np.where(rows < 0, rows + length, rows)
+    if rows.min() < 0 or rows.max() >= length:
+        raise IndexError("index out of range for time axis of length {}".format(length))
+    return rows
+
+
+def plan_reads(rows, min_run=3):
+    """
+    Coalesce sorted unique rows into reads
+    :param rows: sorted array of unique rows
+    :param min_run: minimal number of rows of a progression read as hyperslab
+    :return: list of (index to read, positions of the read rows in rows), the index is a strided
+            slice or a sorted list of rows
+    """
+    plan = []
+    points = []
+    start = 0
+    while start < len(rows):
+        stop = start + 1
+        if stop < len(rows):
+            step = rows[stop] - rows[start]
+            while stop + 1 < len(rows) and rows[stop + 1] - rows[stop] == step:
+                stop += 1
+            stop += 1
+        if stop - start >= min_run:
+            first, last = int(rows[start]), int(rows[stop - 1])
+            plan.append((slice(first, last + 1, int(step)), slice(start, stop)))
+            start = stop
+        else:  # not part of a progression, the next row may start one
+            points.append(start)
+            start += 1
+    if len(points) == 1:
+        plan.append((slice(int(rows[points[0]]), int(rows[points[0]]) + 1),
+                     slice(points[0], points[0] + 1)))
+    elif points:
+        points = np.asarray(points)
+        plan.append((rows[points].tolist(), points))
+    return plan
+
+
+def read_batch(dataset, rows, rest=(), out=None, on_read=None):
+    """
+    Read rows of an h5py dataset with as few HDF5 reads as possible
+    :param dataset: the h5py.Dataset
+    :param rows: array of rows in the requested order (see normalize_rows)
+    :param rest: selection of the remaining axes (slices or integers)
+    :param out: array to write the result to (None to allocate one)
+    :param on_read: callable called with the key of every hyperslab before it is read
+    :return: array with one entry per requested row
+    """
+    rest = tuple(rest)
+    rest_shape = np.broadcast_to(np.empty((), dtype=bool), dataset.shape[1:])[rest].shape
+    if out is None:
+        out = np.empty((len(rows),) + rest_shape, dtype=dataset.dtype)
+    if len(rows) == 0:
+        return out
+    unique, inverse = np.unique(rows, return_inverse=True)
+    in_order = len(unique) == len(rows) and np.all(unique == rows)
+    target = out if in_order else np.empty((len(unique),) + rest_shape, dtype=out.dtype)
+    for source, positions in plan_reads(unique):
+        key = (source,) + rest
+        if on_read is not None:
+            on_read(key)
+        if isinstance(positions, slice):
+            dataset.read_direct(target, key, np.s_[positions])
+        else:
+            target[positions] = dataset[key]
+    if not in_order:
+        np.take(target, inverse.ravel(), axis=0, out=out)
+    return out
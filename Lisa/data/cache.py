@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Process wide cache for preloaded datasets.
+
+All Lisa.File objects share one `DatasetCache` (`dataset_cache`). Entries are kept in least
+recently used order and evicted as soon as the total size exceeds the byte budget. The budget
+is taken from the config option "cache_budget" (environment variable cache_budget) unless set
+explicitly with `DatasetCache.set_budget`.
+"""
+
+import threading
+from collections import OrderedDict
+
+from ..internals import config_options
+
+
+class DatasetCache(object):
+    """
+    LRU cache for numpy arrays with a byte budget.
+
+    Keys are arbitrary hashable objects. Lisa.File uses (file key, h5 dataset name).
+    """
+    def __init__(self, budget=None):
+        """
+        :param budget: Maximum number of bytes to keep (None to use config option "cache_budget")
+        """
+        self._budget = budget
+        self._entries = OrderedDict()
+        self._known = set()  # keys cached so far, only lookups of these count as misses
+        self._nbytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def budget(self):
+        """The byte budget of this cache"""
+        if self._budget is None:
+            return int(config_options.get("cache_budget"))
+        return self._budget
+
+    @property
+    def nbytes(self):
+        """Number of bytes currently cached"""
+        return self._nbytes
+
+    def set_budget(self, budget):
+        """
+        Set the byte budget and evict entries if necessary
+        :param budget: Maximum number of bytes (None to use config option "cache_budget")
+        """
+        with self._lock:
+            self._budget = budget
+            self._evict(0)
+
+    def fits(self, nbytes):
+        """
+        Check if an entry of size nbytes can be cached at all
+        :param nbytes: size in bytes
+        """
+        return nbytes <= self.budget
+
+    def _evict(self, nbytes):
+        """Evict least recently used entries until nbytes additional bytes fit into budget"""
+        while self._entries and self._nbytes + nbytes > self.budget:
+            _, array = self._entries.popitem(last=False)
+            self._nbytes -= array.nbytes
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        """
+        Get an entry and mark it as recently used. Counts hits and misses, a miss is a lookup of
+        a key that was cached before (evicted or discarded). Keys that were never cached (e.g.
+        datasets that were not preloaded) are not counted.
+        :param key: the key of the entry
+        :param default: returned if key is not cached
+        """
+        with self._lock:
+            try:
+                array = self._entries[key]
+            except KeyError:
+                if key in self._known:
+                    self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return array
+
+    def put(self, key, array):
+        """
+        Add an entry. Least recently used entries are evicted to stay within the budget.
+        :param key: the key of the entry
+        :param array: numpy array to cache
+        :return: True if array was cached, False if it is larger than the budget
+        """
+        if not self.fits(array.nbytes):
+            return False
+        with self._lock:
+            self.discard(key)
+            self._evict(array.nbytes)
+            self._entries[key] = array
+            self._known.add(key)
+            self._nbytes += array.nbytes
+        return True
+
+    def discard(self, key):
+        """
+        Remove an entry if it exists
+        :param key: the key of the entry
+        """
+        with self._lock:
+            array = self._entries.pop(key, None)
+            if array is not None:
+                self._nbytes -= array.nbytes
+
+    def clear(self, prefix=None):
+        """
+        Remove entries. Removed keys are forgotten, looking them up does not count as a miss.
+        :param prefix: if given only remove entries with keys of the form (prefix, ...)
+        """
+        with self._lock:
+            for key in list(self._known):
+                if prefix is None or (isinstance(key, tuple) and key[0] == prefix):
+                    self.discard(key)
+                    self._known.discard(key)
+
+    def items(self, prefix=None):
+        """
+        Get the entries without marking them as used (and without counting hits)
+        :param prefix: if given only get entries with keys of the form (prefix, ...)
+        :return: list of (key, array)
+        """
+        with self._lock:
+            return [(key, array) for key, array in self._entries.items()
+                    if prefix is None or (isinstance(key, tuple) and key[0] == prefix)]
+
+    def stats(self):
+        """
+        Get statistics of this cache
+        :return: dictionary with hits, misses, evictions, entries, nbytes and budget
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "nbytes": self._nbytes,
+                    "budget": self.budget}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+dataset_cache = DatasetCache()
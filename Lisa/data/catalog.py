@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Persistent catalog of Inovesa result files in a directory.
+
+The catalog is a SQLite database (`.lisa_catalog.sqlite`) next to the result files. For every
+file it stores the Inovesa version, the attributes of Info/Parameters, the values from the
+corresponding .cfg file and shape and dtype of every dataset. Entries are keyed by path,
+modification time and size so only new or changed files are opened when refreshing.
+Results of integrity checks (see Lisa.data.integrity) are stored per file as well.
+
+If the directory is not writable an in-memory database is used instead.
+
+Queries are python expressions over parameter names, e.g.::
+
+    catalog.query("BunchCurrent > 1e-3 and version >= '0.15'")
+
+`version` compares against strings like '0.15' or '0.15.-1'. Floats are rejected, 0.10 would be
+the same as 0.1. Versions given with fewer than three parts compare on these parts only:
+`version >= '0.15'` includes the pre-releases 0.15.-x and `version == '0.15'` matches every
+0.15.x. Names not saved for a file evaluate to None, comparisons with None are False.
+"""
+
+import ast
+import json
+import operator
+import os
+import sqlite3
+import sys
+import threading
+
+import h5py as h5
+import numpy as np
+
+from .utils import InovesaVersion
+
+
+CATALOG_NAME = ".lisa_catalog.sqlite"
+
+
+class CatalogError(Exception):
+    pass
+
+
+def _to_json(value):
+    """Convert h5 attribute values (numpy types, bytes) to json serializable objects"""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if isinstance(value, np.ndarray):
+        return [_to_json(v) for v in value.tolist()]
+    if isinstance(value, np.generic):
+        return _to_json(value.item())
+    return value
+
+
+def _parse_version(value):
+    """
+    Create InovesaVersion from a version specification
+    :param value: InovesaVersion, sequence (release, minor, fix) or string like '0.15.-1'
+    """
+    if isinstance(value, InovesaVersion):
+        return value
+    if isinstance(value, (list, tuple)):
+        return InovesaVersion(*[int(v) for v in value])
+    parts = str(value).split(".")
+    try:
+        parts = [int(p) for p in parts]
+    except ValueError:
+        raise CatalogError("'{}' is not a valid Inovesa version.".format(value))
+    if len(parts) > 3:
+        raise CatalogError("'{}' is not a valid Inovesa version.".format(value))
+    return InovesaVersion(*(parts + [0] * (3 - len(parts))))
+
+
+def _version_key(value):
+    """
+    Get a tuple to compare versions with
+    :param value: InovesaVersion or version specification (see _parse_version)
+    :return: tuple with one entry per given part, a version with fewer than three parts (e.g.
+            '0.15') is not completed, it compares on the given parts only
+    """
+    if isinstance(value, float):
+        raise CatalogError("Give versions as strings (e.g. '{}'), floats are ambiguous ('0.10' "
+                           "would be 0.1).".format(value))
+    if isinstance(value, InovesaVersion) or isinstance(value, (list, tuple)) and len(value) == 3:
+        version = _parse_version(value)
+        return version.release, version.minor, version.fix if version.fix > 0 else 100
+    parts = value if isinstance(value, (list, tuple)) else str(value).split(".")
+    if len(parts) >= 3:
+        return _version_key(_parse_version(value))
+    try:
+        return tuple(int(p) for p in parts)
+    except ValueError:
+        raise CatalogError("'{}' is not a valid Inovesa version.".format(value))
+
+
+def _comparable_versions(left, right):
+    """
+    Convert both sides of a comparison with a version to tuples compared on the parts given on
+    both sides, so '0.15' matches every 0.15.x (also the pre-releases 0.15.-x)
+    """
+    left, right = _version_key(left), _version_key(right)
+    length = min(len(left), len(right))
+    return left[:length], right[:length]
+
+
+def read_cfg(filename):
+    """
+    Read all values from an Inovesa .cfg file
+    :param filename: the .cfg file
+    :return: dictionary (values converted to float where possible)
+    """
+    values = {}
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.split("#")[0]
+            if "=" not in line:
+                continue
+            key, value = [s.strip() for s in line.split("=", 1)]
+            try:
+                values[key] = float(value)
+            except ValueError:
+                values[key] = value
+    return values
+
+
+def file_state(path):
+    """
+    Get the state of a result file used to detect changes
+    :return: (modification time, size, modification time of the .cfg file or None)
+    """
+    stat = os.stat(path)
+    cfg = cfg_for(path)
+    return stat.st_mtime, stat.st_size, os.stat(cfg).st_mtime if cfg is not None else None
+
+
+def cfg_for(filename):
+    """
+    Find the .cfg file belonging to a result file (name.h5.cfg or name.cfg)
+    :return: the filename or None
+    """
+    for cfg in (filename + ".cfg", os.path.splitext(filename)[0] + ".cfg"):
+        if os.path.isfile(cfg):
+            return cfg
+    return None
+
+
+_compare = {ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+            ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+            ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b}
+_binary = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+           ast.Div: operator.truediv, ast.Pow: operator.pow, ast.Mod: operator.mod}
+_unary = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: operator.not_}
+# literal nodes and the attribute holding their value (Num, Str and NameConstant before 3.8)
+if sys.version_info >= (3, 8):
+    _literals = {ast.Constant: "value"}
+else:
+    _literals = {ast.Num: "n", ast.Str: "s", ast.Bytes: "s", ast.NameConstant: "value"}
+
+
+def _evaluate(node, values):
+    """
+    Evaluate a parsed query expression. Only literals, names, comparisons, boolean and
+    arithmetic operations are allowed.
+    :param node: the ast node
+    :param values: callable returning the value for a name
+    """
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body, values)
+    if type(node) in _literals:
+        return getattr(node, _literals[type(node)])
+    if isinstance(node, ast.Name):
+        return values(node.id)
+    if isinstance(node, (ast.Tuple, ast.List)):
+        return [_evaluate(e, values) for e in node.elts]
+    if isinstance(node, ast.BoolOp):
+        if isinstance(node.op, ast.And):
+            return all(_evaluate(v, values) for v in node.values)
+        return any(_evaluate(v, values) for v in node.values)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _unary:
+        operand = _evaluate(node.operand, values)
+        if operand is None and not isinstance(node.op, ast.Not):
+            return None
+        return _unary[type(node.op)](operand)
+    if isinstance(node, ast.BinOp) and type(node.op) in _binary:
+        left, right = _evaluate(node.left, values), _evaluate(node.right, values)
+        if left is None or right is None:
+            return None
+        return _binary[type(node.op)](left, right)
+    if isinstance(node, ast.Compare):
+        left = _evaluate(node.left, values)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluate(comparator, values)
+            if type(op) not in _compare or left is None or right is None:
+                return False
+            first, second = left, right
+            if isinstance(left, InovesaVersion) or isinstance(right, InovesaVersion):
+                first, second = _comparable_versions(left, right)
+            try:
+                if not _compare[type(op)](first, second):
+                    return False
+            except TypeError:
+                return False
+            left = right
+        return True
+    raise CatalogError("Unsupported expression in query: " + ast.dump(node))
+
+
+class Catalog(object):
+    """
+    SQLite index of the Inovesa result files in one directory.
+
+    Usage::
+
+        catalog = Catalog("/path/to/dir")
+        catalog.refresh(glob.glob("/path/to/dir/*.h5"))
+        catalog.value("/path/to/dir/run.h5", "BunchCurrent")
+        catalog.query("BunchCurrent > 1e-3 and version >= '0.15'")
+    """
+    def __init__(self, directory, filename=None):
+        """
+        :param directory: the directory containing the result files
+        :param filename: the database file (None for .lisa_catalog.sqlite in directory)
+        """
+        self.directory = directory
+        self.filename = filename if filename is not None else os.path.join(directory,
+                                                                             CATALOG_NAME)
+        # used from other threads by MultiFile.watch, access is serialized by self._lock
+        try:
+            self._db = sqlite3.connect(self.filename, check_same_thread=False)
+            self._create_tables()
+        except (sqlite3.Error, OSError):
+            self.filename = ":memory:"
+            self._db = sqlite3.connect(self.filename, check_same_thread=False)
+            self._create_tables()
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def _create_tables(self):
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS files ("
+                             "path TEXT PRIMARY KEY, mtime REAL, size INTEGER, cfg_mtime REAL, "
+                             "version TEXT, parameters TEXT, cfg TEXT, datasets TEXT)")
+            # results of Lisa.data.integrity, valid while the file does not change
+            self._db.execute("CREATE TABLE IF NOT EXISTS scans ("
+                             "path TEXT PRIMARY KEY, mtime REAL, size INTEGER, cfg_mtime REAL, "
+                             "result TEXT)")
+
+    @staticmethod
+    def _stat(path):
+        return file_state(path)
+
+    @staticmethod
+    def _scan(path):
+        """Read version, parameters and dataset information from a result file"""
+        version, parameters, datasets = None, {}, {}
+        try:
+            with h5.File(path, 'r') as f:
+                info = f.get("Info")
+                if info is not None:
+                    for name in ("Inovesa_v", "INOVESA_v"):
+                        if name in info:
+                            version = [int(v) for v in info.get(name)]
+                            break
+                    if "Parameters" in info:
+                        parameters = {k: _to_json(v) for k, v in info["Parameters"].attrs.items()}
+
+                def add(name, obj):
+                    if isinstance(obj, h5.Dataset):
+                        datasets[name] = {"shape": list(obj.shape), "dtype": str(obj.dtype)}
+                f.visititems(add)
+        except OSError:
+            pass  # not a hdf5 file, keep an empty entry so it is not opened again
+        cfg = cfg_for(path)
+        return version, parameters, read_cfg(cfg) if cfg is not None else {}, datasets
+
+    def refresh(self, filenames):
+        """
+        Update the catalog for the given files. Only files that are new or changed (path,
+        modification time or size, also of the .cfg file) are opened. Entries for files in
+        the catalog directory that are not in filenames are removed.
+        :param filenames: list of result files
+        :return: list of files that were (re)read
+        """
+        with self._lock:
+            known = {row[0]: tuple(row[1:]) for row in
+                     self._db.execute("SELECT path, mtime, size, cfg_mtime FROM files")}
+            paths = set()
+            changed = []
+            with self._db:
+                for filename in filenames:
+                    path = os.path.realpath(filename)
+                    paths.add(path)
+                    state = self._stat(path)
+                    if known.get(path) == state:
+                        continue
+                    version, parameters, cfg, datasets = self._scan(path)
+                    self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (path,) + state + (json.dumps(version), json.dumps(parameters),
+                                                        json.dumps(cfg), json.dumps(datasets)))
+                    self._entries.pop(path, None)
+                    changed.append(filename)
+                directory = os.path.realpath(self.directory)
+                for path in set(known) - paths:
+                    if os.path.dirname(path) == directory:
+                        self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+                        self._db.execute("DELETE FROM scans WHERE path = ?", (path,))
+                        self._entries.pop(path, None)
+            return changed
+
+    def entry(self, filename):
+        """
+        Get the catalog entry for a file
+        :param filename: the result file
+        :return: dictionary with version (InovesaVersion or None), parameters, cfg and datasets
+        """
+        with self._lock:
+            path = os.path.realpath(filename)
+            if path not in self._entries:
+                row = self._db.execute("SELECT version, parameters, cfg, datasets FROM files "
+                                       "WHERE path = ?", (path,)).fetchone()
+                if row is None:
+                    raise CatalogError("'{}' is not in the catalog. Call refresh first.".format(
+                        filename))
+                version = json.loads(row[0])
+                self._entries[path] = {
+                    "version": InovesaVersion(*version) if version is not None else None,
+                    "parameters": json.loads(row[1]),
+                    "cfg": json.loads(row[2]),
+                    "datasets": json.loads(row[3]),
+                }
+            return self._entries[path]
+
+    def value(self, filename, name, default=None):
+        """
+        Get a value for a file. Names are looked up in Info/Parameters first, then in the .cfg
+        values. "version" is the Inovesa version, "filename" the basename of the file.
+        :param filename: the result file
+        :param name: the name of the value
+        :param default: returned if the value is not saved for this file
+        """
+        entry = self.entry(filename)
+        if name == "version":
+            return entry["version"]
+        if name == "filename":
+            return os.path.basename(filename)
+        if name in entry["parameters"]:
+            return entry["parameters"][name]
+        return entry["cfg"].get(name, default)
+
+    def datasets(self, filename):
+        """
+        Get shape and dtype of every dataset in a file
+        :return: dictionary h5 path -> {"shape": [...], "dtype": "..."}
+        """
+        return self.entry(filename)["datasets"]
+
+    def scan_result(self, filename):
+        """
+        Get the stored integrity check of a file (see Lisa.data.integrity)
+        :param filename: the result file
+        :return: the result of Lisa.data.integrity.scan_file or None if the file was not scanned
+                since it changed
+        """
+        with self._lock:
+            path = os.path.realpath(filename)
+            row = self._db.execute("SELECT mtime, size, cfg_mtime, result FROM scans "
+                                   "WHERE path = ?", (path,)).fetchone()
+            if row is None or tuple(row[:3]) != self._stat(path):
+                return None
+            return json.loads(row[3])
+
+    def store_scan(self, filename, result):
+        """
+        Store the integrity check of a file (see Lisa.data.integrity)
+        :param filename: the result file
+        :param result: the result of Lisa.data.integrity.scan_file
+        """
+        with self._lock:
+            path = os.path.realpath(filename)
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO scans VALUES (?, ?, ?, ?, ?)",
+                                 (path,) + self._stat(path) + (json.dumps(result),))
+
+    def query(self, expression, filenames):
+        """
+        Get the files matching a query expression
+        :param expression: python expression, e.g. "BunchCurrent > 1e-3 and version >= '0.15'"
+        :param filenames: the files to check (order is kept)
+        :return: list of matching files
+        """
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except SyntaxError as e:
+            raise CatalogError("Invalid query '{}': {}".format(expression, e))
+        return [f for f in filenames
+                if _evaluate(tree, lambda name, f=f: self.value(f, name))]
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Tuning of the HDF5 raw data chunk cache of single datasets.
+
+HDF5 decompresses whole chunks and keeps them in a per dataset chunk cache. If the chunks
+touched by repeated reads do not fit into this cache, the same chunks are decompressed over and
+over again. `ChunkCacheTuner` keeps track of the selections read from a dataset, simulates the
+(least recently used) chunk cache to estimate hits and misses and proposes a larger cache when
+chunks are re-read after they were evicted. Lisa.File then reopens the dataset with that cache.
+"""
+
+import itertools
+import numbers
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from .virtual import expand_key
+
+
+def _next_prime(n):
+    """Smallest prime >= n (HDF5 recommends a prime number of hash table slots)"""
+    n = max(2, int(n))
+    while any(n % d == 0 for d in range(2, int(n ** 0.5) + 1)):
+        n += 1
+    return n
+
+
+def chunk_indices(key, shape, chunks):
+    """
+    Get the chunk indices a selection touches for each dimension
+    :param key: the selection (anything numpy accepts, except newaxis)
+    :param shape: shape of the dataset
+    :param chunks: chunk shape of the dataset
+    :return: list with one array of chunk indices per dimension
+    """
+    key = expand_key(key, len(shape))
+    key = key + (slice(None),) * (len(shape) - len(key))
+    indices = []
+    for k, dim, chunk in zip(key, shape, chunks):
+        if isinstance(k, numbers.Integral):  # e.g. a single snapshot
+            indices.append(np.array([(k + dim if k < 0 else k) // chunk]))
+        elif isinstance(k, slice):
+            rows = range(*k.indices(dim))
+            if len(rows) == 0:
+                indices.append(np.zeros(0, dtype=np.int64))
+            elif abs(rows.step) < chunk:  # every chunk in between is touched
+                first, last = sorted((rows[0], rows[-1]))
+                indices.append(np.arange(first // chunk, last // chunk + 1))
+            else:
+                indices.append(np.unique(np.asarray(rows) // chunk))
+        else:
+            k = np.asarray(k)
+            if k.dtype == bool:
+                k = np.flatnonzero(k)
+            indices.append(np.unique(np.where(k < 0, k + dim, k) // chunk))
+    return indices
+
+
+class ChunkCacheTuner(object):
+    """
+    Chooses the chunk cache size of one chunked dataset from its access pattern.
+    """
+    window = 16  # number of recent selections used to detect thrashing
+    max_tracked = 2 ** 16  # selections touching more chunks are not simulated (streaming reads)
+
+    def __init__(self, shape, chunks, itemsize, default_nbytes, max_nbytes):
+        """
+        :param shape: shape of the dataset
+        :param chunks: chunk shape of the dataset
+        :param itemsize: size of one element in bytes
+        :param default_nbytes: default chunk cache size of the file
+        :param max_nbytes: maximal chunk cache size to use
+        """
+        self.shape = tuple(shape)
+        self.chunks = tuple(chunks)
+        self.chunk_bytes = int(np.prod(chunks)) * itemsize
+        self.max_nbytes = max_nbytes
+        # enough for all chunks of one snapshot, so consecutive snapshots are read from the cache
+        snapshot_chunks = int(np.prod([-(-s // c) for s, c in zip(self.shape[1:],
+                                                                   self.chunks[1:])]))
+        self.nbytes = max(default_nbytes, min(max_nbytes, snapshot_chunks * self.chunk_bytes))
+        self.w0 = 0.0  # chunks are read repeatedly, evict least recently used only
+        self.hits = 0
+        self.misses = 0
+        self.reopens = 0
+        self._lru = OrderedDict()
+        self._recent = deque(maxlen=self.window)  # (chunks, re-reads) of recent selections
+        self._recent_rereads = 0  # sum of the re-reads in _recent
+        self._last_seen = {}  # chunk -> number of the selection it was last used in
+        self._count = 0
+        self._snapshot_grid = None  # chunk indices (without time) of a whole snapshot
+
+    @property
+    def nslots(self):
+        """Number of hash table slots for the chunk cache (about 100 per cached chunk)"""
+        return _next_prime(100 * max(1, self.nbytes // max(self.chunk_bytes, 1)))
+
+    @property
+    def capacity(self):
+        """Number of chunks fitting into the chunk cache"""
+        return self.nbytes // max(self.chunk_bytes, 1)
+
+    def record(self, key):
+        """
+        Record a selection read from the dataset
+        :param key: the selection
+        :return: new chunk cache size in bytes if the cache is thrashing, else None
+        """
+        self._count += 1
+        if isinstance(key, numbers.Integral) and self.shape:  # one snapshot (movie frames)
+            if self._snapshot_grid is None:
+                self._snapshot_grid = list(itertools.product(
+                    *[range(-(-s // c)) for s, c in zip(self.shape[1:], self.chunks[1:])]))
+            row = (key + self.shape[0] if key < 0 else key) // self.chunks[0]
+            touched = len(self._snapshot_grid)
+            if touched > self.max_tracked:
+                self.misses += touched
+                return None
+            grid = [(row,) + rest for rest in self._snapshot_grid]
+        else:
+            indices = chunk_indices(key, self.shape, self.chunks)
+            touched = int(np.prod([len(i) for i in indices]))
+            if touched == 0:
+                return None
+            if touched > self.max_tracked:
+                self.misses += touched
+                return None
+            grid = list(itertools.product(*[i.tolist() for i in indices]))
+        rereads = 0
+        for chunk in grid:
+            if chunk in self._lru:
+                self.hits += 1
+                self._lru.move_to_end(chunk)
+            else:
+                self.misses += 1
+                if self._count - self._last_seen.get(chunk, -self.window) < self.window:
+                    rereads += 1  # evicted although it was used recently
+                self._lru[chunk] = True
+                if len(self._lru) > self.capacity:
+                    self._lru.popitem(last=False)
+            self._last_seen[chunk] = self._count
+        if len(self._recent) == self.window:
+            self._recent_rereads -= self._recent[0][1]
+        self._recent.append((grid, rereads))
+        self._recent_rereads += rereads
+        if len(self._last_seen) > 4 * self.max_tracked:
+            self._last_seen = {c: n for c, n in self._last_seen.items()
+                               if self._count - n < self.window}
+        return self._propose()
+
+    def _propose(self):
+        """Get a larger cache size if the recent selections re-read evicted chunks"""
+        if self._recent_rereads < self.window or self.nbytes >= self.max_nbytes:
+            return None
+        working_set = len(set().union(*[c for c, _ in self._recent])) * self.chunk_bytes
+        nbytes = min(self.max_nbytes, working_set)
+        if nbytes <= self.nbytes:
+            return None
+        return nbytes
+
+    def resize(self, nbytes):
+        """
+        Use a new chunk cache size (after the dataset was reopened with it)
+        :param nbytes: the new size in bytes
+        """
+        self.nbytes = nbytes
+        self.reopens += 1
+        self._recent.clear()
+        self._recent_rereads = 0
+
+    def info(self):
+        """
+        Get settings and (estimated) statistics of the chunk cache
+        :return: dictionary
+        """
+        total = self.hits + self.misses
+        return {"chunks": self.chunks, "chunk_bytes": self.chunk_bytes, "nbytes": self.nbytes,
+                "nslots": self.nslots, "w0": self.w0, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else None, "reopens": self.reopens}
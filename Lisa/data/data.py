@@ -14,7 +14,10 @@ if config_options.get("use_cython"):
 else:
     from .file import File, Axis
 from ..internals import lisa_print
-from .utils import attr_from_unit, UnitError, DataNotInFile
+from .utils import attr_from_unit, factor_from_attrs, UnitError, DataNotInFile
+from .batch import normalize_rows
+from .views import Accessor, ScaledView, precisions, result_dtype
+from .lazy import expression
 import numpy as np
 
 
@@ -32,17 +35,30 @@ class Data(object):
 
     .. seealso:: Lisa.File
     """
-    def __init__(self, p_file):
+    def __init__(self, p_file, precision=None):
         """
         :param p_file: either a filename of a Lisa.File object
+        :param precision: dtype policy for converted data, one of "native", "float32", "float64"
+                (None for the config option "precision", see Lisa.data.views)
         """
         if isinstance(p_file, File):
             self._file = p_file
         else:
             self._file = File(p_file)
+        if precision is not None and precision not in precisions:
+            raise ValueError("Unknown precision '{}', use one of {}".format(
+                precision, ", ".join(precisions)))
+        self.precision = precision
 
         self.version = self._file.version
 
+    def __getstate__(self):
+        """Pickled with the File object (see File.__getstate__), the file is reopened lazily"""
+        return {"file": self._file, "precision": self.precision}
+
+    def __setstate__(self, state):
+        self.__init__(state["file"], state["precision"])
+
     def __getattr__(self, attr):
         """
         Convert to correct unit.
@@ -50,7 +66,10 @@ class Data(object):
         :param string unit: Use this as second argument or kwarg
         :param sub_idx: (kwarg) the index in the h5object (if File returns [Dataset1, Dataset2]
         then idx=0 and sub_idx is given will result in Dataset1[sub_idx])
-        This will speed up if only part of the data is used.
+        :param precision: (kwarg) dtype policy for this call (default: the one of this object)
+        :param out: (kwarg) array to write the converted data (or sub_idx) to, it is returned
+        :return: Lisa.data.views.ScaledView, the unit conversion is applied lazily. Indexing it
+        only reads (and converts) the selected part, same as using sub_idx.
         """
         if attr.endswith("_raw"):
             """
@@ -83,21 +102,26 @@ class Data(object):
             lisa_print("using unit specification", unit)
             if unit == '':
                 raise UnitError("No unit given.")
-            data = getattr(self._file, attr)(idx)
-
             sub_index = kwargs.get("sub_index", kwargs.get("sub_idx", None))
+            if sub_index is not None:
+                self._file._record_selection(attr, idx, sub_index)
+            data = getattr(self._file, attr)(idx)
 
             factor = self._conversion_factor(unit, attr, data)
 
-            if factor is None:
-                if sub_index is None:
-                    return data * np.float64(1.0)
-                else:
-                    return data[sub_index] * np.float64(1.0)
-            if sub_index is None:
-                return data * factor
+            dtype = result_dtype(data.dtype, kwargs.get("precision", self.precision))
+            if getattr(data, "axis_key", None) is not None:  # shared axis, conversion is cached
+                data, factor = self._file._axis_converted(data, factor, dtype), None
+            if sub_index is not None:
+                view = ScaledView(data, factor, dtype=dtype)
             else:
-                return data[sub_index] * factor
+                view = ScaledView(data, factor,
+                                  lambda key: self._file._record_selection(attr, idx, key), dtype)
+            out = kwargs.get("out")
+            if out is not None:
+                view.read_direct(out, sub_index)
+                return out
+            return view if sub_index is None else view[sub_index]
 
         inner.__doc__ = self.__getattr__.__doc__
         inner.__name__ = attr
@@ -172,17 +196,59 @@ class Data(object):
             attrs = self._file.impedance("datagroup").attrs
         else:
             attrs = data.attrs
-        if conversion_attribute in attrs:
-            return attrs[conversion_attribute]
-        elif conversion_attribute.startswith("Factor4") and conversion_attribute[7:] in attrs:
-            # for some versions of v14-1
-            return attrs[conversion_attribute[7:]]
-        elif conversion_attribute.startswith("Factor4") and conversion_attribute[7:-1] in attrs:
-            # for some versions of v14-1
-            return attrs[conversion_attribute[7:-1]]
-        else:
+        factor = factor_from_attrs(attrs, conversion_attribute)
+        if factor is None:
             lisa_print("units for this data", list(attrs))
             raise UnitError(unit + " is not a valid unit for this data.")
+        return factor
+
+    def accessor(self, what, axis=Axis.DATA, unit=None, precision=None):
+        """
+        Get a reusable reader for one dataset. Dataset, conversion factor and dtype are resolved
+        once, use this for many reads of small selections (e.g. one snapshot per movie frame).
+
+        ::
+
+            d = Lisa.Data("/path/to/file")
+            profile = d.accessor("bunch_profile", unit="c/s")
+            profile[100]  # snapshot 100 in c/s
+            profile.select(t=(200, 260, "ts"), x=(-5e-12, 5e-12, "s"))
+
+        :param what: The data to read (e.g. bunch_profile)
+        :param axis: The Axis object to select the dataset (default Axis.DATA)
+        :param unit: The unit to convert to (None for Inovesa units)
+        :param precision: dtype policy (None for the one of this object)
+        :return: Lisa.data.views.Accessor
+        """
+        return Accessor(self, what, axis, unit, precision)
+
+    def lazy(self, what, axis=Axis.DATA, unit=None, precision=None, time_unit=None, **ranges):
+        """
+        Get a lazy expression for a dataset converted to unit (see Lisa.data.lazy). Operations
+        on it are recorded and evaluated block by block along time by compute() or iter(), every
+        HDF5 chunk is read once per evaluation.
+
+        ::
+
+            d = Lisa.Data("/path/to/file")
+            ps = d.lazy("phase_space", unit="cpnblpnes", x=(-20e-12, 20e-12, "s"))
+            diffs = (ps[1000:2000] - ps[:500].mean(axis=0)).compute()
+
+        :param what: The data to use (e.g. phase_space)
+        :param axis: The Axis object to select the dataset (default Axis.DATA)
+        :param unit: The unit to convert to (None for Inovesa units)
+        :param precision: dtype policy (None for the one of this object)
+        :param time_unit: The unit for the time values yielded by iter() (None for Inovesa units)
+        :param ranges: ranges per axis as in Lisa.File.select
+        :return: Lisa.data.lazy.Expression
+        """
+        accessor = self.accessor(what, axis, unit, precision)
+        times = None
+        if self._file.select_axis.dims_for(what, axis)[:1] == [Axis.TIME]:
+            times = getattr(self._file, what)(Axis.TIME) * (
+                np.float64(1.0) if time_unit is None else
+                self.unit_factor(what, Axis.TIME, time_unit))
+        return expression(accessor, times)[self._file.selection(what, axis, **ranges)]
 
     def unit_factor(self, data, axis, unit):
         """
@@ -197,3 +263,97 @@ class Data(object):
         unit = unit.lower()
         data_object = getattr(self._file, data)(axis)
         return self._conversion_factor(unit, data, data_object)
+
+    def select(self, what, axis=Axis.DATA, unit=None, precision=None, out=None, **ranges):
+        """
+        Read only a hyperslab of a dataset and convert it to unit.
+        Ranges are specified as in Lisa.File.select
+
+        ::
+
+            d = Lisa.Data("/path/to/file")
+            ps = d.select("phase_space", unit="cpnblpnes", t=(200, 260, "ts"),
+                          x=(-20e-12, 20e-12, "s"), e=(-5e6, 5e6, "ev"))
+
+        :param what: The data to select from (e.g. phase_space)
+        :param axis: The Axis object to select the dataset (default Axis.DATA)
+        :param unit: The unit to convert to (None for Inovesa units)
+        :param precision: dtype policy (None for the one of this object)
+        :param out: array to read the selection into (instead of allocating a new one)
+        :return: numpy array with the selected data in unit (out if given)
+        """
+        unit = unit.lower() if unit is not None else None
+        data = getattr(self._file, what)(axis)
+        factor = self._conversion_factor(unit, what, data)
+        key = self._file.selection(what, axis, **ranges)
+        self._file._record_selection(what, axis, key)
+        view = ScaledView(data, factor,
+                          dtype=result_dtype(data.dtype, self.precision if precision is None
+                                             else precision))
+        if out is not None:
+            view.read_direct(out, key)
+            return out
+        return view[key]
+
+    def take(self, what, indices, axis=Axis.DATA, unit=None, precision=None, out=None, **ranges):
+        """
+        Read the snapshots at scattered or strided time indices converted to unit.
+        Reads are coalesced, see Lisa.File.take
+
+        ::
+
+            d = Lisa.Data("/path/to/file")
+            ps = d.take("phase_space", slice(None, None, 50), unit="cpnblpnes")
+
+        :param what: The data to read (e.g. phase_space)
+        :param indices: time indices as list/array, boolean mask, range or slice
+        :param axis: The Axis object to select the dataset (default Axis.DATA)
+        :param unit: The unit to convert to (None for Inovesa units)
+        :param precision: dtype policy (None for the one of this object)
+        :param out: array to read into (None to allocate a new one)
+        :param ranges: ranges of the other axes (see Lisa.File.select)
+        :return: numpy array with one snapshot per index in unit (out if given)
+        """
+        unit = unit.lower() if unit is not None else None
+        data = getattr(self._file, what)(axis)
+        factor = self._conversion_factor(unit, what, data)
+        if out is None:
+            dtype = result_dtype(data.dtype, self.precision if precision is None else precision)
+            rows = normalize_rows(indices, len(data))
+            rest = self._file.selection(what, axis, **ranges)[1:]
+            rest_shape = np.broadcast_to(np.empty((), dtype=bool), data.shape[1:])[rest].shape
+            out = np.empty((len(rows),) + rest_shape, dtype=dtype)
+            indices = rows
+        self._file.take(what, indices, axis, out, **ranges)
+        if factor is not None and factor != 1:
+            np.multiply(out, factor, out=out)
+        return out
+
+    def iter_time(self, what, unit=None, axis=Axis.DATA, batch=None, time_unit=None,
+                  precision=None):
+        """
+        Iterate over a group in blocks of snapshots converted to unit.
+        The same buffer is used for every block, see Lisa.File.iter_time
+
+        ::
+
+            d = Lisa.Data("/path/to/file")
+            for times, ps in d.iter_time("phase_space", "cpnblpnes", batch=100, time_unit="s"):
+                ...
+
+        :param what: the group (e.g. phase_space)
+        :param unit: The unit to convert to (None for Inovesa units)
+        :param axis: The Axis object to select the dataset (default Axis.DATA)
+        :param batch: number of snapshots per block (None for default)
+        :param time_unit: The unit for the time values (None for Inovesa units)
+        :param precision: dtype policy for the blocks (None for the one of this object)
+        :return: generator yielding (time values, data block)
+        """
+        unit = unit.lower() if unit is not None else None
+        data = getattr(self._file, what)(axis)
+        factor = self._conversion_factor(unit, what, data)
+        dtype = result_dtype(data.dtype, self.precision if precision is None else precision)
+        time_factor = self.unit_factor(what, Axis.TIME, time_unit) if time_unit is not None \
+            else None
+        for times, block in self._file.iter_time(what, batch, axis, factor, dtype):
+            yield (times * np.float64(1.0) if time_factor is None else times * time_factor), block
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Parallel decompression of gzip compressed datasets.
+
+h5py holds a global lock during every HDF5 call, so reads from several threads are serialized,
+including the decompression of chunks (which is most of the time spent reading compressed data).
+DecodedDataset reads the compressed chunks of a selection with H5Dread_chunk (fast, no filters
+applied) and decompresses them in a thread pool. zlib and numpy release the GIL while working on
+large buffers, so chunks are decoded in parallel, also while other threads wait for HDF5.
+
+Only datasets with deflate (gzip) and optionally shuffle filters can be decoded this way, see
+`decodable`. Lisa.File uses DecodedDataset for those if created with threads > 0.
+"""
+
+import itertools
+import numbers
+import threading
+import zlib
+from collections import OrderedDict
+
+import h5py as h5
+import numpy as np
+
+from .virtual import VirtualDataset, row_indices, take_rows
+
+supported_filters = (h5.h5z.FILTER_DEFLATE, h5.h5z.FILTER_SHUFFLE)
+
+
+def filter_pipeline(dataset):
+    """
+    Get the filters of a h5py dataset
+    :return: list of filter ids in the order they are applied when writing
+    """
+    plist = dataset.id.get_create_plist()
+    return [plist.get_filter(i)[0] for i in range(plist.get_nfilters())]
+
+
+def decodable(dataset):
+    """
+    Check if the chunks of dataset can be decoded by DecodedDataset
+    :param dataset: the h5py Dataset
+    """
+    if not isinstance(dataset, h5.Dataset) or dataset.chunks is None or \
+            dataset.dtype.kind not in "biufc":
+        return False
+    pipeline = filter_pipeline(dataset)
+    return h5.h5z.FILTER_DEFLATE in pipeline and all(f in supported_filters for f in pipeline)
+
+
+def decode_chunk(raw, filter_mask, pipeline, chunks, dtype):
+    """
+    Decompress a chunk as read by h5py.h5d.DatasetID.read_direct_chunk
+    :param raw: the stored bytes
+    :param filter_mask: bit i is set if filter i was not applied to this chunk
+    :param pipeline: filter ids (see filter_pipeline)
+    :param chunks: the chunk shape
+    :param dtype: dtype of the dataset
+    :return: read only array of shape chunks
+    """
+    data = raw
+    for i in reversed(range(len(pipeline))):
+        if filter_mask & (1 << i):
+            continue
+        if pipeline[i] == h5.h5z.FILTER_DEFLATE:
+            data = zlib.decompress(data)
+        elif dtype.itemsize > 1:  # shuffle: byte j of all elements is stored consecutively
+            shuffled = np.frombuffer(data, dtype=np.uint8)
+            data = np.ascontiguousarray(shuffled.reshape(dtype.itemsize, -1).T)
+    return np.frombuffer(data, dtype=dtype).reshape(chunks)
+
+
+def _chunk_parts(index, length, chunk):
+    """
+    Split the selection of one axis by chunks
+    :param index: slice or integer for this axis
+    :param length: length of the axis
+    :param chunk: chunk size of the axis
+    :return: dictionary first element of chunk -> (index into the result or None for integer
+            indices, index into the chunk)
+    """
+    if isinstance(index, numbers.Integral):
+        idx = index + length if index < 0 else index
+        if not 0 <= idx < length:
+            raise IndexError("index {} is out of range for axis with length {}".format(
+                index, length))
+        start = idx - idx % chunk
+        return {start: (None, idx - start)}
+    rows = range(*index.indices(length))
+    parts = {}
+    position = 0
+    while position < len(rows):
+        row = rows[position]
+        start = row - row % chunk
+        # the rows of one chunk are consecutive in the result (the selection is monotonic)
+        count = len(range(row, start + chunk if rows.step > 0 else start - 1, rows.step))
+        count = min(count, len(rows) - position)
+        stop = row - start + count * rows.step
+        parts[start] = (slice(position, position + count),
+                        slice(row - start, None if stop < 0 else stop, rows.step))
+        position += count
+    return parts
+
+
+class DecodedDataset(VirtualDataset):
+    """
+    A gzip compressed h5py Dataset whose chunks are decompressed in a thread pool.
+
+    Decompressed chunks are kept in a least recently used cache of cache_nbytes bytes (like the
+    HDF5 chunk cache, which is not used for chunks read with H5Dread_chunk). Scalar selections and
+    fancy indices are read by h5py.
+    """
+    def __init__(self, source, pool, cache_nbytes):
+        """
+        :param source: the h5py Dataset (see decodable)
+        :param pool: concurrent.futures.Executor to decode chunks in
+        :param cache_nbytes: size of the cache for decompressed chunks in bytes
+        """
+        super(DecodedDataset, self).__init__(source.dtype, source.attrs, source.name)
+        self._source = source
+        self._pool = pool
+        self._pipeline = filter_pipeline(source)
+        self.cache_nbytes = cache_nbytes
+        self._chunk_bytes = int(np.prod(source.chunks)) * source.dtype.itemsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def sources(self):
+        return (self._source,)
+
+    @property
+    def shape(self):
+        return tuple(self._source.shape)
+
+    @property
+    def chunks(self):
+        return self._source.chunks
+
+    def refresh(self):
+        super(DecodedDataset, self).refresh()
+        with self._lock:
+            self._cache.clear()  # the last chunks may have been incomplete
+
+    def _cached(self, offsets):
+        with self._lock:
+            chunk = self._cache.get(offsets)
+            if chunk is not None:
+                self._cache.move_to_end(offsets)
+            return chunk
+
+    def _decode(self, offsets, raw, filter_mask):
+        chunk = decode_chunk(raw, filter_mask, self._pipeline, self.chunks, self.dtype)
+        with self._lock:
+            self._cache[offsets] = chunk
+            while len(self._cache) * self._chunk_bytes > self.cache_nbytes and self._cache:
+                self._cache.popitem(last=False)
+        return chunk
+
+    def _read(self, key):
+        key = key + (slice(None),) * (self.ndim - len(key))
+        if all(isinstance(k, numbers.Integral) for k in key):
+            return self._source[key]
+        if not all(isinstance(k, (slice, numbers.Integral)) for k in key):
+            first, rest = key[0], key[1:]
+            if np.ndim(first) == 1 and all(isinstance(k, (slice, numbers.Integral))
+                                           for k in rest):
+                return take_rows(self._source, row_indices(first, len(self)), rest)
+            return self._source[key]
+        parts = [_chunk_parts(k, n, c) for k, n, c in zip(key, self.shape, self.chunks)]
+        shape = tuple(len(range(*k.indices(n))) for k, n in zip(key, self.shape)
+                      if isinstance(k, slice))
+        out = np.empty(shape, dtype=self.dtype)
+        missing = []
+        for offsets in itertools.product(*[sorted(p) for p in parts]):
+            selection = [p[o] for p, o in zip(parts, offsets)]
+            dest = tuple(d for d, _ in selection if d is not None)
+            src = tuple(s for _, s in selection)
+            chunk = self._cached(offsets)
+            if chunk is not None:
+                out[dest] = chunk[src]
+                continue
+            try:
+                filter_mask, raw = self._source.id.read_direct_chunk(offsets)
+            except RuntimeError:  # chunk not allocated (never written)
+                out[dest] = self._source.fillvalue
+                continue
+            missing.append((offsets, raw, filter_mask, dest, src))
+        if len(missing) == 1:  # decode in this thread, zlib releases the GIL anyway
+            offsets, raw, filter_mask, dest, src = missing[0]
+            out[dest] = self._decode(offsets, raw, filter_mask)[src]
+        elif missing:
+            decoded = self._pool.map(lambda m: self._decode(*m[:3]), missing)
+            for (_, _, _, dest, src), chunk in zip(missing, decoded):
+                out[dest] = chunk[src]
+        return out
@@ -4,12 +4,35 @@
 """
 
 import glob
+import os
+import posixpath
+import threading
+import warnings
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 import h5py as h5
 import numpy as np
+import tqdm
+
+from ..internals import config_options
+from .axes import axis_store
+from .backends import backend_for
+from .batch import normalize_rows, read_batch
+from .cache import dataset_cache
+from .chunkcache import ChunkCacheTuner
+from .catalog import Catalog, file_state
+from .decode import DecodedDataset, decodable
+from .handles import HandlePool
+from .integrity import scan_file
+from .shared import shared_array, shared_store, read_rows, require_shared_memory, \
+    shared_memory
+from .watch import Watcher
+from .virtual import VirtualDataset, OffsetDataset, ConcatDataset
 
 from .utils import InovesaVersion, version13_0, \
-    version9_1, DataNotInFile, version15_1, version14_1, calc_bl
+    DataNotInFile, version15_1, attr_from_unit, \
+    factor_from_attrs, UnitError
 
 
 class FileDataRegister(object):
@@ -95,9 +118,28 @@ class AxisSelector(object):
             "datagroup": "data"
         }
 
+        # short names used for range selections (see File.select)
+        self.short_names = {
+            "t": self.TIME,
+            "x": self.XAXIS,
+            "e": self.EAXIS,
+            "f": self.FAXIS
+        }
+
     def all_for(self, group):
         return self._specs[group]
 
+    def dims_for(self, group, axis=DATA):
+        """
+        Get the axes along the dimensions of a dataset in group.
+        :param group: the group (e.g. phase_space)
+        :param axis: the element in the group (default Axis.DATA)
+        :return: list of axes (e.g. [TIME, XAXIS, EAXIS] for phase_space data)
+        """
+        if axis in self._axis_datasets:
+            return [axis]
+        return [ax for ax in self.all_for(group) if ax in self._axis_datasets]
+
     def __call__(self, axis, group):
         if group not in self._specs:
             raise DataNotInFile("'{gr}' is not in a valid dataset".format(gr=group))
@@ -110,6 +152,21 @@ class AxisSelector(object):
 Axis = AxisSelector
 
 
+def _read_into(dataset, array):
+    """Read a whole dataset into array"""
+    if dataset.size > 0:
+        dataset.read_direct(array)
+
+
+def _uses_dataset(obj, name):
+    """Check if obj is the h5py Dataset name or a VirtualDataset computed from it"""
+    if isinstance(obj, h5.Dataset):
+        return obj.name == name
+    if isinstance(obj, VirtualDataset):
+        return any(_uses_dataset(source, name) for source in obj.sources)
+    return False
+
+
 class DataError(Exception):
     pass
 
@@ -174,7 +231,10 @@ class File(object):
     use additional parameters.
 
     If one parameter is supplied the data will be returned as HDF5.Dataset object or, if preloaded,
-    as AttributedNPArray.
+    as AttributedNPArray. Data corrected for bugs in old Inovesa versions is returned as
+    VirtualDataset (computed on access, see Lisa.data.virtual). Datasets stored contiguous and
+    without filters are returned as read only AttributedNPArray mapped directly from the file
+    (see use_mmap).
 
     If no or more than one parameter is supplied the data will be returned as DataContainer
     object containing the HDF5.Dataset or AttributedNPArray objects.
@@ -216,14 +276,29 @@ class File(object):
     depending on how much params were passed.
 
     """
-    def __init__(self, filename):
+    def __init__(self, filename, use_mmap=None, live=False, threads=None, pool=None,
+                 clamp_time=None):
         """
         Create File object
         :param filename: The filename of the Inovesa result file
+        :param use_mmap: Map contiguous, unfiltered datasets directly into memory instead of reading
+                them through h5py (None to use config option "use_mmap")
+        :param live: Open a file that is still written by Inovesa (SWMR mode). Use File.refresh
+                to get data that was appended since opening.
+        :param threads: Number of threads to decompress gzip compressed datasets with (0 to let
+                HDF5 decompress them, None to use config option "decode_threads"). See
+                Lisa.data.decode.
+        :param pool: HandlePool limiting the number of open files (see Lisa.data.handles). The
+                file is closed when others are used and reopened on next access.
+        :param clamp_time: Limit the time axis and time dependent data to the snapshots that
+                were written (e.g. of a crashed run, see Lisa.data.integrity). None to use config
+                option "clamp_time". Not used for live files.
         """
         self.filename = filename
-        self.file = h5.File(filename, 'r')
-        self._data = {}
+        self.live = live
+        self._pool = pool
+        self._init_state(use_mmap, threads, clamp_time=clamp_time)
+        self._h5file = self._open()
 
         try:
             self.version = InovesaVersion(*self.file.get("Info").get("Inovesa_v"))
@@ -231,32 +306,160 @@ class File(object):
             self.version = InovesaVersion(*self.file.get("Info").get("INOVESA_v"))
 
         self.select_axis = AxisSelector(self.version)
+        self._backend = backend_for(self.version)  # layout of this Inovesa version
+        self._met2gr = self._backend.groups
+        if pool is not None:
+            pool.opened(self)
 
-        self._met2gr = {
-            "energy_spread": "EnergySpread",
-            "bunch_length": "BunchLength",
-            "bunch_position": "BunchPosition",
-            "bunch_population": "BunchPopulation",
-            "bunch_profile": "BunchProfile",
-            "csr_intensity": "CSR/Intensity",
-            "csr_spectrum": "CSR/Spectrum",
-            "energy_profile": "EnergyProfile",
-            "impedance": "Impedance",
-            "particles": "Particles",
-            "phase_space": "PhaseSpace",
-            "wake_potential": "WakePotential",
-            "parameters": "Info/Parameters"
-        }
-        if self.version > version13_0:
-            self._met2gr.update({"source_map": "SourceMap"})
+    def _init_state(self, use_mmap, threads, chunk_cache_sizes=None, clamp_time=None):
+        """
+        Set up options and (empty) containers of opened objects, see File.__init__
+        """
+        # File objects can be used from several threads, this guards the handles and containers
+        self._lock = threading.RLock()
+        self._threads = config_options.get("decode_threads") if threads is None else threads
+        self._decode_pool = ThreadPoolExecutor(self._threads) if self._threads > 0 else None
+        self._data = {}
+        self._h5_objects = {}
+        self._chunk_cache_tuners = {}
+        # chunk cache sizes learned before pickling, used when the datasets are opened
+        self._chunk_cache_sizes = {} if chunk_cache_sizes is None else chunk_cache_sizes
+        self._generation = 0  # incremented whenever handles are dropped (see Data.accessor)
+        self._axes = {}  # shared axis arrays, see File._axis
+        self._mmaps = []  # weak references to the memory maps (one file descriptor each)
+        self._clamp_time = (config_options.get("clamp_time") if clamp_time is None
+                            else clamp_time) and not self.live
+        self._extent = None  # valid extent of the time dependent data, see File._clamp
+        self._clamped = {}  # (what, elem) -> (dataset, clamped dataset)
+        if self.live:
+            self._use_mmap = False  # shapes change while the file is written
+            # the file changes on disk, cached data is extended by File.refresh
+            self._cache_key = (os.path.realpath(self.filename), "live")
+        else:
+            self._use_mmap = config_options.get("use_mmap") if use_mmap is None else use_mmap
+            stat = os.stat(self.filename)
+            # identifies this file (and its state on disk) in the process wide dataset cache
+            self._cache_key = (os.path.realpath(self.filename), stat.st_mtime, stat.st_size)
+        # preloaded data is shared with other processes (not for live files, they change)
+        self._shared = config_options.get("use_shared_store") and not self.live and \
+            shared_store.available
+        if config_options.get("use_shared_store") and not self.live:
+            require_shared_memory("The config option use_shared_store")
+
+    def _open(self):
+        """Open the h5 file"""
+        if self.live:
+            return h5.File(self.filename, 'r', libver='latest', swmr=True)
+        return h5.File(self.filename, 'r')
+
+    @classmethod
+    def concat(cls, files, time_offsets=None):
+        """
+        Join continuation runs of one simulation into a single File without copying data.
+        See StitchedFile.
+        :param files: filenames or File objects in the order of the runs
+        :param time_offsets: offsets added to the time axis of each file (in Inovesa units, None
+                or None entries to detect them)
+        :return: StitchedFile
+        """
+        return StitchedFile(files, time_offsets)
+
+    @classmethod
+    def deferred(cls, filename, version, pool=None):
+        """
+        Create a File object without opening the file. It is opened on first access.
+        :param filename: The filename of the Inovesa result file
+        :param version: the InovesaVersion of the file (e.g. from a Lisa.data.catalog.Catalog)
+        :param pool: HandlePool limiting the number of open files (see File.__init__)
+        """
+        obj = cls.__new__(cls)
+        obj.__setstate__({"filename": filename, "live": False, "use_mmap": None,
+                          "threads": None, "version": version, "chunk_cache_sizes": {},
+                          "clamp_time": None})
+        obj._pool = pool
+        return obj
+
+    @property
+    def file(self):
+        """
+        The h5py File (opened on first access for unpickled, deferred or closed File objects)
+        """
+        opened = False
+        if self._h5file is None:
+            with self._lock:
+                if self._h5file is None:
+                    self._h5file = self._open()
+                    opened = True
+        if self._pool is not None:  # outside of the lock, the pool closes other files
+            if opened:
+                self._pool.opened(self)
+            else:
+                self._pool.touch(self)
+        return self._h5file
+
+    @property
+    def closed(self):
+        """True if the h5 file is not open (it is opened again on next access)"""
+        return self._h5file is None
+
+    @property
+    def descriptors(self):
+        """
+        Number of file descriptors used: one for the open h5 file and one per memory mapped
+        dataset that is still in use (see File._memmap)
+        """
+        # no lock, called by HandlePool while other files hold theirs
+        return (self._h5file is not None) + sum(ref() is not None for ref in list(self._mmaps))
+
+    def close(self):
+        """
+        Close the h5 file. Datasets returned so far can not be used anymore (except preloaded
+        and memory mapped ones). The file is opened again if data is accessed afterwards.
+        Memory maps are unmapped (and their file descriptors closed) as soon as no array
+        returned so far uses them anymore.
+        """
+        with self._lock:
+            self._data = {}
+            self._h5_objects = {}
+            self._clamped = {}
+            self._mmaps = []  # maps still used outside are not counted by the pool anymore
+            self._generation += 1
+            if self._h5file is not None:
+                self._h5file.close()
+                self._h5file = None
+        if self._pool is not None:
+            self._pool.closed(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
-        if self.version == version9_1:
-            self._met2gr.update({"csr_intensity": "CSRPower"})
-            self._met2gr.update({"csr_spectrum": "CSRSpectrum"})
-            self._met2gr.update({"bunch_population": "BunchCurrent"})
-            del self._met2gr["particles"]
-            del self._met2gr["parameters"]
-            del self._met2gr["energy_profile"]
+    def __getstate__(self):
+        """
+        File objects are pickled as a description of the file: filename, mode, options and the
+        chunk cache sizes learned so far. Unpickled objects (e.g. in worker processes of a
+        ProcessPoolExecutor) open the h5 file on first access. Preloaded data is not transferred.
+        """
+        with self._lock:
+            sizes = dict(self._chunk_cache_sizes)
+            sizes.update((name, tuner.nbytes) for name, tuner in self._chunk_cache_tuners.items())
+        return {"filename": self.filename, "live": self.live, "use_mmap": self._use_mmap,
+                "threads": self._threads, "version": self.version,
+                "chunk_cache_sizes": sizes, "clamp_time": self._clamp_time}
+
+    def __setstate__(self, state):
+        self.filename = state["filename"]
+        self.live = state["live"]
+        self._init_state(state["use_mmap"], state["threads"], state["chunk_cache_sizes"],
+                         state.get("clamp_time"))
+        self._h5file = None
+        self._pool = None  # handle pools are not shared between processes
+        self.version = state["version"]
+        self.select_axis = AxisSelector(self.version)
+        self._backend = backend_for(self.version)
+        self._met2gr = self._backend.groups
 
     def _read_from_cfg(self, what):
         try:
@@ -267,81 +470,657 @@ class File(object):
         except FileNotFoundError:
             return None
 
-    def _get_dict(self, what, list_of_elements):
+    def _memmap(self, dataset):
+        """
+        Map a dataset directly from the file if it is stored contiguous and without filters.
+        :param dataset: the h5py Dataset
+        :return: read only AttributedNPArray backed by numpy.memmap or None if not possible
+        """
+        if dataset.chunks is not None or dataset.external or dataset.size == 0 or \
+                dataset.dtype.kind not in "biufc" or self.file.userblock_size != 0 or \
+                self.file.driver not in ("sec2", "stdio"):
+            return None
+        offset = dataset.id.get_offset()
+        if offset is None:  # storage not allocated
+            return None
+        mapped = np.memmap(self.filename, dtype=dataset.dtype, mode='r', offset=offset,
+                           shape=dataset.shape)
+        # counted by the HandlePool on the next access, see File.descriptors
+        self._mmaps = [ref for ref in self._mmaps if ref() is not None] + [weakref.ref(mapped)]
+        return AttributedNPArray(mapped, dataset.attrs, dataset.name)
+
+    def _open_dataset(self, dataset):
+        """
+        Get the object to use for dataset. This is either a memory mapped AttributedNPArray
+        (for contiguous datasets, see File._memmap), a DecodedDataset (for gzip compressed
+        datasets if threads are used for decompression) or the h5py Dataset itself.
+        :param dataset: the h5py Dataset
+        """
+        if self._use_mmap and isinstance(dataset, h5.Dataset):
+            mapped = self._memmap(dataset)
+            if mapped is not None:
+                return mapped
+        if self._decode_pool is not None and decodable(dataset):
+            tuner = self._chunk_cache_tuners.get(dataset.name)
+            nbytes = tuner.nbytes if tuner is not None else \
+                self.file.id.get_access_plist().get_cache()[2]
+            return DecodedDataset(dataset, self._decode_pool, nbytes)
+        return dataset
+
+    def _axis(self, obj, transform=None):
+        """
+        Get the axis values of an axis dataset. Each axis is read once per file and shared by all
+        groups (and with other files with identical axes, see Lisa.data.axes).
+        :param obj: the h5py Dataset of the axis
+        :param transform: None, "[1:]" or "[0]" (Inovesa 0.9.1 saved axes per group with an
+                additional first entry/row)
+        :return: read only AttributedNPArray (h5py Dataset for live files without transform)
+        """
+        with self._lock:
+            key = (obj.name, transform)
+            axis = self._axes.get(key)
+            if axis is not None:
+                return axis
+            if transform is None:
+                if self.live:  # grows while the file is written, see File.refresh
+                    return self._open_dataset(obj)
+                values = obj[()]
+            else:
+                values = obj[1:] if transform == "[1:]" else obj[0]
+            axis = AttributedNPArray(values, dict(obj.attrs), obj.name)
+            if not self.live:
+                axis = self._axes[key] = axis_store.share(axis)
+            return axis
+
+    def _axis_converted(self, axis, factor, dtype):
+        """
+        Get the values of a shared axis (see File._axis) converted to a unit.
+        Conversions are cached per (axis, factor, dtype).
+        :return: read only AttributedNPArray
+        """
+        with self._lock:
+            key = (axis.axis_key, repr(factor), np.dtype(dtype).str)
+            converted = self._axes.get(key)
+            if converted is None:
+                converted = self._axes[key] = axis_store.converted(axis, factor, dtype)
+            return converted
+
+    def _h5_object(self, group, name):
+        """
+        Get an object from the h5 file. Every object is opened only once per File object
+        (refreshing a dataset in SWMR mode is unreliable if it is open multiple times).
+        :param group: the h5 group
+        :param name: the name of the object (relative to group or absolute)
+        """
+        path = posixpath.join(group.name, name)
+        obj = self._h5_objects.get(path)
+        if obj is None:
+            obj = group.get(name)
+            if isinstance(obj, h5.Dataset) and obj.chunks is not None and \
+                    config_options.get("chunk_cache_tuning"):
+                tuner = self._chunk_cache_tuners.get(obj.name)
+                if tuner is None:
+                    tuner = ChunkCacheTuner(obj.shape, obj.chunks, obj.dtype.itemsize,
+                                            self.file.id.get_access_plist().get_cache()[2],
+                                            config_options.get("chunk_cache_max"))
+                    tuner.nbytes = self._chunk_cache_sizes.get(obj.name, tuner.nbytes)
+                    self._chunk_cache_tuners[obj.name] = tuner
+                dataset_name = obj.name
+                del obj  # the chunk cache can only be set if the dataset is not open
+                dapl = h5.h5p.create(h5.h5p.DATASET_ACCESS)
+                dapl.set_chunk_cache(tuner.nslots, tuner.nbytes, tuner.w0)
+                obj = h5.Dataset(h5.h5d.open(self.file.id, dataset_name.encode(), dapl=dapl),
+                                 readonly=True)  # lets h5py cache its selection readers
+                # still open elsewhere (e.g. by a reference held by the user): old cache is used
+                tuner.nbytes = obj.id.get_access_plist().get_chunk_cache()[1]
+            self._h5_objects[path] = obj
+        return obj
+
+    def _record_selection(self, what, axis, key):
+        """
+        Record a selection read from a dataset for chunk cache tuning. If the chunk cache of the
+        dataset is thrashing it is reopened with a larger cache.
+        :param what: the group (e.g. phase_space)
+        :param axis: the Axis object to select the dataset
+        :param key: the selection
+        """
+        record = self._selection_recorder(what, axis)
+        if record is not None:
+            record(key)
+
+    def _selection_recorder(self, what, axis):
+        """
+        Get a function recording selections read from one dataset (see File._record_selection).
+        Dataset and chunk cache tuner are resolved once, use this for many reads of the same
+        dataset (see Data.accessor).
+        :param what: the group (e.g. phase_space)
+        :param axis: the Axis object to select the dataset
+        :return: function taking the selection or None if the dataset is not tuned
+        """
+        if axis is None:
+            return None
+        with self._lock:
+            dataset = self._group_dict(what, [axis])[0][axis]
+            if not isinstance(dataset, (h5.Dataset, DecodedDataset)):
+                return None
+            name = dataset.name
+            tuner = self._chunk_cache_tuners.get(name)
+            # decoded datasets keep their own cache of decoded chunks, h5py datasets are reopened
+            decoded = dataset if isinstance(dataset, DecodedDataset) else None
+            del dataset  # no handle is kept, it has to be closed to be reopened
+        if tuner is None:
+            return None
+
+        def record(key):
+            with self._lock:
+                nbytes = tuner.record(key)
+                if nbytes is None:
+                    return
+                tuner.resize(nbytes)
+                if decoded is not None:
+                    decoded.cache_nbytes = nbytes
+                    return
+                # drop the handles of this dataset, it is reopened with the new chunk cache on
+                # next access (other groups and preloaded arrays are kept)
+                self._h5_objects = {path: obj for path, obj in self._h5_objects.items()
+                                    if obj.name != name}
+                for dg in self._data.values():
+                    for elem in [elem for elem, obj in dg.items() if _uses_dataset(obj, name)]:
+                        del dg[elem]
+                self._clamped = {key: value for key, value in self._clamped.items()
+                                 if not _uses_dataset(value[0], name)}
+                self._generation += 1
+        return record
+
+    def chunk_cache_info(self):
+        """
+        Get the chunk cache settings and estimated hit statistics of the chunked datasets used so
+        far. Chunk caches are sized from the chunk shape when a dataset is opened and enlarged if
+        recorded reads (File.select, Data.select and Data with sub_idx) re-read evicted chunks.
+        :return: dictionary h5 name -> {chunks, chunk_bytes, nbytes, nslots, w0, hits, misses,
+                hit_rate, reopens}
+        """
+        return {name: tuner.info() for name, tuner in self._chunk_cache_tuners.items()}
+
+    def _group_dict(self, what, list_of_elements):
         """
         Will get the group "group" from the hdf5 file and save it to self._data[what]
         :param what: what to get (e.g. bunch_profile)
         :param list_of_elements: list of axes
+        :return: the data group container dictionary and the list of requested elements
         """
-        group = self._met2gr.get(what, None)  # get the h5group name
-        if not group:
-            if what in self._met2gr.values():  # if directly the h5group name was specified
-                group = what
-                # inverse to always have what as correct specifier
-                what = {v: k for k, v in self._met2gr.items()}[group]
-            else:
-                raise DataNotInFile("'{}' does not exist in file.".format(what))
-        dg = self._data.setdefault(group, {})  # data group container dictionary
-        # if no elements or None passed get all
-        if len(list_of_elements) == 0 or \
-                (len(list_of_elements) == 1 and list_of_elements[0] is None):
-            list_of_elements = self.select_axis.all_for(what)
-        # check what elements have to be loaded from disk (no real load)
-        set_of_new_elements = set(list_of_elements) - set(dg.keys())  # filter might be faster
-        if len(set_of_new_elements) != 0:  # if new elements are requested
-            gr = self.file.get(group)  # the h5data group
-            for elem in set_of_new_elements:
-                ax = self.select_axis(elem, what)  # get the axis name for the specified one
-                if self.version == version9_1:
-                    if elem == Axis.TIME:
-                        dg[elem] = AttributedNPArray(gr.get(ax)[1:],
-                                                     gr.get(ax).attrs, gr.get(ax).name)
-                    elif elem == Axis.DATA and Axis.TIME in self.select_axis.all_for(what):
-                        if what == "bunch_length":
-                            dg[elem] = dg[elem] = AttributedNPArray(np.sqrt(gr.get(ax)[1:]),
-                                                                    gr.get(ax).attrs,
-                                                                    gr.get(ax).name)
-                        else:
-                            dg[elem] = dg[elem] = AttributedNPArray(gr.get(ax)[1:],
-                                                                    gr.get(ax).attrs,
-                                                                    gr.get(ax).name)
-                    elif elem == Axis.XAXIS or elem == Axis.EAXIS or elem == Axis.FAXIS:
-                        dg[elem] = dg[elem] = AttributedNPArray(gr.get(ax)[0], gr.get(ax).attrs,
-                                                                gr.get(ax).name)
-                    else:
-                        dg[elem] = gr.get(ax)
-                elif self.version < version14_1:
-                    # fix bunch_length sqrt bug: Inovesa bug 24
-                    if elem == Axis.DATA and what == "bunch_length":
-                        dg[elem] = AttributedNPArray(np.sqrt(gr.get(ax)), gr.get(ax).attrs,
-                                                     gr.get(ax).name)
-                    else:
-                        dg[elem] = gr.get(ax)
-                elif self.version < (0, 15, -2):  # fix bunch_length sqrt bug: Inovesa bug 24
-                    if elem == Axis.DATA and what == "bunch_length":
-                        dg[elem] = AttributedNPArray(calc_bl(self.bunch_profile(Axis.XAXIS),
-                                                             self.bunch_profile(Axis.DATA)),
-                                                     gr.get(ax).attrs, gr.get(ax).name)
-                    else:
-                        dg[elem] = gr.get(ax)
+        with self._lock:
+            group = self._met2gr.get(what, None)  # get the h5group name
+            if not group:
+                if what in self._met2gr.values():  # if directly the h5group name was specified
+                    group = what
+                    # inverse to always have what as correct specifier
+                    what = {v: k for k, v in self._met2gr.items()}[group]
                 else:
-                    dg[elem] = gr.get(ax)
-        return DataContainer(dg, list_of_elements)
+                    raise DataNotInFile("'{}' does not exist in file.".format(what))
+            dg = self._data.setdefault(group, {})  # data group container dictionary
+            # if no elements or None passed get all
+            if len(list_of_elements) == 0 or \
+                    (len(list_of_elements) == 1 and list_of_elements[0] is None):
+                list_of_elements = self.select_axis.all_for(what)
+            # check what elements have to be loaded from disk (no real load)
+            set_of_new_elements = set(list_of_elements) - set(dg.keys())  # filter might be faster
+            if len(set_of_new_elements) != 0:  # if new elements are requested
+                gr = self.file.get(group)  # the h5data group
+                if gr is None:  # e.g. not written to a file created with Lisa.reduce
+                    raise DataNotInFile("'{}' does not exist in file.".format(what))
+                for elem in set_of_new_elements:
+                    ax = self.select_axis(elem, what)  # get the axis name for the specified one
+                    obj = self._h5_object(gr, ax)
+                    if elem in (Axis.TIME, Axis.XAXIS, Axis.EAXIS, Axis.FAXIS):
+                        dg[elem] = self._backend.axis(self, elem, obj)
+                    else:
+                        dg[elem] = self._backend.dataset(self, what, elem, obj)
+            return dg, list_of_elements
+
+    def _get_dict(self, what, list_of_elements):
+        """
+        Get the DataContainer (or single element) for the elements of group what.
+        Datasets that are preloaded in the dataset cache are returned as AttributedNPArray.
+        :param what: what to get (e.g. bunch_profile)
+        :param list_of_elements: list of axes
+        """
+        dg, list_of_elements = self._group_dict(what, list_of_elements)
+        data = {}
+        for elem in list_of_elements:
+            data[elem] = dg[elem]
+            if isinstance(dg[elem], (h5.Dataset, VirtualDataset)):
+                cached = dataset_cache.get((self._cache_key, dg[elem].name))
+                if cached is None and self._shared:
+                    cached = self._attach_shared(dg[elem])
+                if cached is not None:
+                    data[elem] = cached
+            if self._clamp_time:
+                data[elem] = self._clamp(what, elem, data[elem])
+        return DataContainer(data, list_of_elements)
+
+    def _clamp(self, what, elem, obj):
+        """
+        Limit time dependent data to the snapshots that were written (see File(clamp_time=True)).
+        The time axis and datasets as long as it are limited to the number of time steps written
+        to all of them (groups without any data are not taken into account, see
+        Lisa.data.integrity.scan_file), other datasets to their own valid extent.
+        :param what: the group (e.g. bunch_profile)
+        :param elem: the element in the group (e.g. Axis.DATA)
+        :param obj: the dataset, array or axis returned for it
+        :return: obj or a view on its valid part
+        """
+        if what not in self._met2gr:  # the h5 group name was given
+            what = {v: k for k, v in self._met2gr.items()}[what]
+        dims = self.select_axis.dims_for(what, elem)
+        if not dims or dims[0] != Axis.TIME:
+            return obj
+        with self._lock:
+            if self._extent is None:
+                self._extent = scan_file(self, check_finite=False)
+            if elem == Axis.TIME or len(obj) == self._extent["time"]:
+                stop = self._extent["valid"]
+            else:
+                group = self._extent["groups"].get(what, {})
+                stop = len(obj) if group.get("empty") else group.get("valid", len(obj))
+            if stop >= len(obj):
+                return obj
+            cached = self._clamped.get((what, elem))
+            if cached is not None and cached[0] is obj:
+                return cached[1]
+            if isinstance(obj, np.ndarray):
+                clamped = obj[:stop]
+            else:
+                clamped = OffsetDataset(obj, 0, stop)
+            self._clamped[(what, elem)] = (obj, clamped)
+            return clamped
+
+    def _attach_shared(self, dataset):
+        """
+        Use a dataset preloaded by another process (see Lisa.data.shared.SharedStore) and add it
+        to the dataset cache.
+        :param dataset: the h5py Dataset or VirtualDataset
+        :return: read only AttributedNPArray or None if no process published the dataset
+        """
+        key = (self._cache_key, dataset.name)
+        array = shared_store.get(key, dataset.shape, dataset.dtype)
+        if array is None:
+            return None
+        array = AttributedNPArray(array, dict(dataset.attrs), dataset.name)
+        dataset_cache.put(key, array)
+        return array
+
+    def refresh(self):
+        """
+        Get data appended to a file that is still written (only for files opened with live=True).
+
+        Datasets are refreshed, so their shapes include the new time steps. Preloaded data is
+        extended by reading only the new part. Axes of Inovesa 0.9.1 files (copied without their
+        first entry/row, see Lisa.data.backends) are dropped and read again on next access.
+        :return: dictionary h5 name -> (old length, new length) of datasets that grew
+        """
+        with self._lock:
+            if not self.live:
+                raise DataError("File.refresh is only possible for files opened with live=True.")
+            objects = []
+            for dg in self._data.values():
+                for elem, obj in list(dg.items()):
+                    if isinstance(obj, (h5.Dataset, VirtualDataset)):
+                        objects.append((obj, len(obj) if obj.ndim > 0 else None))
+                    elif isinstance(obj, AttributedNPArray):
+                        del dg[elem]  # copied axes (Inovesa 0.9.1), rebuilt on access
+            self._generation += 1
+            # refresh all first, virtual datasets also refresh their sources
+            for obj, _ in objects:
+                obj.refresh()
+            grown = {obj.name: (old, len(obj)) for obj, old in objects
+                     if old is not None and len(obj) != old}
+            objects = {obj.name: obj for obj, _ in objects}
+            for key, cached in dataset_cache.items(self._cache_key):
+                obj = objects.get(key[1])
+                if obj is None:  # not used by this object, cannot be extended
+                    dataset_cache.discard(key)
+                elif cached.ndim > 0 and len(obj) > len(cached):
+                    extended = np.empty(obj.shape, dtype=cached.dtype)
+                    extended[:len(cached)] = cached
+                    extended[len(cached):] = obj[len(cached):]
+                    if not dataset_cache.put(key, AttributedNPArray(extended, cached.attrs,
+                                                                    cached.name)):
+                        dataset_cache.discard(key)  # does not fit anymore, read from disk
+            return grown
+
+    def _axis_factor(self, what, axis, unit):
+        """
+        Get the factor to convert values of axis in group what to unit
+        :return: the factor or None if unit is the Inovesa unit of that axis (e.g. "ts")
+        """
+        conversion_attribute = attr_from_unit(unit, self.version)
+        if conversion_attribute is None:
+            return None
+        factor = factor_from_attrs(getattr(self, what)(axis).attrs, conversion_attribute)
+        if factor is None:
+            raise UnitError(unit + " is not a valid unit for this axis.")
+        return factor
+
+    def index_range(self, what, axis, lower=None, upper=None, unit=None):
+        """
+        Convert a range on an axis of a group to a range of indices. Only the axis values are read.
+        :param what: the group (e.g. phase_space)
+        :param axis: the axis to use (e.g. Axis.TIME)
+        :param lower: the lower bound (inclusive), None for no lower bound
+        :param upper: the upper bound (inclusive), None for no upper bound
+        :param unit: the unit of lower and upper (None for Inovesa units)
+        :return: slice object selecting all indices with values between lower and upper
+        """
+        values = np.asarray(getattr(self, what)(axis))
+        factor = self._axis_factor(what, axis, unit)
+        if factor is not None:
+            values = values * factor
+        mask = np.ones(values.shape, dtype=bool)
+        if lower is not None:
+            mask &= values >= lower
+        if upper is not None:
+            mask &= values <= upper
+        indices = np.flatnonzero(mask)
+        if len(indices) == 0:
+            return slice(0, 0)
+        return slice(int(indices[0]), int(indices[-1]) + 1)
+
+    def selection(self, what, axis=Axis.DATA, **ranges):
+        """
+        Build the index tuple for a selection on the dataset axis of group what.
+        See File.select for the format of ranges.
+        :return: tuple usable to index the dataset
+        """
+        dims = self.select_axis.dims_for(what, axis)
+        key = [slice(None)] * len(dims)
+        for name, rng in ranges.items():
+            dim = self.select_axis.short_names.get(name, name)
+            if dim not in dims:
+                raise DataNotInFile("'{ax}' is not an axis of '{ax_of}' in '{gr}'".format(
+                    ax=name, ax_of=axis, gr=what))
+            if isinstance(rng, (slice, int, np.integer)):
+                key[dims.index(dim)] = rng
+            elif isinstance(rng, (tuple, list)) and len(rng) in (2, 3):
+                key[dims.index(dim)] = self.index_range(what, dim, *rng)
+            else:
+                raise DataError("Range for '{}' has to be a slice, an index or a tuple "
+                                "(lower, upper[, unit])".format(name))
+        return tuple(key)
+
+    def select(self, what, axis=Axis.DATA, **ranges):
+        """
+        Read only a hyperslab of a dataset. Ranges are given per axis with the keywords
+        t (Axis.TIME), x (Axis.XAXIS), e (Axis.EAXIS) and f (Axis.FAXIS) as either
+
+            - a tuple (lower, upper) in Inovesa units
+            - a tuple (lower, upper, unit) in the given unit (e.g. "ts", "s", "ev")
+            - a slice or an index
+
+        ::
+
+            f = File("path/to/file")
+            ps = f.select("phase_space", t=(200, 260, "ts"), x=(-20e-12, 20e-12, "s"),
+                          e=(-5e6, 5e6, "ev"))
+
+        :param what: the group (e.g. phase_space)
+        :param axis: the dataset in the group (default Axis.DATA)
+        :return: AttributedNPArray with the selected data
+        """
+        key = self.selection(what, axis, **ranges)
+        self._record_selection(what, axis, key)
+        data = getattr(self, what)(axis)
+        return AttributedNPArray(data[key], data.attrs, data.name)
+
+    def take(self, what, indices, axis=Axis.DATA, out=None, **ranges):
+        """
+        Read the snapshots at scattered or strided time indices with as few HDF5 reads as
+        possible (see Lisa.data.batch). Indices are sorted and coalesced into strided hyperslabs
+        and chunk spans, the result is in the order of indices.
+
+        ::
+
+            f = File("path/to/file")
+            every_50th = f.take("phase_space", slice(None, None, 50))
+            bursts = f.take("csr_spectrum", [1200, 80, 3415], f=(0, 1e12, "hz"))
+
+        :param what: the group (e.g. phase_space)
+        :param indices: time indices as list/array (negative counts from the end), boolean mask,
+                range or slice
+        :param axis: the dataset in the group (default Axis.DATA, first axis has to be time)
+        :param out: array to read into (None to allocate a new one)
+        :param ranges: ranges of the other axes (see File.select)
+        :return: AttributedNPArray with one snapshot per index (out if given)
+        """
+        dims = self.select_axis.dims_for(what, axis)
+        if not dims or dims[0] != Axis.TIME:
+            raise DataError("The first axis of '{}' ({}) is not the time axis.".format(what,
+                                                                                    axis))
+        if "t" in ranges or Axis.TIME in ranges:
+            raise DataError("Time indices are given by indices, not as range.")
+        rest = self.selection(what, axis, **ranges)[1:]
+        data = getattr(self, what)(axis)
+        rows = normalize_rows(indices, len(data))
+        if isinstance(data, (h5.Dataset, DecodedDataset)):
+            result = read_batch(data, rows, rest, out,
+                                lambda key: self._record_selection(what, axis, key))
+        else:  # in memory or virtual, reads arbitrary rows at once
+            selected = data[(rows,) + rest] if len(rows) else data[(slice(0, 0),) + rest]
+            if out is None:
+                result = np.asarray(selected)
+            else:
+                out[...] = selected
+                result = out
+        return result if out is not None else AttributedNPArray(result, data.attrs, data.name)
+
+    def time_batch(self, what, axis=Axis.DATA, batch=None):
+        """
+        Get the number of snapshots per block for File.iter_time. Batches are multiples of the
+        number of snapshots per HDF5 chunk (default: whole chunks for about 1 MiB).
+        :param what: the group (e.g. phase_space)
+        :param axis: the Axis object to select the dataset
+        :param batch: requested number of snapshots (None for default)
+        """
+        data = getattr(self, what)(axis)
+        chunks = getattr(data, 'chunks', None)
+        chunk_rows = chunks[0] if chunks else 1
+        if batch is None:
+            row_bytes = data.dtype.itemsize * int(np.prod(data.shape[1:]))
+            batch = 2 ** 20 // max(row_bytes, 1)
+        return max(chunk_rows, -(-batch // chunk_rows) * chunk_rows)
+
+    def iter_time(self, what, batch=None, axis=Axis.DATA, factor=None, dtype=None):
+        """
+        Iterate over a group in blocks of snapshots without loading the whole dataset.
+
+        ::
+
+            for times, ps in f.iter_time("phase_space", batch=100):
+                mean += ps.sum(axis=0)
+
+        Blocks are aligned to the HDF5 chunks of the dataset (see File.time_batch). All blocks are
+        read into the same buffer, so a block is overwritten by the next one. Copy blocks that
+        should be kept.
+        :param what: the group (e.g. phase_space)
+        :param batch: number of snapshots per block (None for default)
+        :param axis: the Axis object to select the dataset (first dimension has to be time)
+        :param factor: multiply data with this factor (in place, data is converted to float64)
+        :param dtype: dtype of the blocks (None for the dataset dtype, float64 if factor is given)
+        :return: generator yielding (time values, data block)
+        """
+        if Axis.TIME not in self.select_axis.all_for(what):
+            raise DataError("'{}' has no time axis.".format(what))
+        data = getattr(self, what)(axis)
+        times = np.asarray(getattr(self, what)(Axis.TIME))
+        batch = self.time_batch(what, axis, batch)
+        length = min(len(data), len(times))
+        if dtype is None:
+            dtype = data.dtype if factor is None else np.float64
+        buffer = np.empty((min(batch, length),) + tuple(data.shape[1:]), dtype=dtype)
+        for start in range(0, length, batch):
+            stop = min(start + batch, length)
+            block = buffer[:stop - start]
+            if hasattr(data, 'read_direct'):
+                data.read_direct(block, np.s_[start:stop], np.s_[:stop - start])
+            else:
+                block[...] = data[start:stop]
+            if factor is not None:
+                np.multiply(block, factor, out=block)
+            yield times[start:stop], block
 
     def preload_full(self, what, axis=None):
         """
-        Preload Data into memory. This will speed up recurring reads by a lot
+        Preload Data into memory. This will speed up recurring reads by a lot.
+
+        Preloaded data is kept in the process wide dataset cache (Lisa.data.cache.dataset_cache)
+        which is shared by all File objects and limited to a byte budget (config option
+        "cache_budget"). Least recently used data is evicted from the cache when the budget is
+        exceeded. Datasets larger than the budget are not preloaded and are read from disk.
+        :param what: the group to preload (e.g. phase_space)
+        :param axis: the axis to preload (None for all axes of the group)
+        :return: True if all requested datasets are preloaded, False otherwise
+        """
+        dg, list_of_elements = self._group_dict(what, [axis])
+        complete = True
+        for elem in list_of_elements:
+            dataset = dg[elem]
+            if not isinstance(dataset, (h5.Dataset, VirtualDataset)):  # already in memory
+                continue
+            key = (self._cache_key, dataset.name)
+            if key in dataset_cache:
+                continue
+            nbytes = dataset.size * dataset.dtype.itemsize
+            if not dataset_cache.fits(nbytes):
+                warnings.warn("Not preloading '{ds}' ({nb} bytes), it exceeds the dataset cache "
+                              "budget of {bud} bytes. Data is read from disk.".format(
+                                ds=dataset.name, nb=nbytes, bud=dataset_cache.budget))
+                complete = False
+                continue
+            if self._shared:  # read by the first process, other processes attach to it
+                array = shared_store.load(key, dataset.shape, dataset.dtype,
+                                          lambda target: _read_into(dataset, target))
+            else:
+                array = np.empty(dataset.shape, dtype=dataset.dtype)
+                _read_into(dataset, array)
+            dataset_cache.put(key, AttributedNPArray(array, dict(dataset.attrs), dataset.name))
+        return complete
+
+    def preload_all(self, workers=None, max_bytes=None, progress=True):
+        """
+        Preload all datasets of all groups into memory. Chunks are decompressed in parallel by a
+        pool of worker processes that write directly into shared memory. The shared memory is
+        used as buffer of the preloaded arrays without copying.
+
+        Preloaded data is kept in the dataset cache (see File.preload_full). Datasets that are
+        stored contiguous are memory mapped already and not preloaded.
+        :param workers: number of worker processes (None for the number of cpus, 0 to read in
+                this process). Worker processes need Python 3.8 (shared memory), with older
+                versions None reads in this process.
+        :param max_bytes: memory ceiling for the preloaded data (None for the dataset cache budget).
+                Datasets that do not fit are not preloaded.
+        :param progress: show a progress bar
+        :return: True if all datasets are preloaded, False otherwise
         """
+        if max_bytes is None:
+            max_bytes = dataset_cache.budget
+        max_bytes = min(max_bytes, dataset_cache.budget)
+        datasets = {}
+        for what in self._met2gr:
+            if what == "parameters":
+                continue
+            dg, list_of_elements = self._group_dict(what, [])
+            for elem in list_of_elements:
+                dataset = dg[elem]
+                if isinstance(dataset, (h5.Dataset, VirtualDataset)) and \
+                        (self._cache_key, dataset.name) not in dataset_cache:
+                    if self._shared and self._attach_shared(dataset) is not None:
+                        continue  # preloaded by another process
+                    datasets[dataset.name] = dataset
+
+        complete = True
+        used = 0
+        selected = []
+        for dataset in sorted(datasets.values(), key=lambda d: d.size * d.dtype.itemsize):
+            nbytes = dataset.size * dataset.dtype.itemsize
+            if used + nbytes > max_bytes:
+                warnings.warn("Not preloading '{ds}' ({nb} bytes), it exceeds the memory ceiling "
+                              "of {mb} bytes. Data is read from disk.".format(
+                                ds=dataset.name, nb=nbytes, mb=max_bytes))
+                complete = False
+                continue
+            used += nbytes
+            selected.append(dataset)
+
+        # virtual datasets are computed from other datasets in this process
+        virtual = [d for d in selected if isinstance(d, VirtualDataset) and
+                   not isinstance(d, DecodedDataset)]
+        # worker processes decompress on their own
+        selected = [d.sources[0] if isinstance(d, DecodedDataset) else d for d in selected
+                    if isinstance(d, (h5.Dataset, DecodedDataset))]
+        if workers is None:
+            workers = (os.cpu_count() or 1) if shared_memory is not None else 0
+        if workers > 0:
+            require_shared_memory("File.preload_all with worker processes")
+        task_bytes = max(1, used // (max(workers, 1) * 4))  # about 4 tasks per worker
+
+        tasks = []
+        arrays = {}
         try:
-            h5data = getattr(self, what)(axis)
-            tmp = [np.zeros(i.shape, dtype=i.dtype) for _, i in h5data]
-            for idx, (name, i) in enumerate(h5data):
-                if isinstance(i, h5.Dataset):
-                    i.read_direct(tmp[idx])
-                    sdata = {name: AttributedNPArray(tmp[idx], i.attrs, i.name)}
-                    self._data[self._met2gr[what]].update(sdata)
-        except Exception:
-            print("Error preloading data")
+            for dataset in selected:
+                if workers > 0:
+                    array, block = shared_array(dataset.shape, dataset.dtype)
+                else:  # read in this process, no shared memory needed
+                    array, block = np.empty(dataset.shape, dtype=dataset.dtype), None
+                arrays[dataset.name] = (dataset, array, block)
+                if dataset.size == 0:
+                    continue
+                block_name = block.name if block is not None else None
+                if dataset.ndim == 0:
+                    tasks.append((dataset.name, block_name, None, None))
+                    continue
+                row_bytes = dataset.size // dataset.shape[0] * dataset.dtype.itemsize
+                chunk_rows = dataset.chunks[0] if dataset.chunks is not None else 1
+                rows = max(chunk_rows, task_bytes // max(row_bytes, 1) // chunk_rows * chunk_rows)
+                for start in range(0, dataset.shape[0], rows):
+                    tasks.append((dataset.name, block_name, start,
+                                  min(start + rows, dataset.shape[0])))
+
+            with tqdm.tqdm(total=used, unit="B", unit_scale=True, disable=not progress,
+                           desc=os.path.basename(self.filename)) as bar:
+                if workers > 0 and tasks:
+                    with ProcessPoolExecutor(max_workers=workers) as pool:
+                        futures = [pool.submit(read_rows, self.filename, name, block_name,
+                                               arrays[name][0].shape, arrays[name][0].dtype.str,
+                                               start, stop)
+                                   for name, block_name, start, stop in tasks]
+                        for future in as_completed(futures):
+                            bar.update(future.result())
+                else:
+                    for name, block_name, start, stop in tasks:
+                        dataset, array = arrays[name][:2]
+                        if start is None:
+                            dataset.read_direct(array)
+                        else:
+                            dataset.read_direct(array, np.s_[start:stop], np.s_[start:stop])
+                        bar.update(array[start:stop].nbytes if start is not None else array.nbytes)
+                for dataset, array, block in arrays.values():
+                    preloaded = AttributedNPArray(array, dict(dataset.attrs), dataset.name)
+                    if block is not None:  # keep the block until the array is deleted
+                        preloaded.shared_block = block
+                    dataset_cache.put((self._cache_key, dataset.name), preloaded)
+                for dataset in virtual:
+                    array = np.empty(dataset.shape, dtype=dataset.dtype)
+                    if dataset.size > 0:
+                        dataset.read_direct(array)
+                    dataset_cache.put((self._cache_key, dataset.name),
+                                      AttributedNPArray(array, dict(dataset.attrs), dataset.name))
+                    bar.update(array.nbytes)
+        finally:
+            # the mapping stays valid after unlinking, the memory is freed with the arrays
+            for dataset, array, block in arrays.values():
+                if block is not None:
+                    block.unlink()
+        return complete
 
     def __getattr__(self, what):
         if what not in self._met2gr and what != "parameters":
@@ -364,15 +1143,7 @@ class File(object):
                     try:
                         data_dict = {}
                         for sel in selectors:
-                            if self.version == version9_1 and sel == "BunchCurrent":
-                                value = self._read_from_cfg(sel)
-                                if value is None:
-                                    value = self.file.get("BunchCurrent/data")[0]
-                                data_dict[sel] = value
-                            elif self.version == version9_1 and sel == "RevolutionFrequency":
-                                data_dict[sel] = self._read_from_cfg(sel)
-                            else:
-                                data_dict[sel] = self.file.get("Info/Parameters").attrs.get(sel)
+                            data_dict[sel] = self._backend.parameter(self, sel)
                         return DataContainer(data_dict, selectors)
                     except DataError:
                         raise DataNotInFile("One of the parameters is not saved in hdf5 file.")
@@ -381,23 +1152,172 @@ class File(object):
         return data_getter
 
 
+class StitchedFile(File):
+    """
+    Continuation runs of one simulation (each restarted from the last phase space of the previous
+    one) as a single File. Create it with File.concat::
+
+        f = File.concat(["run1.h5", "run2.h5", "run3.h5"])
+        f.bunch_profile(Axis.DATA)[1000:1200]  # may span two files
+
+    Time dependent datasets are concatenated lazily (see Lisa.data.virtual.ConcatDataset), only
+    the selected snapshots are read from the files. If the time axis of a run starts before the
+    previous run ended (Inovesa restarts it) the end of the previous run is added to it.
+    Snapshots of a run up to half a time step after the end of the previous run (the restart
+    point) are left out. Datasets not saved at every time step (e.g. phase spaces saved only at
+    the start and the end) are concatenated as they are. All other data, parameters and the
+    Inovesa version are taken from the first file.
+    """
+    def __init__(self, files, time_offsets=None):
+        """
+        :param files: filenames or File objects in the order of the runs
+        :param time_offsets: offsets added to the time axis of each file (in Inovesa units, None
+                or None entries to detect them)
+        """
+        self.parts = [f if isinstance(f, File) else File(f) for f in files]
+        if not self.parts:
+            raise DataError("No files to concatenate.")
+        if time_offsets is not None and len(time_offsets) != len(self.parts):
+            raise ValueError("One time offset per file is needed.")
+        self.filename = self.parts[0].filename
+        self.live = False
+        self._pool = None
+        self._init_state(False, 0, clamp_time=False)  # the parts are clamped on their own
+        self._cache_key = ("concat", tuple(f._cache_key for f in self.parts),
+                           None if time_offsets is None else tuple(time_offsets))
+        self._shared = False
+        self._h5file = None
+        self._time_offsets = time_offsets
+        self._timelines = {}  # what -> (time axis, first row used of each file)
+        self.version = self.parts[0].version
+        self.select_axis = self.parts[0].select_axis
+        self._backend = self.parts[0]._backend
+        self._met2gr = self.parts[0]._met2gr
+
+    @property
+    def file(self):
+        """The h5py File of the first run (parameters and Info are used from it)"""
+        return self.parts[0].file
+
+    def close(self):
+        super(StitchedFile, self).close()
+        for f in self.parts:
+            f.close()
+
+    def __getstate__(self):
+        return {"parts": self.parts, "time_offsets": self._time_offsets}
+
+    def __setstate__(self, state):
+        self.__init__(state["parts"], state["time_offsets"])
+
+    def _timeline(self, what):
+        """
+        Join the time axes of group what
+        :return: (time axis, first row used of each file, length of the time axis of each file)
+        """
+        if what not in self._timelines:
+            axes = [np.asarray(getattr(f, what)(Axis.TIME)) for f in self.parts]
+            values, starts = [], []
+            end = None
+            for i, times in enumerate(axes):
+                step = float(np.median(np.diff(times))) if len(times) > 1 else 0.0
+                offset = None if self._time_offsets is None else self._time_offsets[i]
+                if offset is None:
+                    offset = end - times[0] if end is not None and len(times) and \
+                        times[0] < end - step / 2 else 0
+                times = times + offset
+                start = 0 if end is None else int(np.searchsorted(times, end + step / 2,
+                                                                  side="right"))
+                values.append(times[start:])
+                starts.append(start)
+                if start < len(times):
+                    end = times[-1]
+            attrs = getattr(self.parts[0], what)(Axis.TIME)
+            timeline = AttributedNPArray(np.concatenate(values), dict(attrs.attrs), attrs.name)
+            timeline.flags.writeable = False
+            self._timelines[what] = (timeline, starts, [len(t) for t in axes])
+        return self._timelines[what]
+
+    def _stitch(self, what, elem):
+        """Join the element elem of group what of all files"""
+        parts = [getattr(f, what)(elem) for f in self.parts]
+        dims = self.select_axis.dims_for(what, elem)
+        if not dims or dims[0] != Axis.TIME:
+            if any(np.shape(p) != np.shape(parts[0]) for p in parts):
+                raise DataError("'{}' ({}) differs between the files.".format(what, elem))
+            return parts[0]
+        if any(np.shape(p)[1:] != np.shape(parts[0])[1:] for p in parts):
+            raise DataError("The snapshots of '{}' ({}) differ in shape between the files.".format(
+                what, elem))
+        timeline, starts, lengths = self._timeline(what)
+        if elem == Axis.TIME:
+            return timeline
+        datasets = []
+        for part, start, length in zip(parts, starts, lengths):
+            if start > 0 and len(part) == length:  # saved at every time step, without duplicates
+                part = OffsetDataset(part, start)
+            datasets.append(part)
+        return ConcatDataset(datasets)
+
+    def _group_dict(self, what, list_of_elements):
+        with self._lock:
+            group = self._met2gr.get(what, None)
+            if not group:
+                if what not in self._met2gr.values():
+                    raise DataNotInFile("'{}' does not exist in file.".format(what))
+                group, what = what, {v: k for k, v in self._met2gr.items()}[what]
+            dg = self._data.setdefault(group, {})
+            if len(list_of_elements) == 0 or \
+                    (len(list_of_elements) == 1 and list_of_elements[0] is None):
+                list_of_elements = self.select_axis.all_for(what)
+            for elem in set(list_of_elements) - set(dg.keys()):
+                dg[elem] = self._stitch(what, elem)
+            return dg, list_of_elements
+
+
 class MultiFile(object):
     """
     Multiple File container for whole directories
+
+    Version, parameters and .cfg values of all files are kept in a catalog (see
+    Lisa.data.catalog) so sorting and querying does not open the HDF5 files::
+
+        mf = MultiFile("/path/to/dir", "*.h5")
+        mf.query("BunchCurrent > 1e-3 and version >= '0.15'")
+        high_current = mf.filter("BunchCurrent > 1e-3")
+
+    The File objects (MultiFile.objlst) are opened on first access. Together they use at most
+    max_open file descriptors (open files and memory mapped datasets, see Lisa.data.handles).
+
+    Files added to (or changed/removed in) the directory later are picked up by
+    MultiFile.refresh, MultiFile.watch calls it periodically.
     """
-    def __init__(self, path, pattern=None, sorter=None):
+    def __init__(self, path, pattern=None, sorter=None, catalog=True, max_open=None):
         """
         :param path: The path to search in
         :param pattern: The pattern to search for (has to be accepted by glob) (None for no pattern)
         :param sorter: The sorting method to use. (None for default)
+        :param catalog: True to use the catalog in path, a Lisa.data.catalog.Catalog object or
+                False to not use a catalog (the default sorting then reads the .cfg files)
+        :param max_open: maximal number of file descriptors used by the open files (None for
+                config option "max_open_files")
         """
         self.path = path
         self.pattern = pattern
         self.sorter = sorter
+        self._pool = HandlePool(max_open)
         self._sort_changed = True
         self._filelist = []
         self._sorted_filelist = []
         self._fileobjectlist = []
+        self._states = {}  # filename -> state on disk (see Lisa.data.catalog.file_state)
+        self._sort_keys = {}  # filename -> key of the default sorting
+        self._objects = {}  # filename -> File object
+        self._expression = None  # query of a filtered MultiFile
+        self._lock = threading.RLock()
+        if catalog is True:
+            catalog = Catalog(path)
+        self.catalog = catalog if catalog else None
         self._generate_file_list_()
 
     @classmethod
@@ -407,9 +1327,33 @@ class MultiFile(object):
                 if line.startswith("BunchCurrent"):
                     return float(line.split("=")[1])
 
+    def _get_current(self, filename):
+        if self.catalog is None:
+            return MultiFile._get_current_from_cfg(filename)
+        current = self.catalog.value(filename, "BunchCurrent")
+        return current if current is not None else float("-inf")
+
+    def _scan(self):
+        """
+        List the files in the directory (matching the query of filtered objects)
+        :return: dictionary filename -> state on disk, in glob order
+        """
+        states = {}
+        for filename in glob.glob(self.path + "/" +
+                                  (self.pattern if self.pattern is not None else "*")):
+            try:
+                states[filename] = file_state(filename)
+            except FileNotFoundError:  # removed in the meantime
+                pass
+        if self.catalog is not None:
+            self.catalog.refresh(list(states))
+            if self._expression is not None:
+                states = {f: states[f] for f in self.catalog.query(self._expression, states)}
+        return states
+
     def _generate_file_list_(self):
-        self._filelist = glob.glob(self.path + "/" +
-                                   (self.pattern if self.pattern is not None else "*"))
+        self._states = self._scan()
+        self._filelist = list(self._states)
         self._sorted_filelist = self._filelist  # put files in sorted_filelist even if not sorted
 
     def _sort_file_list(self):
@@ -418,10 +1362,99 @@ class MultiFile(object):
         else:
             tmp_list = []
             for file in self._filelist:
-                tmp_list.append((MultiFile._get_current_from_cfg(file), file))
+                key = self._sort_keys.get(file)
+                if key is None:
+                    key = self._sort_keys[file] = self._get_current(file)
+                tmp_list.append((key, file))
             # make sure it is sorted by the first entry
             tmp_list.sort(key=lambda f: f[0], reverse=True)
             self._sorted_filelist = [i[1] for i in tmp_list]
+        self._sort_changed = False
+        self._fileobjectlist = []
+
+    def refresh(self):
+        """
+        Rescan the directory for new, removed and modified (modification time or size of the
+        file or its .cfg file) files. Only those are read into the catalog, the sorting keys and
+        File objects of all other files are kept. File objects of modified files are replaced,
+        their preloaded data is dropped from the dataset cache.
+        :return: tuple of lists (added, removed, modified) of filenames
+        """
+        with self._lock:
+            states = self._scan()
+            added = [f for f in states if f not in self._states]
+            removed = [f for f in self._states if f not in states]
+            modified = [f for f in states if f in self._states and states[f] != self._states[f]]
+            for filename in removed + modified:
+                self._sort_keys.pop(filename, None)
+                obj = self._objects.pop(filename, None)
+                if obj is not None:
+                    obj.close()
+                    dataset_cache.clear(obj._cache_key)
+            self._states = states
+            if added or removed or modified:
+                self._filelist = list(states)
+                self._sorted_filelist = self._filelist
+                self._fileobjectlist = []
+                self._sort_changed = True
+            return added, removed, modified
+
+    def watch(self, callback, interval=60.0, settle=None):
+        """
+        Call MultiFile.refresh periodically in a background thread and pass files that were
+        completed to callback. A new or modified file is complete when its state on disk did
+        not change for settle seconds (Inovesa finished writing it).
+        :param callback: called (in the background thread) with the list of completed files
+        :param interval: seconds between two refreshs
+        :param settle: seconds a file has to stay unchanged (None for interval)
+        :return: the Watcher (see Lisa.data.watch), use Watcher.stop() to stop watching
+        """
+        watcher = Watcher(self, callback, interval, interval if settle is None else settle)
+        watcher.start()
+        return watcher
+
+    def state(self, filename):
+        """
+        Get the state of a file when the directory was scanned last
+        :return: (modification time, size, modification time of the .cfg file or None)
+        """
+        return self._states[filename]
+
+    def query(self, expression, sorted=True):
+        """
+        Get the files matching a query (evaluated on the catalog, no HDF5 file is opened)
+        :param expression: e.g. "BunchCurrent > 1e-3 and version >= '0.15'"
+        :param sorted: True to return the files in sorted order
+        :return: list of filenames
+        """
+        if self.catalog is None:
+            raise DataError("Queries need a catalog (create MultiFile with catalog=True)")
+        return self.catalog.query(expression, self.strlst(sorted))
+
+    def filter(self, expression):
+        """
+        Get a MultiFile object containing only the files matching a query
+        :param expression: see MultiFile.query
+        :return: MultiFile
+        """
+        filtered = MultiFile.__new__(MultiFile)
+        filtered.path = self.path
+        filtered.pattern = self.pattern
+        filtered.sorter = self.sorter
+        filtered.catalog = self.catalog
+        filtered._pool = self._pool
+        filtered._filelist = self.query(expression, sorted=False)
+        filtered._sorted_filelist = filtered._filelist
+        filtered._fileobjectlist = []
+        filtered._sort_changed = True
+        filtered._states = {f: self._states[f] for f in filtered._filelist}
+        filtered._sort_keys = dict(self._sort_keys)
+        filtered._objects = {}
+        if self._expression is not None:
+            expression = "({}) and ({})".format(self._expression, expression)
+        filtered._expression = expression
+        filtered._lock = threading.RLock()
+        return filtered
 
     def set_sorter(self, sorter):
         """
@@ -436,25 +1469,53 @@ class MultiFile(object):
         Get File list as string list
         :param sorted: True to sort the list
         """
-        if sorted:
-            if self._sort_changed:
-                self._sort_file_list()
-            return self._sorted_filelist
-        else:
-            return self._filelist
+        with self._lock:
+            if sorted:
+                if self._sort_changed:
+                    self._sort_file_list()
+                return self._sorted_filelist
+            else:
+                return self._filelist
 
     def objlst(self, sorted=True):
         """
         Get File list as Lisa.File object list
         :param sorted: True to sort the list
         """
-        if sorted:
-            if self._sort_changed:
-                self._sort_file_list()
-        if len(self._fileobjectlist) == 0:
-            for file in self._sorted_filelist:
-                if isinstance(file, list) or isinstance(file, tuple):
-                    self._fileobjectlist.append((File(file[0]), *file[1:]))
-                else:
-                    self._fileobjectlist.append(File(file))
-        return self._fileobjectlist
+        with self._lock:
+            if sorted:
+                if self._sort_changed:
+                    self._sort_file_list()
+            if len(self._fileobjectlist) == 0:
+                for file in self._sorted_filelist:
+                    if isinstance(file, list) or isinstance(file, tuple):
+                        self._fileobjectlist.append((self._file(file[0]), *file[1:]))
+                    else:
+                        self._fileobjectlist.append(self._file(file))
+            return self._fileobjectlist
+
+    def _file(self, filename):
+        """
+        Get the File object for filename using the handle pool of this object. If the catalog
+        knows the version of the file it is opened on first access.
+        """
+        obj = self._objects.get(filename)
+        if obj is not None:
+            return obj
+        version = self.catalog.value(filename, "version") if self.catalog is not None else None
+        if version is None:
+            obj = File(filename, pool=self._pool)
+        else:
+            obj = File.deferred(filename, version, self._pool)
+        self._objects[filename] = obj
+        return obj
+
+    def close(self):
+        """Close all open files (they are opened again on next access)"""
+        self._pool.close_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
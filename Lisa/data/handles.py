@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Bounded pool of open result files.
+
+Every open h5 file uses a file descriptor and memory for the HDF5 metadata cache, every memory
+mapped dataset (see File._memmap) another file descriptor. Lisa.MultiFile creates its File
+objects with a `HandlePool`: when the files of the pool use more than max_open descriptors, the
+least recently used ones are closed (File.close, which also drops their memory maps). Closed
+files are opened again on their next access, so iterating over thousands of files keeps at most
+max_open descriptors open. Memory mapped arrays that are still referenced outside of a closed
+File keep their descriptor until they are garbage collected.
+
+Datasets (h5py objects) of a closed file can not be used anymore, process a file before
+moving on to the next one.
+"""
+
+import threading
+from collections import OrderedDict
+
+from ..internals import config_options
+
+
+class HandlePool(object):
+    """
+    Least recently used set of open Lisa.File objects
+    """
+    def __init__(self, max_open=None):
+        """
+        :param max_open: maximal number of file descriptors used by the open files (None for
+                config option "max_open_files")
+        """
+        self.max_open = config_options.get("max_open_files") if max_open is None else max_open
+        if self.max_open < 1:
+            raise ValueError("A HandlePool needs to keep at least one file open.")
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of open files"""
+        return len(self._files)
+
+    @property
+    def descriptors(self):
+        """Number of file descriptors used by the open files (see File.descriptors)"""
+        with self._lock:
+            return sum(f.descriptors for f in self._files.values())
+
+    def _evict(self):
+        """
+        Remove least recently used files until at most max_open descriptors are used. The most
+        recently used file is kept. Has to be called holding the lock.
+        :return: the removed files (to be closed without holding the lock)
+        """
+        used = sum(f.descriptors for f in self._files.values())
+        victims = []
+        while used > self.max_open and len(self._files) > 1:
+            victim = self._files.popitem(last=False)[1]
+            used -= victim.descriptors
+            victims.append(victim)
+        return victims
+
+    def opened(self, file):
+        """
+        Register a file that was opened, closes the least recently used files if necessary
+        :param file: the Lisa.File object
+        """
+        with self._lock:
+            self._files[id(file)] = file
+            self._files.move_to_end(id(file))
+            victims = self._evict()
+        for victim in victims:  # not holding the lock, File.close calls HandlePool.closed
+            victim.close()
+
+    def touch(self, file):
+        """
+        Mark a file as recently used, closes the least recently used files if memory maps
+        opened since the last access exceed the limit
+        :param file: the Lisa.File object
+        """
+        with self._lock:
+            if id(file) not in self._files:
+                return
+            self._files.move_to_end(id(file))
+            victims = self._evict()
+        for victim in victims:
+            victim.close()
+
+    def closed(self, file):
+        """
+        Unregister a file that was closed
+        :param file: the Lisa.File object
+        """
+        with self._lock:
+            self._files.pop(id(file), None)
+
+    def close_all(self):
+        """Close all files of this pool"""
+        with self._lock:
+            files = list(self._files.values())
+        for file in files:
+            file.close()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Integrity checks for result files of crashed or truncated Inovesa runs.
+
+Inovesa allocates the datasets for the whole run. If a run crashes or hits the walltime the
+remaining snapshots stay zero (or NaN). The valid extent of a dataset (number of snapshots that
+were written) is found by bisection over blocks of whole chunks along the time axis, assuming
+that unwritten snapshots are only at the end: a block is unwritten if its chunks are not
+allocated or all its values are zero or NaN. Only a few blocks are read per dataset.
+
+Groups without any data (e.g. CSR intensity and spectrum if CSR is off) are reported as empty.
+They do not limit the valid extent of the file.
+
+`scan` checks whole directories, optionally also for NaN or inf values in the valid part, and
+stores the results in the catalog of the directory (see Lisa.data.catalog).
+"""
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def _empty(block):
+    """True if all values are zero or NaN (never written)"""
+    if block.dtype.kind in "fc":
+        return not np.any(np.nan_to_num(block, nan=0.0, posinf=1.0, neginf=1.0))
+    return not np.any(block)
+
+
+def _allocated(dataset, start, stop):
+    """
+    Check whether chunks with rows start to stop are allocated in the file
+    :return: False if none of them is allocated, True if one is or it can not be checked
+    """
+    dsid = getattr(dataset, "id", None)
+    if getattr(dataset, "chunks", None) is None or not hasattr(dsid, "get_chunk_info_by_coord"):
+        return True
+    offsets = [0] * len(dataset.shape)
+    for row in range(start - start % dataset.chunks[0], stop, dataset.chunks[0]):
+        offsets[0] = row
+        # only the first chunk of each row block is checked, Inovesa writes whole snapshots
+        if dsid.get_chunk_info_by_coord(tuple(offsets)).byte_offset is not None:
+            return True
+    return False
+
+
+def valid_extent(dataset, rows=None):
+    """
+    Get the number of snapshots that were written (first axis is time)
+    :param dataset: h5py Dataset, VirtualDataset or array
+    :param rows: number of snapshots per block (None for the chunk size of the dataset)
+    :return: number of leading snapshots up to the last one that is not empty
+    """
+    length = len(dataset)
+    if length == 0 or dataset.size == 0:
+        return length
+    if rows is None:
+        chunks = getattr(dataset, "chunks", None)
+        rows = chunks[0] if chunks is not None else 64
+    blocks = (length + rows - 1) // rows
+
+    def empty(block):
+        start, stop = block * rows, min(length, (block + 1) * rows)
+        return not _allocated(dataset, start, stop) or _empty(np.asarray(dataset[start:stop]))
+
+    lo, hi = 0, blocks  # first empty block is in [lo, hi]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if empty(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    if lo == 0:
+        return 0
+    start = (lo - 1) * rows
+    block = np.asarray(dataset[start:min(length, lo * rows)])
+    written = [i for i in range(len(block)) if not _empty(block[i])]
+    return start + written[-1] + 1
+
+
+def _time_extent(times):
+    """Number of leading time values that increase (unwritten values stay zero)"""
+    times = np.asarray(times)
+    if len(times) == 0:
+        return 0
+    decreasing = np.flatnonzero(~(np.diff(times) > 0))
+    return int(decreasing[0]) + 1 if len(decreasing) else len(times)
+
+
+def nonfinite_regions(dataset, stop=None, rows=None):
+    """
+    Find snapshots with NaN or inf values. Reads the dataset in blocks of whole chunks.
+    :param dataset: h5py Dataset, VirtualDataset or array (first axis is time)
+    :param stop: only check snapshots before stop (None for all)
+    :param rows: number of snapshots per block (None for the chunk size of the dataset)
+    :return: list of [start, stop] of consecutive snapshots with non finite values
+    """
+    stop = len(dataset) if stop is None else stop
+    if dataset.dtype.kind not in "fc" or dataset.size == 0:
+        return []
+    if rows is None:
+        chunks = getattr(dataset, "chunks", None)
+        rows = chunks[0] if chunks is not None else 64
+    regions = []
+    for start in range(0, stop, rows):
+        block = np.asarray(dataset[start:min(stop, start + rows)])
+        bad = ~np.isfinite(block).reshape(len(block), -1).all(axis=1)
+        for i in np.flatnonzero(bad) + start:
+            if regions and regions[-1][1] == i:
+                regions[-1][1] = int(i) + 1
+            else:
+                regions.append([int(i), int(i) + 1])
+    return regions
+
+
+def scan_file(f, check_finite=True):
+    """
+    Check a result file for unwritten snapshots and non finite values
+    :param f: Lisa.File
+    :param check_finite: also look for NaN and inf values in the valid part (reads it)
+    :return: dictionary with
+            - time: number of time steps allocated
+            - valid: number of time steps written to the time axis and all groups using it
+              (empty groups are not taken into account)
+            - groups: method name -> {length, valid, empty (True if no snapshot contains data),
+              nonfinite (list of [start, stop] or None)}
+            - issues: list of descriptions of the problems found
+    """
+    axis = f.select_axis
+    result = {"time": 0, "valid": 0, "groups": {}, "issues": []}
+    timeline = []
+    for what in sorted(f._met2gr):
+        if what == "parameters" or axis.TIME not in axis.all_for(what) or \
+                f.file.get(f._met2gr[what]) is None:
+            continue
+        dg = f._group_dict(what, [axis.TIME, axis.DATA])[0]
+        data = dg[axis.DATA]
+        if not result["groups"]:  # all groups share the time axis
+            result["time"] = len(dg[axis.TIME])
+            result["valid"] = _time_extent(dg[axis.TIME])
+            if result["valid"] < result["time"]:
+                result["issues"].append("time axis: {} of {} time steps written".format(
+                    result["valid"], result["time"]))
+        # corrected data (e.g. bunch lengths from unwritten profiles) can be NaN
+        with np.errstate(invalid="ignore", divide="ignore"):
+            valid = valid_extent(data)
+            group = {"length": len(data), "valid": valid, "empty": valid == 0,
+                     "nonfinite": None}
+            if check_finite:
+                group["nonfinite"] = nonfinite_regions(data, valid)
+        for start, stop in group["nonfinite"] or []:
+            result["issues"].append("{}: NaN or inf in snapshots {} to {}".format(
+                what, start, stop - 1))
+        if group["empty"]:  # not calculated in this run (e.g. CSR off), not truncated
+            pass
+        elif len(data) == result["time"]:
+            timeline.append((what, valid))
+        elif valid < len(data):
+            result["issues"].append("{}: {} of {} snapshots written".format(what, valid,
+                                                                          len(data)))
+        result["groups"][what] = group
+    if timeline:
+        valid = [v for _, v in timeline]
+        if min(valid) != max(valid):
+            result["issues"].append("inconsistent lengths: " + ", ".join(
+                "{} {}".format(what, v) for what, v in timeline))
+        elif valid[0] < result["time"]:
+            result["issues"].append("{} of {} time steps written".format(valid[0],
+                                                                         result["time"]))
+        result["valid"] = min([result["valid"]] + valid)
+    return result
+
+
+def _scan_path(filename, check_finite):
+    """Scan one file (executed in worker processes)"""
+    from .file import File  # file imports this module
+    with File(filename, threads=0) as f:
+        return scan_file(f, check_finite)
+
+
+def scan(path_or_multifile, workers=None, check_finite=True, catalog=True):
+    """
+    Check result files for unwritten snapshots (crashed or truncated runs), NaN and inf values
+    and groups of different lengths.
+
+    ::
+
+        results = Lisa.scan("/path/to/dir", workers=4)
+        broken = {f: r["issues"] for f, r in results.items() if r["issues"]}
+
+    Results are stored in the catalog of the directory and reused while the file does not change.
+    :param path_or_multifile: a result file, a directory (all .h5 files in it) or a MultiFile
+    :param workers: number of processes scanning files in parallel (None or 1 for none)
+    :param check_finite: also look for NaN and inf values (reads the valid part of all data)
+    :param catalog: True to store results in the catalog of the directory, a Catalog or False
+    :return: dictionary filename -> result (see scan_file)
+    """
+    from .catalog import Catalog  # the catalog is only needed here
+    if isinstance(path_or_multifile, str):
+        if os.path.isdir(path_or_multifile):
+            directory = path_or_multifile
+            filenames = sorted(glob.glob(os.path.join(directory, "*.h5")))
+        else:
+            directory = os.path.dirname(os.path.abspath(path_or_multifile))
+            filenames = [path_or_multifile]
+        if catalog is True:
+            catalog = Catalog(directory)
+    else:
+        filenames = path_or_multifile.strlst(sorted=False)
+        if catalog is True:
+            catalog = path_or_multifile.catalog or Catalog(path_or_multifile.path)
+    catalog = catalog or None
+
+    results = {}
+    todo = []
+    for filename in filenames:
+        stored = catalog.scan_result(filename) if catalog is not None else None
+        if stored is not None and (not check_finite or all(
+                g["nonfinite"] is not None for g in stored["groups"].values())):
+            results[filename] = stored
+        else:
+            todo.append(filename)
+    if workers is not None and workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(min(workers, len(todo))) as pool:
+            scanned = list(pool.map(_scan_path, todo, [check_finite] * len(todo)))
+    else:
+        scanned = [_scan_path(filename, check_finite) for filename in todo]
+    for filename, result in zip(todo, scanned):
+        if catalog is not None:
+            catalog.store_scan(filename, result)
+        results[filename] = result
+    return {filename: results[filename] for filename in filenames}
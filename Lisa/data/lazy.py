@@ -0,0 +1,679 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Lazy expressions on datasets, evaluated block by block along the first (time) axis.
+
+Chaining operations on whole arrays (``ps[lb:ub] - np.mean(ps[lbm:ubm], axis=0)``) allocates
+a full array for every step. An `Expression` only records the operations (arithmetic and other
+numpy ufuncs, indexing, reductions, differences and dtype casts). `Expression.compute` and
+`Expression.iter` evaluate the whole chain for one block of snapshots at a time:
+
+  - blocks are aligned to the HDF5 chunks of the dataset, so every chunk is read (and
+    decompressed) once per pass
+  - indexing is applied to the read itself, only the selected hyperslab is read
+  - elementwise operations are fused: all of them are applied to a block before the next block
+    is read, intermediates have the size of a block and are reused as output where possible
+  - reductions along time (e.g. a mean phase space) are accumulated over the blocks. They are
+    computed once when they are first needed and then kept.
+
+Use Lisa.Data.lazy to get an expression for a dataset converted to a unit::
+
+    ps = d.lazy("phase_space", unit="cpnblpnes", x=(-20e-12, 20e-12, "s"))
+    diffs = (ps[1000:2000] - ps[:500].mean(axis=0)).compute()
+    for times, peaks in abs(ps).max(axis=(1, 2)).iter():
+        ...
+"""
+
+import numbers
+
+import h5py as h5
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+from .views import Accessor, ScaledView
+
+# bytes of the selected data per block (rounded up to whole HDF5 chunks)
+block_bytes = 2 ** 22
+
+
+def expression(source, times=None):
+    """
+    Get a lazy expression for a dataset. The first axis is the one evaluated in blocks.
+    :param source: h5py/virtual dataset, Lisa accessor (Data.accessor), ScaledView or numpy array
+    :param times: values along the first axis (e.g. the time axis, None for row numbers)
+    :return: Expression
+    """
+    if len(source.shape) == 0:
+        raise ValueError("Expressions need a dataset with at least one dimension")
+    return _Source(source, times, tuple(range(n) for n in source.shape))
+
+
+def _shape_of(shape, key):
+    """Shape of an array with shape indexed by key"""
+    return np.broadcast_to(np.empty((), dtype=bool), shape)[key].shape
+
+
+def _simple(key):
+    """True if key contains only integers and slices"""
+    return all(isinstance(k, (slice, numbers.Integral)) for k in key)
+
+
+def _full(key):
+    """True if key selects everything"""
+    return all(isinstance(k, slice) and k == slice(None) for k in key)
+
+
+def _as_slice(rows):
+    """Convert a range to a slice selecting the same rows"""
+    if len(rows) == 0:
+        return slice(0, 0)
+    return slice(rows.start, rows.stop if rows.stop >= 0 else None, rows.step)
+
+
+def _axes(axis, ndim):
+    """Normalize axis (None, int or tuple of ints) to a sorted tuple of non negative axes"""
+    axes = range(ndim) if axis is None else axis if isinstance(axis, tuple) else (axis,)
+    result = []
+    for ax in axes:
+        if not -ndim <= ax < ndim:
+            raise ValueError("axis {} is out of bounds for an expression with {} dimensions"
+                             .format(ax, ndim))
+        result.append(ax % ndim)
+    return tuple(sorted(set(result)))
+
+
+def _store(block, out):
+    """Write block to out (if given)"""
+    if out is None:
+        return block
+    out[...] = block
+    return out
+
+
+def _chunks(source):
+    if isinstance(source, ScaledView):
+        source = source.source  # getattr on a view would read the whole dataset
+    return getattr(source, "chunks", None)
+
+
+class Expression(NDArrayOperatorsMixin):
+    """
+    A lazily evaluated array.
+
+    Supports numpy style indexing (slices and integers, for axes except the first also one index
+    array), arithmetic and all numpy ufuncs with a single output, reductions (sum, mean, min,
+    max, var, std, also via np.mean etc.), diff and astype. All of them return new expressions.
+    Use compute() or numpy.asarray to get the result, iter() to get it in blocks.
+
+    Expressions along time (`timed`) are evaluated block by block along the first axis. Results
+    without the first axis (reductions along it, single snapshots) are computed completely when
+    they are needed and kept.
+    """
+    timed = True
+
+    def __init__(self, shape, dtype):
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        if self.ndim == 0:
+            raise TypeError("len() of unsized object")
+        return self.shape[0]
+
+    # implemented by subclasses
+    def _rows(self, start, stop, out=None):
+        """
+        Evaluate rows start:stop of a timed expression
+        :param out: array to write the rows to (None to return a new array)
+        :return: out or a new array that is not used anywhere else (may be changed in place)
+        """
+        raise NotImplementedError
+
+    def _plan(self):
+        """
+        Get the default blocks of a timed expression
+        :return: (offset, batch), blocks have batch rows and end at rows i with
+                (i + offset) % batch == 0
+        """
+        raise NotImplementedError
+
+    def _times(self):
+        """Values along the first axis of a timed expression (None if unknown)"""
+        return None
+
+    def _value(self):
+        """The whole result of an expression that is not timed"""
+        raise NotImplementedError
+
+    def _slice_time(self, key):
+        """Index the first axis of a timed expression with the slice key"""
+        return _TimeSlice(self, range(self.shape[0])[key])
+
+    def _index_rest(self, rest):
+        """Index all axes but the first of a timed expression with rest"""
+        return _Index(self, rest)
+
+    def _blocks(self, batch=None):
+        """Yield (start, stop) of the blocks of a timed expression"""
+        offset, default = (0, batch) if batch is not None else self._plan()
+        batch = max(int(default), 1)
+        start, stop = 0, batch - offset % batch
+        while start < self.shape[0]:
+            stop = min(stop, self.shape[0])
+            yield start, stop
+            start, stop = stop, stop + batch
+
+    def compute(self, out=None):
+        """
+        Evaluate the expression
+        :param out: array with the shape of the expression to write the result to
+        :return: numpy array (out if given)
+        """
+        if out is not None and tuple(out.shape) != self.shape:
+            raise ValueError("out has shape {} instead of {}".format(out.shape, self.shape))
+        if not self.timed:
+            return np.array(self._value()) if out is None else _store(self._value(), out)
+        if out is None:
+            out = np.empty(self.shape, dtype=self.dtype)
+        for start, stop in self._blocks():
+            self._rows(start, stop, out[start:stop])
+        return out
+
+    def iter(self, batch=None):
+        """
+        Evaluate the expression block by block along the first axis
+
+        ::
+
+            for times, block in expr.iter():
+                ...
+
+        :param batch: number of rows per block (None for blocks aligned to the HDF5 chunks)
+        :return: generator yielding (values along the first axis, block). Every block is a new
+                array. Values are row numbers if the expression has no time axis.
+        """
+        if not self.timed:
+            raise ValueError("Only expressions along time can be iterated")
+        times = self._times()
+        for start, stop in self._blocks(batch):
+            values = np.arange(start, stop) if times is None else times[start:stop]
+            yield values, self._rows(start, stop)
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.compute()
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is None for k in key):
+            raise IndexError("newaxis is not supported for expressions")
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        if len(key) > self.ndim:
+            raise IndexError("too many indices for expression")
+        key = key + (slice(None),) * (self.ndim - len(key))
+        if not self.timed:
+            return _Static(lambda: self._value()[key], _shape_of(self.shape, key), self.dtype)
+        first, rest = key[0], key[1:]
+        if sum(not isinstance(k, (slice, numbers.Integral)) for k in rest) > 1:
+            raise IndexError("Only one index array is supported for expressions")
+        if isinstance(first, numbers.Integral):
+            if not -self.shape[0] <= first < self.shape[0]:
+                raise IndexError("index {} is out of bounds for axis 0 with size {}".format(
+                    first, self.shape[0]))
+            row = range(self.shape[0])[first]
+            part = self._slice_time(slice(row, row + 1))
+            if not _full(rest):
+                part = part._index_rest(rest)
+            return _Static(lambda: part.compute()[0], part.shape[1:], part.dtype)
+        if not isinstance(first, slice):
+            raise IndexError("The first axis of an expression can only be indexed with "
+                             "integers and slices")
+        result = self if first == slice(None) else self._slice_time(first)
+        return result if _full(rest) else result._index_rest(rest)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != "__call__" or ufunc.nout != 1 or "out" in kwargs:
+            return NotImplemented
+        inputs = tuple(i if isinstance(i, (Expression, numbers.Number, np.generic))
+                       else np.asarray(i) for i in inputs)
+        with np.errstate(all="ignore"):
+            dtype = ufunc(*[np.zeros(1, dtype=i.dtype) if isinstance(i, (Expression, np.ndarray))
+                            else i for i in inputs], **kwargs).dtype
+        shape = np.broadcast_shapes(*[np.shape(i) if not isinstance(i, Expression) else i.shape
+                                      for i in inputs])
+        timed = [i for i in inputs if isinstance(i, Expression) and i.timed]
+        if not timed:
+            values = lambda: [i._value() if isinstance(i, Expression) else i for i in inputs]
+            return _Static(lambda: ufunc(*values(), **kwargs), shape, dtype)
+        for i in timed:
+            if i.ndim != len(shape) or i.shape[0] != shape[0]:
+                raise ValueError("Expressions along time with shapes {} and {} can not be "
+                                 "combined, they need the same number of dimensions and "
+                                 "length".format(i.shape, shape))
+        return _Elementwise(ufunc, inputs, kwargs, shape, dtype)
+
+    def _reduce(self, name, axis, dtype=None, out=None, keepdims=False, ddof=0):
+        axes = _axes(axis, self.ndim)
+        kwargs = {} if name in ("min", "max") else {"dtype": dtype}
+        if name in ("var", "std"):
+            kwargs["ddof"] = ddof
+        func = getattr(np, name)
+        rdtype = func(np.zeros((1,) * self.ndim, dtype=self.dtype), **kwargs).dtype
+        shape = tuple(1 if i in axes else n for i, n in enumerate(self.shape)
+                      if keepdims or i not in axes)
+        if not self.timed:
+            result = _Static(lambda: func(self._value(), axis=axes, keepdims=keepdims,
+                                          **kwargs), shape, rdtype)
+        elif 0 in axes:
+            result = _Static(lambda: _reduce_time(self, name, axes, dtype, ddof, keepdims,
+                                                  rdtype), shape, rdtype)
+        else:
+            result = _Blockwise(self, lambda block: func(block, axis=axes, keepdims=keepdims,
+                                                         **kwargs), shape, rdtype)
+        return result if out is None else result.compute(out)
+
+    def sum(self, axis=None, dtype=None, out=None, keepdims=False):
+        """Lazy sum along axis (see numpy.sum)"""
+        return self._reduce("sum", axis, dtype, out, keepdims)
+
+    def mean(self, axis=None, dtype=None, out=None, keepdims=False):
+        """Lazy mean along axis (see numpy.mean). Means along time are accumulated in float64."""
+        return self._reduce("mean", axis, dtype, out, keepdims)
+
+    def min(self, axis=None, out=None, keepdims=False):
+        """Lazy minimum along axis (see numpy.min)"""
+        return self._reduce("min", axis, None, out, keepdims)
+
+    def max(self, axis=None, out=None, keepdims=False):
+        """Lazy maximum along axis (see numpy.max)"""
+        return self._reduce("max", axis, None, out, keepdims)
+
+    def var(self, axis=None, dtype=None, out=None, ddof=0, keepdims=False):
+        """Lazy variance along axis (see numpy.var)"""
+        return self._reduce("var", axis, dtype, out, keepdims, ddof)
+
+    def std(self, axis=None, dtype=None, out=None, ddof=0, keepdims=False):
+        """Lazy standard deviation along axis (see numpy.std)"""
+        return self._reduce("std", axis, dtype, out, keepdims, ddof)
+
+    def diff(self, n=1, axis=0):
+        """
+        Lazy n-th discrete difference along axis (see numpy.diff). Differences along time are
+        calculated per block, the block is read with one additional row.
+        """
+        axis = _axes(axis, self.ndim)[0]
+        result = self
+        for _ in range(n):
+            shape = list(result.shape)
+            shape[axis] = max(shape[axis] - 1, 0)
+            if not result.timed:
+                result = _Static(lambda r=result: np.diff(r._value(), axis=axis), shape,
+                                 result.dtype)
+            elif axis == 0:
+                result = _Diff(result)
+            else:
+                result = _Blockwise(result, lambda block: np.diff(block, axis=axis), shape,
+                                    result.dtype)
+        return result
+
+    def astype(self, dtype):
+        """Lazy conversion to dtype"""
+        dtype = np.dtype(dtype)
+        if dtype == self.dtype:
+            return self
+        if not self.timed:
+            return _Static(lambda: self._value().astype(dtype), self.shape, dtype)
+        return _Blockwise(self, lambda block: block.astype(dtype), self.shape, dtype, cast=True)
+
+    def __repr__(self):
+        return "<Lisa expression {} {} {}>".format(type(self).__name__.lstrip("_"), self.shape,
+                                                   self.dtype)
+
+
+def _reduce_time(expr, name, axes, dtype, ddof, keepdims, rdtype):
+    """
+    Reduce a timed expression along axes (including the first one) block by block
+    :return: numpy array with dtype rdtype
+    """
+    result = None
+    count = 0
+    for start, stop in expr._blocks():
+        block = expr._rows(start, stop)
+        if name in ("min", "max", "sum"):
+            part = getattr(np, name)(block, axis=axes, **({"dtype": dtype} if name == "sum"
+                                                           else {}))
+            if result is not None:
+                part = {"min": np.minimum, "max": np.maximum, "sum": np.add}[name](result, part)
+            result = part
+            continue
+        n = int(np.prod([block.shape[a] for a in axes]))
+        if n == 0:
+            continue
+        precision = np.result_type(np.float64, block.dtype if dtype is None else dtype)
+        mean = np.mean(block, axis=axes, dtype=precision)
+        m2 = np.var(block, axis=axes, dtype=precision) * n if name != "mean" else None
+        if result is None:
+            result = [mean, m2]
+        else:  # combine with the previous blocks (Chan et al.)
+            delta = mean - result[0]
+            result[0] = result[0] + delta * (n / (count + n))
+            if m2 is not None:
+                result[1] = result[1] + m2 + np.abs(delta) ** 2 * (count * n / (count + n))
+        count += n
+    if result is None:  # no data, numpy decides (zeros, nan or an error)
+        kwargs = {} if name in ("min", "max") else {"dtype": dtype}
+        if name in ("var", "std"):
+            kwargs["ddof"] = ddof
+        return getattr(np, name)(np.empty(expr.shape, dtype=expr.dtype), axis=axes,
+                                 keepdims=keepdims, **kwargs)
+    if name in ("mean", "var", "std"):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = result[0] if name == "mean" else result[1] / max(count - ddof, 0)
+        if name == "std":
+            result = np.sqrt(result)
+    result = np.asarray(result, dtype=rdtype)
+    return np.expand_dims(result, axes) if keepdims else result
+
+
+class _Source(Expression):
+    """A (hyperslab of a) dataset"""
+    def __init__(self, source, times, index):
+        """
+        :param source: the dataset
+        :param times: values along the first axis of source (or None)
+        :param index: per axis of source the selected range or an integer
+        """
+        self._source = source
+        self._all_times = None if times is None else np.asarray(times)
+        self._index = index
+        super(_Source, self).__init__([len(r) for r in index if isinstance(r, range)],
+                                      source.dtype)
+        # h5py and accessors return new arrays, other sources may return views
+        self._fresh = isinstance(source, (h5.Dataset, Accessor))
+
+    def _read(self, index):
+        key = []
+        flip = []
+        for rows in index:
+            if isinstance(rows, range):
+                flip.append(slice(None, None, -1) if rows.step < 0 else slice(None))
+                rows = rows[::-1] if rows.step < 0 else rows  # h5py needs increasing indices
+                key.append(_as_slice(rows))
+            else:
+                key.append(rows)
+        data = self._source[tuple(key)]
+        data = data if self._fresh else np.array(data)
+        return data[tuple(flip)] if any(f.step for f in flip) else data
+
+    def _rows(self, start, stop, out=None):
+        return _store(self._read((self._index[0][start:stop],) + self._index[1:]), out)
+
+    def _plan(self):
+        rows = self._index[0]
+        chunks = _chunks(self._source)
+        chunk_rows = chunks[0] if chunks else 1
+        row_bytes = self.dtype.itemsize * int(np.prod(self.shape[1:]))
+        step = abs(rows.step)
+        read = max(block_bytes // max(row_bytes, 1), 1) * step
+        read = -(-read // chunk_rows) * chunk_rows
+        batch = max(read // step, 1)
+        return (rows.start if rows.step == 1 else 0), batch
+
+    def _times(self):
+        if self._all_times is None:
+            return None
+        return self._all_times[_as_slice(self._index[0])]
+
+    def _slice_time(self, key):
+        return _Source(self._source, self._all_times, (self._index[0][key],) + self._index[1:])
+
+    def _index_rest(self, rest):
+        if not _simple(rest):
+            return super(_Source, self)._index_rest(rest)
+        rest = iter(rest)
+        index = [self._index[0]]
+        for rows in self._index[1:]:
+            index.append(rows[next(rest)] if isinstance(rows, range) else rows)
+        return _Source(self._source, self._all_times, tuple(index))
+
+
+class _Elementwise(Expression):
+    """A ufunc applied to expressions (at least one along time) and constants"""
+    def __init__(self, ufunc, inputs, kwargs, shape, dtype):
+        super(_Elementwise, self).__init__(shape, dtype)
+        self._ufunc = ufunc
+        self._inputs = inputs
+        self._kwargs = kwargs
+        self._timed_inputs = [i for i in inputs if isinstance(i, Expression) and i.timed]
+
+    def _aligned(self, value):
+        """True if the constant value has its own entry per row (not broadcast along time)"""
+        shape = value.shape if isinstance(value, Expression) else np.shape(value)
+        return len(shape) == self.ndim and shape[0] != 1
+
+    def _operand(self, value, start, stop):
+        if isinstance(value, Expression):
+            if value.timed:
+                return value._rows(start, stop)
+            value = value._value()
+        return value[start:stop] if self._aligned(value) else value
+
+    def _rows(self, start, stop, out=None):
+        for value in self._inputs:
+            if isinstance(value, Expression) and not value.timed:
+                value._value()  # computed before blocks of this pass are held in memory
+        operands = [self._operand(value, start, stop) for value in self._inputs]
+        shape = (stop - start,) + self.shape[1:]
+        if out is None:
+            # fused: the block of an operand is overwritten with the result
+            for value, operand in zip(self._inputs, operands):
+                if isinstance(value, Expression) and value.timed and operand.shape == shape \
+                        and operand.dtype == self.dtype:
+                    out = operand
+                    break
+        elif not np.can_cast(self.dtype, out.dtype, "same_kind"):
+            return _store(self._ufunc(*operands, **self._kwargs), out)
+        return self._ufunc(*operands, out=out, **self._kwargs)
+
+    def _plan(self):
+        return self._timed_inputs[0]._plan()
+
+    def _times(self):
+        for value in self._timed_inputs:
+            times = value._times()
+            if times is not None:
+                return times
+        return None
+
+    def _slice_time(self, key):
+        inputs = []
+        for value in self._inputs:
+            if isinstance(value, Expression) and value.timed:
+                value = value._slice_time(key)
+            elif self._aligned(value):
+                value = value[key]
+            inputs.append(value)
+        shape = (len(range(self.shape[0])[key]),) + self.shape[1:]
+        return _Elementwise(self._ufunc, inputs, self._kwargs, shape, self.dtype)
+
+    def _operand_key(self, value, rest):
+        """The part of rest for a (broadcast) operand"""
+        shape = value.shape if isinstance(value, Expression) else np.shape(value)
+        key = []
+        for i, n in enumerate(shape):
+            dim = i + self.ndim - len(shape)
+            if dim == 0:
+                key.append(slice(None))
+                continue
+            k = rest[dim - 1]
+            if n == 1 and self.shape[dim] != 1:  # broadcast, keep the single entry
+                k = 0 if isinstance(k, numbers.Integral) else slice(None)
+            key.append(k)
+        return tuple(key)
+
+    def _index_rest(self, rest):
+        if not _simple(rest):
+            return super(_Elementwise, self)._index_rest(rest)
+        inputs = []
+        for value in self._inputs:
+            if isinstance(value, Expression) and value.timed:
+                value = value._index_rest(self._operand_key(value, rest)[1:])
+            elif (value.ndim if isinstance(value, Expression) else np.ndim(value)) > 0:
+                value = value[self._operand_key(value, rest)]
+            inputs.append(value)
+        shape = (self.shape[0],) + _shape_of(self.shape[1:], rest)
+        return _Elementwise(self._ufunc, inputs, self._kwargs, shape, self.dtype)
+
+
+class _Index(Expression):
+    """Indexing of all axes but the first after the rows are evaluated"""
+    def __init__(self, child, rest):
+        super(_Index, self).__init__((child.shape[0],) + _shape_of(child.shape[1:], rest),
+                                     child.dtype)
+        self._child = child
+        self._rest = rest
+
+    def _rows(self, start, stop, out=None):
+        return _store(self._child._rows(start, stop)[(slice(None),) + self._rest], out)
+
+    def _plan(self):
+        return self._child._plan()
+
+    def _times(self):
+        return self._child._times()
+
+    def _slice_time(self, key):
+        return _Index(self._child._slice_time(key), self._rest)
+
+
+class _TimeSlice(Expression):
+    """Rows of an expression that can not be sliced itself"""
+    def __init__(self, child, rows):
+        """
+        :param child: the timed expression
+        :param rows: range of the selected rows of child
+        """
+        super(_TimeSlice, self).__init__((len(rows),) + child.shape[1:], child.dtype)
+        self._child = child
+        self._range = rows
+
+    def _rows(self, start, stop, out=None):
+        rows = self._range[start:stop]
+        if len(rows) == 0:
+            return _store(np.empty((0,) + self.shape[1:], dtype=self.dtype), out)
+        low = min(rows[0], rows[-1])
+        block = self._child._rows(low, max(rows[0], rows[-1]) + 1)
+        shifted = range(rows.start - low, rows.stop - low, rows.step)
+        return _store(block[_as_slice(shifted)], out)
+
+    def _plan(self):
+        return 0, max(self._child._plan()[1] // abs(self._range.step), 1)
+
+    def _times(self):
+        times = self._child._times()
+        return None if times is None else times[_as_slice(self._range)]
+
+    def _slice_time(self, key):
+        return _TimeSlice(self._child, self._range[key])
+
+    def _index_rest(self, rest):
+        if not _simple(rest):
+            return super(_TimeSlice, self)._index_rest(rest)
+        return _TimeSlice(self._child._index_rest(rest), self._range)
+
+
+class _Diff(Expression):
+    """Difference of consecutive rows"""
+    def __init__(self, child):
+        super(_Diff, self).__init__((max(child.shape[0] - 1, 0),) + child.shape[1:],
+                                    child.dtype)
+        self._child = child
+
+    def _rows(self, start, stop, out=None):
+        return _store(np.diff(self._child._rows(start, stop + 1), axis=0), out)
+
+    def _plan(self):
+        return self._child._plan()
+
+    def _times(self):
+        times = self._child._times()
+        return None if times is None else times[1:]
+
+    def _slice_time(self, key):
+        rows = range(self.shape[0])[key]
+        if rows.step != 1 or len(rows) == 0:
+            return super(_Diff, self)._slice_time(key)
+        return _Diff(self._child._slice_time(slice(rows.start, rows.stop + 1)))
+
+    def _index_rest(self, rest):
+        if not _simple(rest):
+            return super(_Diff, self)._index_rest(rest)
+        return _Diff(self._child._index_rest(rest))
+
+
+class _Blockwise(Expression):
+    """A function applied to each block (reductions and differences along other axes, casts)"""
+    def __init__(self, child, func, shape, dtype, cast=False):
+        """
+        :param child: the timed expression
+        :param func: called with a block of child, returns the block of the result
+        :param shape: shape of the result (same length along the first axis)
+        :param dtype: dtype of the result
+        :param cast: func only converts the dtype
+        """
+        super(_Blockwise, self).__init__(shape, dtype)
+        self._child = child
+        self._func = func
+        self._cast = cast
+
+    def _rows(self, start, stop, out=None):
+        if self._cast and out is not None:
+            return self._child._rows(start, stop, out)  # converted while written to out
+        return _store(self._func(self._child._rows(start, stop)), out)
+
+    def _plan(self):
+        return self._child._plan()
+
+    def _times(self):
+        return self._child._times()
+
+    def _slice_time(self, key):
+        child = self._child._slice_time(key)
+        return _Blockwise(child, self._func, (child.shape[0],) + self.shape[1:], self.dtype,
+                          self._cast)
+
+    def _index_rest(self, rest):
+        if not self._cast or not _simple(rest):
+            return super(_Blockwise, self)._index_rest(rest)
+        child = self._child._index_rest(rest)
+        return _Blockwise(child, self._func, child.shape, self.dtype, True)
+
+
+class _Static(Expression):
+    """An expression without time axis, computed completely when it is first needed"""
+    timed = False
+
+    def __init__(self, func, shape, dtype):
+        """
+        :param func: called without arguments, returns the result
+        """
+        super(_Static, self).__init__(shape, dtype)
+        self._func = func
+        self._array = None
+
+    def _value(self):
+        if self._array is None:
+            self._array = np.asarray(self._func(), dtype=self.dtype)
+            self._func = None  # release the expressions it was computed from
+        return self._array
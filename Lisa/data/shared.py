@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Shared memory blocks used to read datasets in parallel and to share preloaded datasets.
+
+The parent process creates a `SharedBlock` for each dataset, worker processes attach to it by
+name and write their part of the dataset directly into it (`read_rows`). The parent then uses
+the block as buffer for a numpy array, no data is copied.
+
+`SharedStore` (`shared_store`) shares preloaded datasets between independent processes on one
+node (e.g. several workers rendering different frames of the same file): the first process
+loading a dataset publishes it in a named block, all others attach to it. Every block has a lock
+file listing the processes using it, the block is removed when the last of them releases it.
+
+Shared memory needs Python 3.8 (multiprocessing.shared_memory). With older versions Lisa can be
+used as before, only reading with worker processes (File.preload_all) raises an error and
+datasets are not shared between processes.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import weakref
+from multiprocessing import util
+
+import h5py as h5
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # no file locks (Windows), datasets are not shared between processes
+    fcntl = None
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python < 3.8, no shared memory
+    resource_tracker = shared_memory = None
+
+
+def require_shared_memory(feature):
+    """
+    Raise an error if shared memory is not available
+    :param feature: description of what needs it (for the error message)
+    """
+    if shared_memory is None:
+        raise RuntimeError("{} needs shared memory (multiprocessing.shared_memory, Python 3.8 "
+                           "or newer).".format(feature))
+
+
+class SharedBlock(shared_memory.SharedMemory if shared_memory is not None else object):
+    """
+    SharedMemory that can be garbage collected while numpy arrays still use its buffer.
+    These arrays keep the memory mapping alive until they are deleted.
+    """
+    def __del__(self):
+        try:
+            self.close()
+        except BufferError:
+            # arrays still use the mapping, only release the file descriptor
+            if getattr(self, "_fd", -1) >= 0:
+                os.close(self._fd)
+                self._fd = -1
+
+
+def shared_array(shape, dtype):
+    """
+    Create a shared memory block and a numpy array using it
+    :param shape: shape of the array
+    :param dtype: dtype of the array
+    :return: (array, block)
+    """
+    require_shared_memory("Creating shared arrays")
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    block = SharedBlock(create=True, size=max(nbytes, 1))
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf), block
+
+
+_open_files = {}  # files opened by a worker process, reused for all its tasks
+
+
+def read_rows(filename, dataset_name, block_name, shape, dtype, start, stop):
+    """
+    Read rows start to stop of a dataset into a shared block (executed in worker processes)
+    :param filename: the hdf5 file
+    :param dataset_name: the name of the dataset in the file
+    :param block_name: the name of the shared block (created with shared_array)
+    :param shape: shape of the dataset
+    :param dtype: dtype of the dataset
+    :param start: first row to read (None for scalar datasets)
+    :param stop: row to stop before
+    :return: number of bytes read
+    """
+    h5file = _open_files.get(filename)
+    if h5file is None:
+        h5file = _open_files[filename] = h5.File(filename, 'r')
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        target = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        if start is None:
+            h5file[dataset_name].read_direct(target)
+        else:
+            selection = np.s_[start:stop]
+            h5file[dataset_name].read_direct(target, selection, selection)
+        nbytes = target[start:stop].nbytes if start is not None else target.nbytes
+        del target
+    finally:
+        block.close()
+    return nbytes
+
+
+def _alive(pid):
+    """Check if a process exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _unlink(block):
+    """Remove a block that is not tracked by the resource tracker (see SharedStore)"""
+    resource_tracker.register(block._name, "shared_memory")  # unlink unregisters it again
+    block.unlink()
+
+
+def _published(name):
+    """Check if a shared block exists without opening it (always True if not possible)"""
+    if os.path.isdir("/dev/shm"):
+        return os.path.exists(os.path.join("/dev/shm", name))
+    return True
+
+
+class _LockedRegistry(object):
+    """
+    Exclusive lock on the lock file of a shared block, holding the list of processes using it
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+
+    def read(self):
+        """Get the processes using the block (dead processes are dropped)"""
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        content = os.read(self._fd, 1 << 20)
+        pids = json.loads(content.decode()) if content else []
+        return [pid for pid in pids if _alive(pid)]
+
+    def write(self, pids):
+        os.ftruncate(self._fd, 0)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, json.dumps(pids).encode())
+
+
+class SharedStore(object):
+    """
+    Named shared memory blocks holding preloaded datasets, shared by all processes on a node.
+
+    Blocks are named after a key (Lisa.File uses (file key, h5 dataset name), the file key
+    contains modification time and size of the file). Arrays are read only. A process attaches
+    to every block only once, the block is released when all arrays using it are deleted (or
+    when the process exits).
+    """
+    header = 64  # bytes before the data, the first one is 1 when the data is complete
+
+    def __init__(self, directory=None):
+        """
+        :param directory: directory for the lock files (None for the temporary directory)
+        """
+        self.directory = tempfile.gettempdir() if directory is None else directory
+        self._arrays = weakref.WeakValueDictionary()
+        self._finalizers = {}  # name -> (pid, finalizer releasing the block)
+        self._exit_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        """Shared blocks can only be used on systems with file locks and shared memory"""
+        return fcntl is not None and shared_memory is not None
+
+    def block_name(self, key):
+        """Name of the shared block for key"""
+        return "lisa_" + hashlib.blake2b(repr(key).encode(), digest_size=10).hexdigest()
+
+    def __len__(self):
+        """Number of blocks this process is attached to"""
+        return len(self._arrays)
+
+    def _attach(self, name, shape, dtype):
+        """Attach to a complete block, None if it does not exist (or is incomplete/stale)"""
+        try:
+            block = SharedBlock(name=name)
+        except FileNotFoundError:
+            return None
+        resource_tracker.unregister(block._name, "shared_memory")  # removed by _release
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if block.buf[0] != 1 or block.size < self.header + nbytes:
+            _unlink(block)  # the publishing process died while loading
+            return None
+        return block
+
+    def _array(self, name, block, shape, dtype):
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=self.header)
+        array.flags.writeable = False
+        # the block stays mapped until the array (and all views of it) are deleted
+        self._finalizers[name] = (os.getpid(), weakref.finalize(array, self._release, name, block))
+        self._arrays[name] = array
+        if self._exit_pid != os.getpid():
+            # also release at exit of multiprocessing workers (they skip atexit handlers)
+            util.Finalize(None, self._release_all, exitpriority=0)
+            self._exit_pid = os.getpid()
+        return array
+
+    def _release_all(self):
+        """Release all blocks attached by this process"""
+        for pid, finalizer in list(self._finalizers.values()):
+            if pid == os.getpid():
+                finalizer()
+
+    def get(self, key, shape, dtype):
+        """
+        Get a dataset published by any process
+        :param key: the key of the dataset
+        :param shape: shape of the dataset
+        :param dtype: dtype of the dataset
+        :return: read only numpy array or None if it is not published
+        """
+        if not self.available:
+            return None
+        dtype = np.dtype(dtype)
+        name = self.block_name(key)
+        with self._lock:
+            array = self._arrays.get(name)
+            if array is not None:
+                return array
+            if not _published(name):  # avoid taking the file lock for every lookup
+                return None
+            with _LockedRegistry(os.path.join(self.directory, name + ".lock")) as registry:
+                block = self._attach(name, shape, dtype)
+                if block is None:
+                    return None
+                registry.write(registry.read() + [os.getpid()])
+            return self._array(name, block, shape, dtype)
+
+    def load(self, key, shape, dtype, read):
+        """
+        Get a dataset, publish it if no process did so far. Other processes trying to load the
+        same dataset wait until it is read completely.
+        :param key: the key of the dataset
+        :param shape: shape of the dataset
+        :param dtype: dtype of the dataset
+        :param read: callable reading the dataset into the array passed to it
+        :return: read only numpy array
+        """
+        dtype = np.dtype(dtype)
+        if not self.available:
+            array = np.empty(shape, dtype=dtype)
+            read(array)
+            return array
+        name = self.block_name(key)
+        with self._lock:
+            array = self._arrays.get(name)
+            if array is not None:
+                return array
+            with _LockedRegistry(os.path.join(self.directory, name + ".lock")) as registry:
+                pids = registry.read()
+                block = self._attach(name, shape, dtype)
+                if block is None:
+                    nbytes = int(np.prod(shape)) * dtype.itemsize
+                    block = SharedBlock(name=name, create=True, size=self.header + max(nbytes, 1))
+                    resource_tracker.unregister(block._name, "shared_memory")
+                    try:
+                        target = np.ndarray(shape, dtype=dtype, buffer=block.buf,
+                                            offset=self.header)
+                        read(target)
+                        del target
+                    except BaseException:
+                        _unlink(block)
+                        raise
+                    block.buf[0] = 1
+                    pids = []
+                registry.write(pids + [os.getpid()])
+            return self._array(name, block, shape, dtype)
+
+    def _release(self, name, block):
+        """Called when the array of a block is deleted, removes the block if nobody uses it"""
+        self._finalizers.pop(name, None)
+        with _LockedRegistry(os.path.join(self.directory, name + ".lock")) as registry:
+            pids = registry.read()
+            if os.getpid() in pids:
+                pids.remove(os.getpid())
+            if not pids:
+                try:
+                    _unlink(block)
+                except FileNotFoundError:
+                    pass
+            registry.write(pids)
+
+
+shared_store = SharedStore()
@@ -257,6 +257,24 @@ def unit_from_spec(spec):
         return unit
 
 
+def factor_from_attrs(attrs, conversion_attribute):
+    """
+    Get a conversion factor from h5 attributes
+    :param attrs: the h5 attrs (or dict like) to search in
+    :param conversion_attribute: the attribute as returned by attr_from_unit
+    :return: the factor or None if attrs do not contain conversion_attribute
+    """
+    if conversion_attribute in attrs:
+        return attrs[conversion_attribute]
+    elif conversion_attribute.startswith("Factor4") and conversion_attribute[7:] in attrs:
+        # for some versions of v14-1
+        return attrs[conversion_attribute[7:]]
+    elif conversion_attribute.startswith("Factor4") and conversion_attribute[7:-1] in attrs:
+        # for some versions of v14-1
+        return attrs[conversion_attribute[7:-1]]
+    return None
+
+
 def calc_stat_mom(axis, profiles):
     import numpy as np
     """
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Lazy views on datasets converted to a physical unit.
+
+Lisa.Data returns a `ScaledView` instead of multiplying the whole dataset with the conversion
+factor. Indexing a view reads only the selected part of the dataset and scales only that part,
+so ``d.phase_space(Axis.DATA, unit="cpnblpnes")[100]`` reads a single snapshot. Everything else
+(numpy functions, arithmetic, array methods like ``tolist``) works on the whole array, which is
+read and scaled once and then kept by the view.
+
+`Accessor` (Lisa.Data.accessor) is a bound, reusable reader for one dataset. Dataset, conversion
+factor and dtype are resolved once, so repeated reads of small selections (e.g. one snapshot per
+movie frame) only pay for the hyperslab read itself.
+
+The dtype of converted data follows a precision policy (config option "precision", overridable
+per Data object and per call):
+
+  - float64: always convert to float64 (default)
+  - float32: always convert to float32
+  - native: keep the dtype stored in the file (float32 for most Inovesa datasets), integer data
+    is converted to float64
+
+Views own their values: a view on a read only source (a shared axis or a memory map) that needs
+no conversion copies it once it is read as a whole. With the config option "share_read_only"
+np.asarray(view) returns the read only source itself instead (no copy).
+"""
+
+import numbers
+
+import h5py as h5
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+from ..internals import config_options
+from .cache import dataset_cache
+from .virtual import VirtualDataset
+
+
+precisions = ("native", "float32", "float64")
+
+
+def result_dtype(dtype, precision=None):
+    """
+    Get the dtype of data converted to a physical unit
+    :param dtype: dtype of the stored data
+    :param precision: one of Lisa.data.views.precisions (None for the config option "precision")
+    :return: numpy dtype
+    """
+    if precision is None:
+        precision = config_options.get("precision")
+    if precision not in precisions:
+        raise ValueError("Unknown precision '{}', use one of {}".format(precision,
+                                                                       ", ".join(precisions)))
+    if precision != "native":
+        return np.dtype(precision)
+    dtype = np.dtype(dtype)
+    return dtype if dtype.kind in "fc" else np.dtype(np.float64)
+
+
+def scale(data, factor, dtype, fresh=False):
+    """
+    Multiply data read from a dataset with a conversion factor
+    :param data: the data (array or scalar)
+    :param factor: the conversion factor
+    :param dtype: dtype of the result
+    :param fresh: data is a new array nobody else uses, it may be scaled in place
+    :return: the scaled data (a new array unless fresh)
+    """
+    fresh = fresh and isinstance(data, np.ndarray) and data.dtype == dtype
+    if factor == 1:
+        if fresh:
+            return data
+        return data.astype(dtype) if hasattr(data, "astype") else np.dtype(dtype).type(data)
+    if fresh:
+        return np.multiply(data, factor, out=data)
+    return np.multiply(data, factor, dtype=dtype)
+
+
+def _is_scalar(value):
+    """True for plain numbers and 0-d numpy arrays"""
+    if isinstance(value, np.ndarray):
+        return value.ndim == 0 and value.dtype.kind in "biufc"
+    return isinstance(value, numbers.Number)
+
+
+class ScaledView(NDArrayOperatorsMixin):
+    """
+    A dataset (h5py.Dataset, virtual dataset or numpy array) multiplied by a factor.
+
+    Supports numpy style indexing, ``shape``, ``dtype``, ``len`` and conversion to numpy arrays.
+    Multiplying or dividing by a number returns a new view without reading data.
+    """
+    def __init__(self, source, factor=None, on_select=None, dtype=None):
+        """
+        :param source: the dataset to scale
+        :param factor: the conversion factor (None for 1.0)
+        :param on_select: callable called with the index before a selection is read
+        :param dtype: dtype of the scaled data (None for the dtype of source * factor, at least
+                float64 if factor is None)
+        """
+        self._source = source
+        self._factor = np.float64(1.0) if factor is None else factor
+        self._on_select = on_select
+        self._array = None  # the whole scaled array once it was needed
+        self._fixed_dtype = dtype is not None
+        self._dtype = np.dtype(dtype) if dtype is not None else self._promoted_dtype()
+
+    def _promoted_dtype(self):
+        return (np.zeros(1, dtype=self._source.dtype) * self._factor).dtype
+
+    @property
+    def source(self):
+        """The unscaled dataset"""
+        return self._source
+
+    @property
+    def factor(self):
+        """The conversion factor"""
+        return self._factor
+
+    @property
+    def shape(self):
+        return tuple(self._source.shape)
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def attrs(self):
+        return self._source.attrs
+
+    @property
+    def name(self):
+        return getattr(self._source, "name", None)
+
+    def _scale(self, data):
+        """Scale data read from source (in place if h5py returned a new array)"""
+        return scale(data, self._factor, self._dtype, isinstance(self._source, h5.Dataset))
+
+    def _materialize(self):
+        if self._array is None:
+            source = self._source
+            if isinstance(source, np.ndarray) and not source.flags.writeable and \
+                    self._factor == 1 and source.dtype == self._dtype:
+                self._array = np.asarray(source)  # read only (shared axis, memory map)
+                if not config_options.get("share_read_only"):
+                    self._array = self._array.copy()
+            else:
+                data = source if isinstance(source, np.ndarray) else source[()]
+                self._array = np.asarray(self._scale(data))
+        return self._array
+
+    def _scaled(self, factor):
+        return ScaledView(self._source, self._factor * factor, self._on_select,
+                          self._dtype if self._fixed_dtype else None)
+
+    def __getitem__(self, key):
+        if self._array is not None:
+            return self._array[key]
+        if self._on_select is not None:
+            self._on_select(key)
+        try:
+            data = self._source[key]
+        except (TypeError, ValueError):
+            # selections numpy supports but h5py does not (unsorted indices, negative steps)
+            if not isinstance(self._source, h5.Dataset):
+                raise
+            return self._materialize()[key]
+        return self._scale(data)
+
+    def read_direct(self, dest, source_sel=None, dest_sel=None):
+        """
+        Read and scale (part of) the data into an existing array, no new array is allocated.
+        Same signature as h5py.Dataset.read_direct.
+        :param dest: the array to write to (C contiguous)
+        :param source_sel: the selection to read (None for everything)
+        :param dest_sel: the part of dest to write to (slices only, None for everything)
+        """
+        target = dest if dest_sel is None else dest[dest_sel]
+        if self._array is not None:
+            target[...] = self._array[() if source_sel is None else source_sel]
+            return
+        if self._on_select is not None and source_sel is not None:
+            self._on_select(source_sel)
+        if hasattr(self._source, "read_direct"):
+            self._source.read_direct(dest, source_sel, dest_sel)
+        else:
+            target[...] = self._source[() if source_sel is None else source_sel]
+        if self._factor != 1:
+            np.multiply(target, self._factor, out=target)
+
+    def _writable(self):
+        """The whole scaled array, copied first if it is shared (read only)"""
+        if not self._materialize().flags.writeable:
+            self._array = self._array.copy()
+        return self._array
+
+    def __setitem__(self, key, value):
+        self._writable()[key] = value
+
+    def __len__(self):
+        if self.ndim == 0:
+            raise TypeError("len() of unsized object")
+        return self.shape[0]
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __bool__(self):
+        return bool(self._materialize())
+
+    def __array__(self, dtype=None, copy=None):
+        array = self._materialize()
+        if dtype is not None:
+            array = array.astype(dtype, copy=False)
+        return array.copy() if copy else array
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method == "__call__" and not kwargs and len(inputs) == 2 and self._array is None:
+            first, second = inputs
+            if ufunc is np.multiply:
+                if first is self and _is_scalar(second):
+                    return self._scaled(second)
+                if second is self and _is_scalar(first):
+                    return self._scaled(first)
+            elif ufunc is np.true_divide and first is self and _is_scalar(second):
+                return self._scaled(1 / second)
+        inputs = tuple(np.asarray(i) if isinstance(i, ScaledView) else i for i in inputs)
+        out = kwargs.get("out")
+        if out is not None:
+            kwargs["out"] = tuple(o._writable() if isinstance(o, ScaledView) else o
+                                  for o in out)
+        result = getattr(ufunc, method)(*inputs, **kwargs)
+        if out is not None and len(out) == 1 and isinstance(out[0], ScaledView):
+            return out[0]
+        return result
+
+    def __imul__(self, other):
+        if self._array is None and _is_scalar(other):
+            self._factor = self._factor * other
+            if not self._fixed_dtype:
+                self._dtype = self._promoted_dtype()
+            return self
+        return super(ScaledView, self).__imul__(other)
+
+    def __itruediv__(self, other):
+        if self._array is None and _is_scalar(other):
+            return self.__imul__(1 / other)
+        return super(ScaledView, self).__itruediv__(other)
+
+    def __getattr__(self, attr):
+        """Everything else (tolist, max, reshape, ...) is taken from the whole scaled array"""
+        if attr.startswith("_"):
+            raise AttributeError("'ScaledView' object has no attribute '" + attr + "'")
+        return getattr(self._materialize(), attr)
+
+    def __repr__(self):
+        return "ScaledView({!r}, factor={!r})".format(self._source, self._factor)
+
+
+class Accessor(object):
+    """
+    Reusable reader for one dataset converted to a unit (see Lisa.Data.accessor).
+
+    ::
+
+        profile = d.accessor("bunch_profile", Axis.DATA, unit="c/s")
+        for i in range(len(profile)):
+            frame = profile[i]  # only snapshot i is read and converted
+
+    The dataset object is resolved again only if the File dropped its handles (chunk cache
+    reopened, File.refresh). Preloaded data (File.preload_full) is used when available.
+    """
+    def __init__(self, data, what, axis, unit=None, precision=None):
+        """
+        :param data: the Lisa.Data object
+        :param what: the group (e.g. bunch_profile)
+        :param axis: the Axis object to select the dataset
+        :param unit: the unit to convert to (None for Inovesa units)
+        :param precision: dtype policy (None for the one of data)
+        """
+        self._file = data._file
+        self.what = what
+        self.axis = axis
+        self.unit = unit.lower() if unit is not None else None
+        dataset = getattr(self._file, what)(axis)
+        factor = data._conversion_factor(self.unit, what, dataset)
+        self.factor = np.float64(1.0) if factor is None else factor
+        self.dtype = result_dtype(dataset.dtype, data.precision if precision is None
+                                  else precision)
+        self._dataset = None
+        self._record = None
+        self._resolve()
+
+    def _resolve(self):
+        self._dataset = None  # release the old handle before the file reopens the dataset
+        self._dataset = self._file._group_dict(self.what, [self.axis])[0][self.axis]
+        # records reads for chunk cache tuning (None if the dataset is not tuned)
+        self._record = self._file._selection_recorder(self.what, self.axis)
+        self._generation = self._file._generation
+        self._cache_key = (self._file._cache_key, self._dataset.name) \
+            if isinstance(self._dataset, (h5.Dataset, VirtualDataset)) else None
+
+    def _source(self):
+        if self._generation != self._file._generation:
+            self._resolve()
+        if self._cache_key is not None:
+            cached = dataset_cache.get(self._cache_key)
+            if cached is not None:
+                return cached
+        return self._dataset
+
+    @property
+    def shape(self):
+        return tuple(self._source().shape)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def chunks(self):
+        """Chunk shape of the dataset (None if it is not chunked)"""
+        return getattr(self._source(), "chunks", None)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        source = self._source()
+        if isinstance(source, h5.Dataset) and self._record is not None:
+            self._record(key)
+            if self._generation != self._file._generation:  # reopened with a larger chunk cache
+                source = None
+                source = self._source()
+        return scale(source[key], self.factor, self.dtype, isinstance(source, h5.Dataset))
+
+    def read_direct(self, dest, source_sel=None, dest_sel=None):
+        """
+        Read and convert (part of) the dataset into an existing array
+        (same signature as h5py.Dataset.read_direct, see ScaledView.read_direct)
+        """
+        self.view().read_direct(dest, source_sel, dest_sel)
+
+    def select(self, out=None, **ranges):
+        """
+        Read a hyperslab given by ranges per axis (see Lisa.File.select)
+        :param out: array to read into (None to allocate a new one)
+        """
+        key = self._file.selection(self.what, self.axis, **ranges)
+        if out is None:
+            return self[key]
+        self.read_direct(out, key)
+        return out
+
+    def view(self):
+        """Get a ScaledView of the whole dataset"""
+        source = self._source()
+        on_select = None
+        if isinstance(source, h5.Dataset):
+            on_select = self._record
+        return ScaledView(source, self.factor, on_select, self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.view().__array__(dtype, copy)
+
+    def __repr__(self):
+        return "<Lisa accessor {}({}) in {} ({})>".format(self.what, self.axis, self.unit,
+                                                         self.dtype)
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Virtual datasets are computed from other datasets on access.
+
+They expose the parts of the h5py.Dataset interface that Lisa uses (shape, dtype, attrs, name,
+indexing and conversion to numpy arrays) so they can be used wherever Lisa.File returns an
+h5py.Dataset. Only the requested part is read and computed when indexed. This is used to
+correct data of old Inovesa versions without loading whole datasets.
+"""
+
+import numbers
+
+import numpy as np
+
+from .utils import calc_bl
+
+
+def expand_key(key, ndim):
+    """
+    Normalize an index to a tuple without Ellipsis
+    :param key: the index (anything usable to index a numpy array, except None/newaxis)
+    :param ndim: number of dimensions of the indexed object
+    :return: tuple with at most ndim entries
+    """
+    if not isinstance(key, tuple):
+        key = (key,)
+    if any(k is None for k in key):
+        raise IndexError("newaxis is not supported for virtual datasets")
+    ellipsis = [i for i, k in enumerate(key) if k is Ellipsis]
+    if len(ellipsis) > 1:
+        raise IndexError("an index can only have a single ellipsis ('...')")
+    if ellipsis:
+        i = ellipsis[0]
+        fill = (slice(None),) * (ndim - len(key) + 1)
+        key = key[:i] + fill + key[i + 1:]
+    if len(key) > ndim:
+        raise IndexError("too many indices for dataset")
+    return key
+
+
+def take_rows(source, rows, rest=()):
+    """
+    Read rows (first axis) of source in the order given. Rows are read sorted and without
+    duplicates (as required by h5py) and reordered afterwards.
+    :param source: the dataset or array to read from
+    :param rows: array of non negative row indices
+    :param rest: index for the remaining axes
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if rows.size == 0:
+        return source[(slice(0, 0),) + tuple(rest)]
+    unique, inverse = np.unique(rows, return_inverse=True)
+    data = source[(unique,) + tuple(rest)]
+    if len(unique) == len(rows) and np.all(inverse == np.arange(len(rows))):
+        return data
+    return data[inverse]
+
+
+def row_indices(first, length):
+    """
+    Convert an index array or boolean mask for the first axis to non negative row indices
+    :param first: the index
+    :param length: length of the first axis
+    """
+    rows = np.asarray(first)
+    if rows.dtype == bool:
+        return np.flatnonzero(rows)
+    rows = np.where(rows < 0, rows + length, rows)
+    if np.any(rows < 0) or np.any(rows >= length):
+        raise IndexError("index out of range for first axis with length {}".format(length))
+    return rows
+
+
+class VirtualDataset(object):
+    """
+    Base class for datasets that are computed on access.
+
+    Subclasses implement shape and _read(key) where key is a tuple without Ellipsis.
+    """
+    def __init__(self, dtype, attrs, name):
+        self.dtype = np.dtype(dtype)
+        self.attrs = attrs
+        self.name = name
+
+    @property
+    def shape(self):
+        raise NotImplementedError
+
+    @property
+    def chunks(self):
+        return None
+
+    @property
+    def sources(self):
+        """The datasets this dataset is computed from"""
+        return ()
+
+    def refresh(self):
+        """Refresh the sources (for files opened in SWMR mode, see h5py.Dataset.refresh)"""
+        for source in self.sources:
+            if hasattr(source, 'refresh'):
+                source.refresh()
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _read(self, key):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        return self._read(expand_key(key, self.ndim))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None, copy=None):
+        data = np.asarray(self[()])
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+    def read_direct(self, dest, source_sel=None, dest_sel=None):
+        """Read into an existing array (same as h5py.Dataset.read_direct)"""
+        dest[() if dest_sel is None else dest_sel] = self[() if source_sel is None else source_sel]
+
+    def __repr__(self):
+        return "<Lisa virtual dataset {} (shape {}, type {})>".format(self.name, self.shape,
+                                                                     self.dtype)
+
+
+class OffsetDataset(VirtualDataset):
+    """Rows start to stop (first axis) of another dataset"""
+    def __init__(self, source, start=0, stop=None, attrs=None, name=None):
+        """
+        :param source: the dataset to take rows from
+        :param start: first row of source to use
+        :param stop: row to stop before (None for the end of source, also if source grows)
+        :param attrs: attrs to use (default: attrs of source)
+        :param name: name to use (default: name of source)
+        """
+        super(OffsetDataset, self).__init__(source.dtype,
+                                            source.attrs if attrs is None else attrs,
+                                            source.name if name is None else name)
+        self._source = source
+        self._start = start
+        self._stop = stop
+
+    @property
+    def sources(self):
+        return (self._source,)
+
+    @property
+    def shape(self):
+        length = len(self._source) if self._stop is None else min(self._stop, len(self._source))
+        return (max(0, length - self._start),) + tuple(self._source.shape[1:])
+
+    @property
+    def chunks(self):
+        return getattr(self._source, 'chunks', None)
+
+    def _read(self, key):
+        if len(key) == 0:
+            key = (slice(None),)
+        first, rest = key[0], key[1:]
+        length = len(self)
+        if isinstance(first, numbers.Integral):
+            idx = first + length if first < 0 else first
+            if not 0 <= idx < length:
+                raise IndexError("index {} is out of range for first axis with length {}".format(
+                    first, length))
+            return self._source[(self._start + idx,) + rest]
+        if isinstance(first, slice):
+            start, stop, step = first.indices(length)
+            if step > 0:
+                return self._source[(slice(self._start + start, self._start + max(start, stop),
+                                           step),) + rest]
+            rows = np.arange(start, stop, step)
+        else:
+            rows = row_indices(first, length)
+        return take_rows(self._source, rows + self._start, rest)
+
+
+class TransformedDataset(VirtualDataset):
+    """Another dataset with an elementwise function (e.g. numpy.sqrt) applied"""
+    def __init__(self, source, func, attrs=None, name=None):
+        """
+        :param source: the dataset to transform
+        :param func: elementwise function applied to each read selection
+        :param attrs: attrs to use (default: attrs of source)
+        :param name: name to use (default: name of source)
+        """
+        super(TransformedDataset, self).__init__(func(np.zeros(1, dtype=source.dtype)).dtype,
+                                                 source.attrs if attrs is None else attrs,
+                                                 source.name if name is None else name)
+        self._source = source
+        self._func = func
+
+    @property
+    def sources(self):
+        return (self._source,)
+
+    @property
+    def shape(self):
+        return tuple(self._source.shape)
+
+    @property
+    def chunks(self):
+        return getattr(self._source, 'chunks', None)
+
+    def _read(self, key):
+        return self._func(self._source[key])
+
+
+class BunchLengthDataset(VirtualDataset):
+    """
+    Bunch length calculated from the bunch profiles (standard deviation of each profile).
+    Used for Inovesa versions that saved wrong bunch lengths (Inovesa bug 24).
+    """
+    block = 4096  # number of profiles to calculate at once
+
+    def __init__(self, profiles, axis, attrs, name):
+        """
+        :param profiles: the bunch profile dataset (time x space)
+        :param axis: the space axis of the bunch profiles
+        :param attrs: attrs to use (those of the saved bunch length)
+        :param name: name to use (that of the saved bunch length)
+        """
+        super(BunchLengthDataset, self).__init__(np.float64, attrs, name)
+        self._profiles = profiles
+        self._axis = axis
+        self._axis_values = None
+
+    @property
+    def sources(self):
+        return (self._profiles, self._axis)
+
+    def refresh(self):
+        super(BunchLengthDataset, self).refresh()
+        self._axis_values = None
+
+    @property
+    def shape(self):
+        return (len(self._profiles),)
+
+    @property
+    def chunks(self):
+        chunks = getattr(self._profiles, 'chunks', None)
+        return None if chunks is None else chunks[:1]
+
+    def _calc(self, profiles):
+        if self._axis_values is None:
+            self._axis_values = np.asarray(self._axis)
+        if len(profiles) == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.concatenate([calc_bl(self._axis_values, profiles[i:i + self.block])
+                               for i in range(0, len(profiles), self.block)]).astype(self.dtype)
+
+    def _read(self, key):
+        first = key[0] if len(key) > 0 else slice(None)
+        length = len(self)
+        if isinstance(first, numbers.Integral):
+            idx = first + length if first < 0 else first
+            if not 0 <= idx < length:
+                raise IndexError("index {} is out of range for axis with length {}".format(
+                    first, length))
+            return self._calc(np.asarray(self._profiles[idx:idx + 1]))[0]
+        if isinstance(first, slice):
+            start, stop, step = first.indices(length)
+            if step > 0:
+                return self._calc(np.asarray(self._profiles[start:max(start, stop):step]))
+            rows = np.arange(start, stop, step)
+        else:
+            rows = row_indices(first, length)
+        return self._calc(np.asarray(take_rows(self._profiles, rows)))
+
+
+class ConcatDataset(VirtualDataset):
+    """Datasets concatenated along the first axis (e.g. the time axis of continuation runs)"""
+    def __init__(self, parts, attrs=None, name=None):
+        """
+        :param parts: the datasets (the shapes may only differ in the first axis)
+        :param attrs: attrs to use (default: attrs of the first part)
+        :param name: name to use (default: name of the first part)
+        """
+        super(ConcatDataset, self).__init__(np.result_type(*[p.dtype for p in parts]),
+                                            parts[0].attrs if attrs is None else attrs,
+                                            parts[0].name if name is None else name)
+        self._parts = list(parts)
+
+    @property
+    def sources(self):
+        return tuple(self._parts)
+
+    @property
+    def shape(self):
+        return (sum(len(p) for p in self._parts),) + tuple(self._parts[0].shape[1:])
+
+    @property
+    def chunks(self):
+        return getattr(self._parts[0], 'chunks', None)
+
+    def _bounds(self):
+        """First row of each part and the total length"""
+        return np.cumsum([0] + [len(p) for p in self._parts])
+
+    def _read(self, key):
+        if len(key) == 0:
+            key = (slice(None),)
+        first, rest = key[0], key[1:]
+        bounds = self._bounds()
+        length = int(bounds[-1])
+        if isinstance(first, numbers.Integral):
+            idx = first + length if first < 0 else first
+            if not 0 <= idx < length:
+                raise IndexError("index {} is out of range for first axis with length {}".format(
+                    first, length))
+            part = int(np.searchsorted(bounds, idx, side="right")) - 1
+            return np.asarray(self._parts[part][(idx - int(bounds[part]),) + rest],
+                              dtype=self.dtype)
+        if isinstance(first, slice) and first.indices(length)[2] > 0:
+            start, stop, step = first.indices(length)
+            pieces = []
+            for part, begin, end in zip(self._parts, bounds[:-1], bounds[1:]):
+                # first row of the selection in this part
+                row = start + max(0, -(-(int(begin) - start) // step)) * step
+                if row < min(stop, end):
+                    pieces.append(part[(slice(row - int(begin), min(stop, end) - int(begin),
+                                              step),) + rest])
+            if not pieces:
+                return np.asarray(self._parts[0][(slice(0, 0),) + rest], dtype=self.dtype)
+            return np.concatenate([np.asarray(p, dtype=self.dtype) for p in pieces])
+        if isinstance(first, slice):
+            rows = np.arange(*first.indices(length))
+        else:
+            rows = row_indices(first, length)
+        parts = np.searchsorted(bounds, rows, side="right") - 1
+        result = None
+        for part in np.unique(parts):
+            mask = parts == part
+            data = take_rows(self._parts[part], rows[mask] - bounds[part], rest)
+            if result is None:
+                result = np.empty((len(rows),) + data.shape[1:], dtype=self.dtype)
+            result[mask] = data
+        if result is None:
+            return np.asarray(self._parts[0][(slice(0, 0),) + rest], dtype=self.dtype)
+        return result
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Polling watcher for directories with result files that are still being written.
+
+During parameter scans new result files appear every few minutes. `Watcher` refreshes a
+Lisa.MultiFile periodically (MultiFile.refresh only reads new or changed files) and reports
+files once they are complete: a new or modified file counts as complete when its state on disk
+(modification time and size, also of the .cfg file) did not change for `settle` seconds.
+"""
+
+import threading
+import time
+import traceback
+import warnings
+
+
+class Watcher(threading.Thread):
+    """
+    Background thread calling MultiFile.refresh every interval seconds.
+    Use MultiFile.watch to create one.
+    """
+    def __init__(self, multifile, callback, interval, settle):
+        """
+        :param multifile: the MultiFile to refresh
+        :param callback: called with the list of completed files
+        :param interval: seconds between two refreshs
+        :param settle: seconds a file has to stay unchanged to be complete
+        """
+        super(Watcher, self).__init__(name="Lisa watcher " + str(multifile.path), daemon=True)
+        self.multifile = multifile
+        self.callback = callback
+        self.interval = interval
+        self.settle = settle
+        self._pending = {}  # filename -> (state, time this state was first seen)
+        self._stopped = threading.Event()
+
+    def poll(self, now=None):
+        """
+        Refresh the MultiFile once
+        :param now: the current time (time.monotonic) to use
+        :return: list of files that are complete since the last poll
+        """
+        now = time.monotonic() if now is None else now
+        added, removed, modified = self.multifile.refresh()
+        for filename in removed:
+            self._pending.pop(filename, None)
+        for filename in added + modified:
+            self._pending[filename] = (self.multifile.state(filename), now)
+        completed = [f for f, (_, since) in self._pending.items() if now - since >= self.settle]
+        for filename in completed:
+            del self._pending[filename]
+        return completed
+
+    @property
+    def pending(self):
+        """Files that are new or changed but not complete yet"""
+        return list(self._pending)
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                completed = self.poll()
+                if completed:
+                    self.callback(completed)
+            except Exception:
+                warnings.warn("Watching '{}' failed:\n{}".format(self.multifile.path,
+                                                                 traceback.format_exc()))
+
+    def stop(self, timeout=None):
+        """
+        Stop watching
+        :param timeout: seconds to wait for the thread to finish (None to wait until it did)
+        """
+        self._stopped.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Write new Inovesa result files from existing ones.
+
+`rechunk` copies a result file with a chunk layout that fits the way Lisa reads the data.
+All groups, datasets and attributes (including /Info with the axes and the Inovesa version)
+are copied, so the new file can be used with Lisa.File just like the original one.
+`reduce` writes a smaller result file with every n-th snapshot of a time range, cropped
+axes and downcast data, that is used with Lisa.File like the original one.
+Data is streamed in blocks of snapshots, the memory used is bounded by max_bytes.
+"""
+
+import json
+import os
+import shutil
+import time
+
+import h5py as h5
+import numpy as np
+
+from .catalog import cfg_for
+from .file import File, Axis, DataError, DataNotInFile
+from .utils import version9_1
+
+
+layouts = ("snapshot", "timeseries", "balanced", "contiguous")
+
+
+def chunk_shape(shape, itemsize, layout, target=2 ** 20, max_rows=None):
+    """
+    Get the chunk shape for a dataset
+
+      - snapshot: each chunk holds whole snapshots (first axis is time)
+      - timeseries: each chunk holds long time series of few pixels/bins
+      - balanced: chunk extends about equally over all axes
+      - contiguous: no chunks (None)
+
+    :param shape: shape of the dataset
+    :param itemsize: size of one element in bytes
+    :param layout: one of Lisa.data.writer.layouts
+    :param target: approximate chunk size in bytes
+    :param max_rows: maximal extent of the chunk in the first axis
+    :return: chunk shape (tuple) or None for contiguous storage
+    """
+    if layout not in layouts:
+        raise ValueError("Unknown layout '{}', use one of {}".format(layout, ", ".join(layouts)))
+    if layout == "contiguous" or len(shape) == 0 or 0 in shape:
+        return None
+    elements = max(1, target // itemsize)
+    rows = shape[0] if max_rows is None else max(1, min(shape[0], max_rows))
+    if len(shape) == 1:
+        chunks = [min(rows, elements)]
+    elif layout == "snapshot":
+        snapshot = int(np.prod(shape[1:]))
+        chunks = [min(rows, max(1, elements // snapshot))] + list(shape[1:])
+        # very large snapshots are split along the second axis
+        if snapshot > elements:
+            chunks[1] = max(1, shape[1] * elements // snapshot)
+    elif layout == "timeseries":
+        chunks = [min(rows, elements)]
+        left = max(1, elements // chunks[0])
+        for dim in shape[1:]:
+            chunks.append(min(dim, left))
+            left = max(1, left // chunks[-1])
+    else:
+        side = max(1, int(round(elements ** (1.0 / len(shape)))))
+        chunks = [min(rows, side)] + [min(dim, side) for dim in shape[1:]]
+    return tuple(chunks)
+
+
+def _copy_links(source, destination):
+    """Copy the soft links of a group (e.g. axis0 -> /Info/AxisValues_t)"""
+    for name in source:
+        link = source.get(name, getlink=True)
+        if isinstance(link, h5.SoftLink):
+            destination[name] = h5.SoftLink(link.path)
+
+
+def _copy_dataset(source, parent, name, layout, compression, compression_opts, shuffle,
+                  max_bytes):
+    """Stream a dataset into parent with the given layout, return number of bytes copied"""
+    if source.dtype.kind not in "biufc" or source.ndim == 0 or source.size == 0:
+        parent.copy(source, name)  # nothing to rechunk, copy as is
+        return source.size * source.dtype.itemsize
+    row_bytes = int(np.prod(source.shape[1:])) * source.dtype.itemsize
+    max_rows = max(1, max_bytes // row_bytes)
+    chunks = chunk_shape(source.shape, source.dtype.itemsize, layout, max_rows=max_rows)
+    kwargs = {}
+    if chunks is not None:
+        # unlimited dimensions (e.g. time) stay unlimited, contiguous datasets can not be resized
+        kwargs = dict(chunks=chunks, maxshape=source.maxshape, compression=compression,
+                      compression_opts=compression_opts,
+                      shuffle=shuffle and compression is not None)
+    target = parent.create_dataset(name, shape=source.shape, dtype=source.dtype, **kwargs)
+    for key, value in source.attrs.items():
+        target.attrs[key] = value
+    # whole chunks along the first axis so every chunk is written once
+    rows = max_rows if chunks is None else max(1, max_rows // chunks[0]) * chunks[0]
+    buffer = np.empty((min(rows, source.shape[0]),) + source.shape[1:], dtype=source.dtype)
+    for start in range(0, source.shape[0], rows):
+        stop = min(start + rows, source.shape[0])
+        block = buffer[:stop - start]
+        source.read_direct(block, np.s_[start:stop], np.s_[:stop - start])
+        target.write_direct(block, np.s_[:stop - start], np.s_[start:stop])
+    return source.size * source.dtype.itemsize
+
+
+def _time_read(filename, name, key, repeat=3):
+    """Best time of reading dataset name[key] from filename (seconds)"""
+    best = None
+    for _ in range(repeat):
+        with h5.File(filename, 'r', rdcc_nbytes=0) as f:
+            start = time.perf_counter()
+            f[name][key]
+            duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def read_benchmark(src, dst, dataset=None, repeat=3):
+    """
+    Compare read times of the two dominant access patterns of Lisa in two files
+    (whole snapshots and the time series of a single pixel/bin).
+    :param src: the original file
+    :param dst: the rechunked file
+    :param dataset: the dataset to use (None for the largest dataset with at least 2 dimensions)
+    :param repeat: number of repetitions (the best time is used)
+    :return: dictionary access pattern -> {"source": s, "destination": s, "speedup": x}
+    """
+    with h5.File(src, 'r') as f:
+        if dataset is None:
+            candidates = []
+            f.visititems(lambda n, o: candidates.append((o.size, n))
+                         if isinstance(o, h5.Dataset) and o.ndim >= 2 and o.size > 0 else None)
+            if not candidates:
+                return {}
+            dataset = max(candidates)[1]
+        shape = f[dataset].shape
+    center = tuple(d // 2 for d in shape[1:])
+    patterns = {
+        "snapshot": np.s_[shape[0] // 2],
+        "timeseries": (slice(None),) + center,
+    }
+    report = {"dataset": dataset}
+    for pattern, key in patterns.items():
+        source = _time_read(src, dataset, key, repeat)
+        destination = _time_read(dst, dataset, key, repeat)
+        report[pattern] = {"source": source, "destination": destination,
+                           "speedup": source / destination if destination > 0 else float("inf")}
+    return report
+
+
+def rechunk(src, dst, layout="balanced", compression="gzip", compression_opts=None,
+            shuffle=True, max_bytes=256 * 2 ** 20, benchmark=True):
+    """
+    Copy an Inovesa result file with a chunk layout optimized for the way the data is read.
+
+    ::
+
+        report = Lisa.rechunk("/path/to/result.h5", "/path/to/movie.h5", layout="snapshot")
+        report["benchmark"]["snapshot"]["speedup"]
+
+    :param src: the original file
+    :param dst: the new file (will be overwritten)
+    :param layout: "snapshot" for movies/single snapshots, "timeseries" for long time series of
+            single pixels/bins (spectra), "balanced" or "contiguous" (no chunks, no compression,
+            allows memory mapping)
+    :param compression: compression filter (as accepted by h5py, e.g. "gzip", "lzf" or None)
+    :param compression_opts: options for the compression filter (e.g. gzip level)
+    :param shuffle: use the shuffle filter with compression
+    :param max_bytes: maximal size of the blocks read at once (at least one snapshot is read)
+    :param benchmark: compare read speeds of source and destination (see read_benchmark)
+    :return: dictionary with number of datasets and bytes copied, time used and the benchmark
+    """
+    if layout not in layouts:
+        raise ValueError("Unknown layout '{}', use one of {}".format(layout, ", ".join(layouts)))
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise ValueError("Source and destination have to be different files.")
+    report = {"layout": layout, "datasets": 0, "bytes": 0}
+    start = time.perf_counter()
+    with h5.File(src, 'r') as source, h5.File(dst, 'w') as target:
+        for key, value in source.attrs.items():
+            target.attrs[key] = value
+        _copy_links(source, target)
+
+        def copy(name, obj):
+            if isinstance(obj, h5.Group):
+                group = target.require_group(name)
+                for key, value in obj.attrs.items():
+                    group.attrs[key] = value
+                _copy_links(obj, group)
+            elif isinstance(obj, h5.Dataset):
+                parent, _, base = name.rpartition("/")
+                report["bytes"] += _copy_dataset(obj, target.require_group(parent or "/"), base,
+                                                 layout, compression, compression_opts, shuffle,
+                                                 max_bytes)
+                report["datasets"] += 1
+        source.visititems(copy)
+    report["time"] = time.perf_counter() - start
+    if benchmark:
+        report["benchmark"] = read_benchmark(src, dst)
+    return report
+
+
+# relative threshold for crop="auto": values below threshold * peak are cut off
+auto_crop_threshold = 1e-3
+
+
+def _group_for(f, axis):
+    """Get a group of f that has axis (used to convert ranges on axis to indices)"""
+    for what in sorted(f._met2gr):
+        if what != "parameters" and f.file.get(f._met2gr[what]) is not None and \
+                axis in f.select_axis.all_for(what):
+            return what
+    raise DataNotInFile("No group in '{}' has the axis '{}'.".format(f.filename, axis))
+
+
+def _support(f, what, axis, rows):
+    """
+    Indices along axis where the data of group what exceeds auto_crop_threshold times its peak
+    in any of the selected time rows
+    :param rows: boolean mask of the time rows to use
+    :return: slice or None if group what is not in the file or empty
+    """
+    if what not in f._met2gr or f.file.get(f._met2gr[what]) is None:
+        return None
+    dim = f.select_axis.dims_for(what).index(axis)
+    peak = None
+    start = 0
+    for _, block in f.iter_time(what):
+        selected = rows[start:start + len(block)]
+        start += len(block)
+        if not selected.any():
+            continue
+        other = tuple(d for d in range(block.ndim) if d != dim)
+        block_peak = np.abs(block[selected]).max(axis=other)
+        peak = block_peak if peak is None else np.maximum(peak, block_peak)
+    if peak is None or peak.max() <= 0:
+        return None
+    indices = np.flatnonzero(peak >= auto_crop_threshold * peak.max())
+    return slice(int(indices[0]), int(indices[-1]) + 1)
+
+
+def _dataset_dims(f, what, elem, ndim):
+    """
+    Get the axis along each dimension of a dataset (None for dimensions without axis).
+    Datasets with more dimensions than axes (e.g. particles) have their axes first if time is one
+    of them and last otherwise.
+    """
+    dims = f.select_axis.dims_for(what, elem)
+    if len(dims) >= ndim:
+        return dims[:ndim]
+    if Axis.TIME in dims:
+        return dims + [None] * (ndim - len(dims))
+    return [None] * (ndim - len(dims)) + dims
+
+
+def _reduce_dataset(source, parent, name, key, dtype, max_bytes):
+    """Stream source[key] into parent converted to dtype, return number of bytes written"""
+    shape = tuple(len(range(n)[k]) for n, k in zip(source.shape, key))
+    kwargs = {}
+    if source.chunks is not None:
+        chunks = tuple(min(c, max(1, n)) for c, n in zip(source.chunks, shape))
+        # unlimited dimensions (e.g. time) stay unlimited
+        maxshape = tuple(None if m is None else max(c, n)
+                         for m, c, n in zip(source.maxshape, chunks, shape))
+        kwargs = dict(chunks=chunks, maxshape=maxshape, compression=source.compression,
+                      compression_opts=source.compression_opts, shuffle=source.shuffle)
+    target = parent.create_dataset(name, shape=shape, dtype=dtype, **kwargs)
+    for attr, value in source.attrs.items():
+        target.attrs[attr] = value
+    if target.size == 0:
+        return 0
+    rows = range(source.shape[0])[key[0]]
+    row_bytes = int(np.prod(shape[1:])) * target.dtype.itemsize
+    block_rows = max(1, max_bytes // max(1, row_bytes))
+    if source.chunks is not None:  # whole chunks along the first axis of the target
+        block_rows = max(1, block_rows // target.chunks[0]) * target.chunks[0]
+    for start in range(0, len(rows), block_rows):
+        block = rows[start:start + block_rows]
+        data = source[(slice(block.start, block[-1] + 1, block.step),) + tuple(key[1:])]
+        target[start:start + len(block)] = data.astype(target.dtype, copy=False)
+    return target.size * target.dtype.itemsize
+
+
+def reduce(src, dst, time_stride=1, time_range=None, crop=None, dtype="float32", groups=None,
+           max_bytes=256 * 2 ** 20):
+    """
+    Write a smaller copy of an Inovesa result file: every time_stride-th snapshot of time_range,
+    axes cropped to the interesting part and floating point data downcast to dtype.
+
+    ::
+
+        Lisa.reduce("/path/to/result.h5", "/path/to/small.h5", time_stride=10, crop="auto",
+                    groups=["phase_space", "bunch_profile", "csr_spectrum"])
+
+    The axes in /Info are reduced the same way, attributes (unit factors), links, parameters
+    and the Inovesa version are kept (the .cfg file is copied as well), so the new file is used
+    with File, Data and SimplePlotter like the original one. Datasets whose length along an axis
+    differs from the length of that axis (e.g. phase spaces saved only at the start and the end)
+    are not reduced along it. Inovesa 0.9.1 files are not supported.
+
+    :param src: the original file
+    :param dst: the new file (will be overwritten)
+    :param time_stride: keep every time_stride-th snapshot
+    :param time_range: time range to keep as (lower, upper[, unit]) or slice (see File.select)
+    :param crop: None, "auto" to crop space and energy axes to where bunch profile and energy
+            profile (or the phase space) exceed auto_crop_threshold times their peak, or a
+            dictionary with ranges per axis, e.g. {"x": (-20e-12, 20e-12, "s"), "f": (0, 2e12)}
+    :param dtype: floating point data with a larger type is converted to this dtype (axes keep
+            their type, None to keep all types)
+    :param groups: list of groups to write (e.g. ["phase_space"], None for all groups)
+    :param max_bytes: maximal size of the blocks read at once (at least one snapshot is read)
+    :return: dictionary with number of datasets and bytes written, the selections and time used
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise ValueError("Source and destination have to be different files.")
+    if time_stride < 1:
+        raise ValueError("time_stride has to be at least 1.")
+    start = time.perf_counter()
+    with File(src, threads=0) as f:
+        if f.version == version9_1:
+            raise DataError("Inovesa 0.9.1 files can not be reduced.")
+        lengths = {axis: f.file[path].shape[0]
+                   for axis, path in f.select_axis._axis_datasets.items()
+                   if f.file.get(path) is not None}
+
+        time_key = slice(None)
+        if time_range is not None:
+            time_key = f.selection(_group_for(f, Axis.TIME), Axis.TIME, t=time_range)[0]
+        rows = range(lengths.get(Axis.TIME, 0))[time_key][::time_stride]
+        if rows.step < 0:
+            raise ValueError("time_range has to select increasing times.")
+        keys = {Axis.TIME: slice(rows.start, rows.stop, rows.step)}
+
+        if crop == "auto":
+            mask = np.zeros(lengths.get(Axis.TIME, 0), dtype=bool)
+            mask[keys[Axis.TIME]] = True
+            for axis, candidates in ((Axis.XAXIS, ("bunch_profile", "phase_space")),
+                                     (Axis.EAXIS, ("energy_profile", "phase_space"))):
+                for what in candidates:
+                    support = _support(f, what, axis, mask)
+                    if support is not None:
+                        keys[axis] = support
+                        break
+        elif crop is not None:
+            for name, rng in crop.items():
+                axis = f.select_axis.short_names.get(name, name)
+                if axis == Axis.TIME or axis not in lengths:
+                    raise DataNotInFile("Can not crop axis '{}'.".format(name))
+                keys[axis] = f.selection(_group_for(f, axis), axis, **{name: rng})[0]
+
+        names = {v: k for k, v in f._met2gr.items() if k != "parameters"}
+        if groups is not None:
+            unknown = [what for what in groups if what not in f._met2gr]
+            if unknown:
+                raise DataNotInFile("'{}' does not exist in file.".format(", ".join(unknown)))
+            names = {f._met2gr[what]: what for what in groups}
+        axes = {path.lstrip("/"): axis for axis, path in f.select_axis._axis_datasets.items()}
+
+        report = {"datasets": 0, "bytes": 0,
+                  "selection": {axis: (k.start, k.stop, k.step) for axis, k in keys.items()}}
+        with h5.File(dst, 'w') as target:
+            def group_of(name):
+                """(method name, group name) of the group containing name or None"""
+                for group, what in names.items():
+                    if name == group or name.startswith(group + "/") or \
+                            group.startswith(name + "/"):
+                        return what, group
+                return None
+
+            def copy_attrs(source, destination):
+                for key, value in source.attrs.items():
+                    destination.attrs[key] = value
+
+            def copy(name, obj):
+                info = name == "Info" or name.startswith("Info/")
+                found = None if info else group_of(name)
+                if not info and found is None:
+                    return
+                if isinstance(obj, h5.Group):
+                    group = target.require_group(name)
+                    copy_attrs(obj, group)
+                    _copy_links(obj, group)
+                    return
+                parent, _, base = name.rpartition("/")
+                parent = target.require_group(parent or "/")
+                if obj.dtype.kind not in "biufc" or obj.ndim == 0:
+                    parent.copy(obj, base)
+                    return
+                out = obj.dtype
+                if info:
+                    dims = [axes.get(name)]
+                else:
+                    what, group = found
+                    if name.startswith(group + "/"):
+                        elems = {f.select_axis(e, what): e for e in f.select_axis.all_for(what)}
+                        dims = _dataset_dims(f, what, elems.get(name[len(group) + 1:], Axis.DATA),
+                                             obj.ndim)
+                    else:  # a group containing a selected group
+                        dims = []
+                    if dtype is not None and obj.dtype.kind == "f" and \
+                            obj.dtype.itemsize > np.dtype(dtype).itemsize:
+                        out = np.dtype(dtype)
+                dims = list(dims) + [None] * (obj.ndim - len(dims))
+                key = tuple(keys[dim] if dim in keys and lengths.get(dim) == n else slice(None)
+                            for dim, n in zip(dims, obj.shape))
+                report["bytes"] += _reduce_dataset(obj, parent, base, key, out, max_bytes)
+                report["datasets"] += 1
+
+            copy_attrs(f.file, target)
+            _copy_links(f.file, target)
+            f.file.visititems(copy)
+            target.attrs["Lisa_reduced"] = json.dumps({
+                "source": os.path.abspath(src), "time_stride": time_stride,
+                "selection": report["selection"],
+                "dtype": None if dtype is None else np.dtype(dtype).name})
+    cfg = cfg_for(src)
+    if cfg is not None:
+        shutil.copy(cfg, dst + ".cfg" if cfg == src + ".cfg" else os.path.splitext(dst)[0] + ".cfg")
+    report["time"] = time.perf_counter() - start
+    return report
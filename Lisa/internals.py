@@ -5,7 +5,12 @@ import os
 class _ConfOptions(object):
     def __init__(self):
         self.config = {}
-        self.valid_options = {"print_debug": False, "use_cython": True, "use_latex": False}
+        self.valid_options = {"print_debug": False, "use_cython": True, "use_latex": False,
+                              "cache_budget": 1024**3, "use_mmap": True,
+                              "chunk_cache_tuning": True, "chunk_cache_max": 256 * 1024**2,
+                              "precision": "float64", "decode_threads": 0,
+                              "use_shared_store": False, "max_open_files": 64,
+                              "clamp_time": False, "share_read_only": False}
         for k, v in self.valid_options.items():
             if k in os.environ:
                 if type(v) == bool:
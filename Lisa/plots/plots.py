@@ -89,8 +89,10 @@ class SimplePlotter(object):
                     mi = None
                     ma = None
                 else:
-                    mi = np.min(data_func(Axis.DATA, unit=kwargs.get("zunit")))
-                    ma = np.max(data_func(Axis.DATA, unit=kwargs.get("zunit")))
+                    mi, ma = np.inf, -np.inf
+                    for _, block in self._data.iter_time(meshfunc.__name__, kwargs.get("zunit"),
+                                                         precision="native"):
+                        mi, ma = min(mi, np.min(block)), max(ma, np.max(block))
                     pref = obj._get_metric_prefix([mi, ma])
                     mi /= pref[1]
                     ma /= pref[1]
@@ -123,9 +125,25 @@ class SimplePlotter(object):
         else:
             self._file = File(filef)
         self._data = Data(self._file)
+        self._frame_readers = {}  # (group, axis, unit) -> reader used by unit_function
         self.current = self._file.parameters("BunchCurrent")
         self.unit_connector = unit_connector
 
+    def __getstate__(self):
+        """
+        Pickled with the File object (see File.__getstate__), the file is reopened lazily.
+        The video methods are created again when unpickling (see SimplePlotter.__new__).
+        """
+        return {"file": self._file, "current": self.current,
+                "unit_connector": self.unit_connector}
+
+    def __setstate__(self, state):
+        self._file = state["file"]
+        self._data = Data(self._file)
+        self._frame_readers = {}
+        self.current = state["current"]
+        self.unit_connector = state["unit_connector"]
+
     def plot(func):
         """
         Decorator to reuse plotting methods for different data. Calling one of the actual plot
@@ -297,7 +315,10 @@ class SimplePlotter(object):
 
             if kwargs.get("mean_range", None) is not None:
                 range = kwargs.get("mean_range")
-                z_mean = np.mean(z[range[0]:range[1]], axis=0)
+                if hasattr(z, 'unit_function'):
+                    z_mean = np.mean(z.unit_function(slice(range[0], range[1])), axis=0)
+                else:
+                    z_mean = np.mean(z[range[0]:range[1]], axis=0)
                 zlabel += " (mean over range {})".format(range)
 
                 @SimplePlotter.plot
@@ -375,17 +396,37 @@ class SimplePlotter(object):
         if gen_sub:
             d = getattr(self._data, data + "_raw")(idx)
             data_unit = kwargs.get(axis + "unit", default)
-            if idx in [Axis.DATA, Axis.XDATA, Axis.YDATA, Axis.IMAG, Axis.REAL]:
-                tmp_d = getattr(self._data, data)(idx, unit=data_unit, sub_idx=0)
-            else:
-                tmp_d = getattr(self._data, data)(idx, unit=data_unit)
-            prefix = self._get_metric_prefix(tmp_d)
-            del tmp_d
-
-            def unit_function(idx, _data=data, _idx=idx, _unit=data_unit):
-                d = getattr(self._data, _data)(_idx, unit=_unit, sub_idx=idx)
-                d *= 1 / prefix[1]
-                return d
+            # [prefix, accessor, frame buffer], kept for all frames of a video
+            reader = self._frame_readers.get((data, idx, data_unit))
+            if reader is None:
+                if idx in [Axis.DATA, Axis.XDATA, Axis.YDATA, Axis.IMAG, Axis.REAL]:
+                    if Axis.TIME in self._file.select_axis.all_for(data):
+                        tmp_d = self._data.select(data, idx, unit=data_unit, t=0)
+                    else:
+                        tmp_d = getattr(self._data, data)(idx, unit=data_unit, sub_idx=0)
+                else:
+                    tmp_d = getattr(self._data, data)(idx, unit=data_unit)
+                reader = [self._get_metric_prefix(tmp_d), None, None]
+                self._frame_readers[(data, idx, data_unit)] = reader
+                del tmp_d
+            prefix = reader[0]
+
+            def unit_function(idx, _data=data, _idx=idx, _unit=data_unit, _reader=reader):
+                """
+                :param idx: index or slice in the time axis (only this part is read)
+                :return: the data in unit / metric prefix. For an index this is a buffer that is
+                        overwritten by the next call, copy it to keep it.
+                """
+                if _reader[1] is None:  # created on first use, the prefix is part of the factor
+                    accessor = self._data.accessor(_data, _idx, unit=_unit)
+                    accessor.factor = accessor.factor / prefix[1]
+                    _reader[1] = accessor
+                accessor = _reader[1]
+                if isinstance(idx, slice):
+                    return accessor.select(t=idx)
+                if _reader[2] is None or _reader[2].shape != accessor.shape[1:]:
+                    _reader[2] = np.empty(accessor.shape[1:], dtype=accessor.dtype)
+                return accessor.select(t=idx, out=_reader[2])
             d.unit_function = unit_function
         else:
             d = getattr(self._data, data)(idx, unit=kwargs.get(axis + "unit", default))
@@ -448,7 +489,7 @@ class SimplePlotter(object):
         y, ylabel, time_prefix = self._unit_and_label(kwargs, Axis.TIME, 'y',
                                                       'bunch_profile', 'ts', "T")
         dataunit = kwargs.get("zunit", 'c/s')
-        if period is None:  # if no period provided
+        if period is None and kwargs.get("mean_range") is None:  # if full mesh is plotted
             z, zlabel, _ = self._unit_and_label(kwargs, Axis.DATA, 'z', 'bunch_profile', dataunit,
                                                 "Ch. Dens.")
             if kwargs.get("pad_zero", False):
@@ -479,7 +520,7 @@ class SimplePlotter(object):
         x, xlabel, _ = self._unit_and_label(kwargs, Axis.XAXIS, 'x', 'wake_potential', 's', "x")
         y, ylabel, time_prefix = self._unit_and_label(kwargs, Axis.TIME, 'y', 'wake_potential',
                                                       'ts', "T")
-        if period is None:  # if no period provided
+        if period is None and kwargs.get("mean_range") is None:  # if full mesh is plotted
             z, zlabel, _ = self._unit_and_label(kwargs, Axis.DATA, 'z', 'wake_potential', "volt",
                                                 "Wake Potential")
         else:
@@ -554,7 +595,7 @@ class SimplePlotter(object):
                                             "Frequency")
         y, ylabel, time_prefix = self._unit_and_label(kwargs, Axis.TIME, 'y', 'csr_spectrum',
                                                       'ts', "T")
-        if period is None:  # if no period provided
+        if period is None and kwargs.get("mean_range") is None:  # if full mesh is plotted
             z, zlabel, _ = self._unit_and_label(kwargs, Axis.DATA, 'z', 'csr_spectrum', 'wphz',
                                                 "Power")
             if kwargs.get("pad_zero", False):
@@ -582,7 +623,7 @@ class SimplePlotter(object):
         y, ylabel, time_prefix = self._unit_and_label(kwargs, Axis.TIME, 'y', 'energy_profile',
                                                       'ts', "T")
         dataunit = "c" if self._file.version < version15_1 else "cpnes"
-        if period is None:  # if no period provided
+        if period is None and kwargs.get("mean_range") is None:  # if full mesh is plotted
             z, zlabel, _ = self._unit_and_label(kwargs, Axis.DATA, 'z', 'energy_profile',
                                                 dataunit, "Population")
             if kwargs.get("pad_zero", False):
@@ -759,6 +800,13 @@ class PhaseSpace(object):
         self._eax = None
         self._xax = None
 
+    def __getstate__(self):
+        """Pickled with the File object only (see File.__getstate__), cached data is not kept"""
+        return {"file": self._file}
+
+    def __setstate__(self, state):
+        self.__init__(state["file"])
+
     def eax(self):
         if self._eax is None:
             self._eax = self._data.phase_space(Axis.EAXIS, unit='ev')
@@ -833,11 +881,13 @@ class PhaseSpace(object):
         lb, ub, lbm, ubm, min_px_space, max_px_space, min_px_energy, max_px_energy = \
             self._gen_bounds(fr_idx, to_idx, plot_area_width)
 
-        ps = self._data.phase_space(Axis.DATA, unit="cpnblpnes")[lb:ub, min_px_space:max_px_space,
-                                                                 min_px_energy:max_px_energy]
-        return self._gen_ps_movie(ps, min_px_space, max_px_space, min_px_energy, max_px_energy,
-                                  clim, lb, ub, bunch_profile, csr_intensity, cmap, extract_slice,
-                                  fps, path, dpi, **kwargs)
+        crop = dict(x=slice(min_px_space, max_px_space), e=slice(min_px_energy, max_px_energy))
+        ps = self._data.lazy("phase_space", unit="cpnblpnes", precision="native", **crop)
+        ma = float(abs(ps[lb:ub]).max().compute())
+        read_frame = self._frame_reader(range(len(ps))[lb:ub], crop)
+        return self._gen_ps_movie(read_frame, ma, min_px_space, max_px_space, min_px_energy,
+                                  max_px_energy, clim, lb, ub, bunch_profile, csr_intensity, cmap,
+                                  extract_slice, fps, path, dpi, **kwargs)
 
     def microstructure_movie(self, path=None, fr_idx=None, to_idx=None, mean_range=(None, None),
                              fps=20, plot_area_width=None, dpi=200, csr_intensity=False,
@@ -870,13 +920,14 @@ class PhaseSpace(object):
 
         lb, ub, lbm, ubm, min_px_space, max_px_space, min_px_energy, max_px_energy = \
             self._gen_bounds(fr_idx, to_idx, plot_area_width, mean_range)
-        ps = self._data.phase_space(Axis.DATA, unit="cpnblpnes")[:, min_px_space:max_px_space,
-                                                                 min_px_energy:max_px_energy]
-        mean = np.mean(ps[lbm:ubm], axis=0, dtype=np.float64)
-        diffs = (ps[lb:ub] - mean)
-        return self._gen_ps_movie(diffs, min_px_space, max_px_space, min_px_energy, max_px_energy,
-                                  clim, lb, ub, bunch_profile, csr_intensity, cmap, extract_slice,
-                                  fps, path, dpi, symmetric=True, **kwargs)
+        crop = dict(x=slice(min_px_space, max_px_space), e=slice(min_px_energy, max_px_energy))
+        ps = self._data.lazy("phase_space", unit="cpnblpnes", precision="native", **crop)
+        mean = ps[lbm:ubm].mean(axis=0, dtype=np.float64).compute()
+        ma = float(abs(ps[lb:ub] - mean).max().compute())
+        read_frame = self._frame_reader(range(len(ps))[lb:ub], crop, mean)
+        return self._gen_ps_movie(read_frame, ma, min_px_space, max_px_space, min_px_energy,
+                                  max_px_energy, clim, lb, ub, bunch_profile, csr_intensity, cmap,
+                                  extract_slice, fps, path, dpi, symmetric=True, **kwargs)
 
     def _gen_bounds(self, fr_idx, to_idx, plot_area_width, mean_range=None):
         lb = 0 if fr_idx is None else fr_idx
@@ -889,8 +940,8 @@ class PhaseSpace(object):
             ubm = ub
 
         if plot_area_width:
-            mbprof = np.mean(self._file.bunch_profile(Axis.DATA)[lbm:ubm], axis=0)
-            meprof = np.mean(self._file.energy_profile(Axis.DATA)[lbm:ubm], axis=0)
+            mbprof = np.mean(self._file.select("bunch_profile", t=slice(lbm, ubm)), axis=0)
+            meprof = np.mean(self._file.select("energy_profile", t=slice(lbm, ubm)), axis=0)
             com_space = self.center_of_mass(range(mbprof.shape[0]), mbprof)
             min_px_space = max(int(com_space - plot_area_width / 2), 0)
             max_px_space = min(int(com_space + plot_area_width / 2), mbprof.shape[0])
@@ -904,9 +955,30 @@ class PhaseSpace(object):
             max_px_energy = self.eax().shape[0]
         return lb, ub, lbm, ubm, min_px_space, max_px_space, min_px_energy, max_px_energy
 
-    def _gen_ps_movie(self, data, min_px_space, max_px_space, min_px_energy, max_px_energy,
-                      clim, lb, ub, bunch_profile, csr_intensity, cmap, extract_slice,
-                      fps, path, dpi, symmetric=False, **kwargs):
+    def _frame_reader(self, indices, crop, mean=None):
+        """
+        Get a function returning the phase space of one movie frame (transposed for pcolormesh).
+        All frames are read into the same buffers, nothing is allocated per frame.
+        :param indices: the index in the time axis of every frame
+        :param crop: ranges in space and energy (see Lisa.File.select)
+        :param mean: subtracted from every snapshot (None to use the snapshots)
+        :return: function taking the frame number
+        """
+        accessor = self._data.accessor("phase_space", unit="cpnblpnes", precision="native")
+        snapshot = accessor.select(t=indices[0], **crop)
+        frame = np.empty(snapshot.shape[::-1], dtype=snapshot.dtype)
+
+        def read_frame(i):
+            accessor.select(t=indices[i], out=snapshot, **crop)
+            if mean is not None:
+                np.subtract(snapshot, mean, out=snapshot)
+            np.copyto(frame, snapshot.T)
+            return frame
+        return read_frame
+
+    def _gen_ps_movie(self, read_frame, ma, min_px_space, max_px_space, min_px_energy,
+                      max_px_energy, clim, lb, ub, bunch_profile, csr_intensity, cmap,
+                      extract_slice, fps, path, dpi, symmetric=False, **kwargs):
 
         def forceAspect(ax, aspect=1):
             ax.set_aspect(np.abs((ax.get_xlim()[1] - ax.get_xlim()[0]) /
@@ -914,7 +986,6 @@ class PhaseSpace(object):
 
         fig = plt.figure()
         fig.set_size_inches(7, 7)
-        ma = np.max(np.abs([np.min(data), np.max(data)]))
         if clim:
             ma = clim * ma
         mi = -ma if symmetric else 0
@@ -924,7 +995,7 @@ class PhaseSpace(object):
             np.append(self.eax(), self.eax()[-1] + (self.eax()[-1] - self.eax()[-2]))[
                                                     min_px_energy:max_px_energy + 1] / 1e6)
 
-        time_axis = self._data.phase_space(Axis.TIME, unit="ts")[lb:ub]
+        time_axis = self._data.select("phase_space", Axis.TIME, unit="ts", t=slice(lb, ub))
 
         style = Style()
         style.apply_to_fig(fig)
@@ -934,7 +1005,7 @@ class PhaseSpace(object):
 
         def do_ms(i):
             text.set_text("Synchrotron Period: {:.3f} $T_s$".format(time_axis[i]))
-            im.set_array(data[i].T.flatten())
+            im.set_array(read_frame(i).ravel())
             return [im]
 
         dos = [do_ms]
@@ -976,7 +1047,7 @@ class PhaseSpace(object):
             fig.set_size_inches(7 * (top - bottom) / (right - left), 7)
 
         if csr_intensity:
-            csr = self._data.csr_intensity(Axis.DATA, unit="w")[lb:ub]
+            csr = self._data.select("csr_intensity", unit="w", t=slice(lb, ub))
             _csr_min = np.min(csr)
             _csr_max = np.max(csr)
             _csr_diff = _csr_max - _csr_min
@@ -1010,7 +1081,7 @@ class PhaseSpace(object):
                 csr_line[0].set_animated(True)
 
         if bunch_profile:
-            bp = self._data.bunch_profile(Axis.DATA, unit="c/s")[lb:ub]
+            bp = self._data.select("bunch_profile", unit="c/s", t=slice(lb, ub))
             bpax = self._data.bunch_profile(Axis.XAXIS, unit='s') * 1e12
             _bp_min = np.min(bp)
             _bp_max = np.max(bp)
@@ -1040,7 +1111,7 @@ class PhaseSpace(object):
                 cax = plt.axes([0.88, bb.min[1], 0.03, bb.height])
             else:
                 cax = plt.axes([0.84, bb.min[1], 0.03, bb.height])
-            im = ax.pcolormesh(xmesh, ymesh, data[0].T, cmap=cmap)
+            im = ax.pcolormesh(xmesh, ymesh, read_frame(0), cmap=cmap)
             im.set_clim((mi, ma))
             forceAspect(ax)
             fig.colorbar(im, cax=cax).set_label(
@@ -1062,7 +1133,7 @@ class PhaseSpace(object):
                            transform=ax.transAxes)
             ax.set_xlabel("Position in ps")
             ax.set_ylabel("Energy Deviation in MeV")
-            im = ax.pcolormesh(xmesh, ymesh, data[0].T, cmap=cmap)
+            im = ax.pcolormesh(xmesh, ymesh, read_frame(0), cmap=cmap)
             im.set_clim((mi, ma))
             cax = plt.axes([0.85, 0.1, 0.03, 0.86])
             fig.colorbar(im, cax=cax).set_label(
@@ -1077,7 +1148,7 @@ class PhaseSpace(object):
         if extract_slice:
             if isinstance(extract_slice, str):
                 if extract_slice.startswith("idx:"):
-                    id = range(len(data))[int(extract_slice[4:])]
+                    id = range(len(time_axis))[int(extract_slice[4:])]
                 elif extract_slice.startswith("ts:"):
                     id = np.argmin(np.abs(time_axis - float(extract_slice[3:])))
                 else:
@@ -1086,13 +1157,13 @@ class PhaseSpace(object):
                 id = int(extract_slice)
             do(id)
             return fig
-        elif path:  # range(len(data)) is correct since data is only from lb to ub
+        elif path:  # range(len(time_axis)) is correct since time_axis is only from lb to ub
             sa = kwargs.setdefault("save_args", {})
             sa['pad_inches'] = 0
-            ani = create_animation(fig, do, range(len(data)), clear_between=False, fps=fps,
+            ani = create_animation(fig, do, range(len(time_axis)), clear_between=False, fps=fps,
                                    blit=False, dpi=dpi, path=path, **kwargs)
         else:
-            ani = create_animation(fig, do, range(len(data)), clear_between=False, fps=fps,
+            ani = create_animation(fig, do, range(len(time_axis)), clear_between=False, fps=fps,
                                    blit=False, dpi=dpi, **kwargs)
         return ani
 
@@ -0,0 +1,91 @@
+import os.path as op
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+import Lisa
+from Lisa.internals import config_options
+from Lisa.data.axes import AxisStore
+
+s = Lisa.Axis
+filename = op.join(op.dirname(__file__), "data", "v15-1.h5")
+
+
+class AxisStoreTest(unittest.TestCase):
+    def test_share(self):
+        store = AxisStore()
+        a = Lisa.data.file.AttributedNPArray(np.arange(5.0), {"Second": 2.0}, "/Info/t")
+        b = Lisa.data.file.AttributedNPArray(np.arange(5.0), {"Second": 2.0}, "/Info/t")
+        c = Lisa.data.file.AttributedNPArray(np.arange(5.0), {"Second": 3.0}, "/Info/t")
+        self.assertIs(store.share(a), a)
+        self.assertIs(store.share(b), a)
+        self.assertIs(store.share(c), c)  # different attributes (conversion factors)
+        self.assertFalse(a.flags.writeable)
+        converted = store.converted(a, 2.0, np.float64)
+        self.assertIs(store.converted(a, 2.0, np.float64), converted)
+        self.assertListEqual(converted.tolist(), [0, 2, 4, 6, 8])
+        self.assertEqual(converted.attrs, {"Second": 2.0})
+        del a, b, converted
+        self.assertEqual(len(store), 1)  # only weak references are kept
+
+
+class FileAxesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.copy = op.join(self.tmpdir, "copy.h5")
+        shutil.copy(filename, self.copy)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_shared_across_groups(self):
+        f = Lisa.File(filename)
+        time = f.bunch_profile(s.TIME)
+        self.assertIs(f.phase_space(s.TIME), time)
+        self.assertIs(f.csr_intensity(s.TIME), time)
+        self.assertIs(f.energy_profile(s.EAXIS), f.phase_space(s.EAXIS))
+        self.assertFalse(time.flags.writeable)
+        self.assertEqual(time.name, "/Info/AxisValues_t")
+
+    def test_shared_across_files(self):
+        f, g = Lisa.File(filename), Lisa.File(self.copy)
+        self.assertIs(f.bunch_profile(s.XAXIS), g.bunch_profile(s.XAXIS))
+
+    def test_converted(self):
+        d, e = Lisa.Data(filename), Lisa.Data(self.copy)
+        raw = d._file.bunch_profile(s.XAXIS)
+        x = d.bunch_profile(s.XAXIS, unit="s")
+        self.assertIs(x.source, d.phase_space(s.XAXIS, unit="s").source)
+        self.assertIs(x.source, e.wake_potential(s.XAXIS, unit="s").source)
+        self.assertIsNot(x.source, d.bunch_profile(s.XAXIS, unit="m").source)
+        assert_array_equal(x, raw * raw.attrs["Second"])
+        # modifying the result does not change the shared values
+        x *= 2
+        values = np.asarray(d.bunch_profile(s.XAXIS, unit="s"))
+        values_copy = values.copy()
+        y = d.bunch_profile(s.XAXIS, unit="s")
+        y[0] = 1.0
+        y += 1
+        assert_array_equal(d.bunch_profile(s.XAXIS, unit="s"), values_copy)
+        assert_array_equal(x, 2 * values_copy)
+
+    def test_share_read_only(self):
+        d = Lisa.Data(filename)
+        values = np.asarray(d.bunch_profile(s.XAXIS, unit="s"))
+        self.assertTrue(values.flags.writeable)  # a private copy by default
+        self.assertFalse(np.shares_memory(d.bunch_profile(s.XAXIS, unit="s").source, values))
+        config_options.set("share_read_only", True)
+        try:
+            shared = np.asarray(d.bunch_profile(s.XAXIS, unit="s"))
+        finally:
+            config_options.set("share_read_only", False)
+        self.assertFalse(shared.flags.writeable)
+        self.assertTrue(np.shares_memory(d.bunch_profile(s.XAXIS, unit="s").source, shared))
+        assert_array_equal(shared, values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os.path as op
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import h5py as h5
+import numpy as np
+from numpy.testing import assert_array_equal, assert_allclose
+
+import Lisa
+from Lisa.data.backends import backend_for, Backend, Inovesa9Backend, Inovesa13Backend, \
+    Inovesa14Backend
+from Lisa.data.utils import InovesaVersion
+from Lisa.data.virtual import VirtualDataset
+
+s = Lisa.Axis
+filename = op.join(op.dirname(__file__), "data", "v15-1.h5")
+
+
+class BackendTest(unittest.TestCase):
+    def test_backend_for(self):
+        expected = [((0, 9, 1), Inovesa9Backend), ((0, 12, 2), Inovesa13Backend),
+                    ((0, 13, 0), Inovesa13Backend), ((0, 14, -1), Inovesa14Backend),
+                    ((0, 14, 3), Inovesa14Backend), ((0, 15, -1), Inovesa14Backend),
+                    ((0, 15, -2), Backend), ((0, 15, -3), Backend), ((1, 0, 0), Backend)]
+        for version, backend in expected:
+            self.assertIs(type(backend_for(InovesaVersion(*version))), backend)
+        self.assertNotIn("source_map", backend_for(InovesaVersion(0, 13, 0)).groups)
+        self.assertIn("source_map", backend_for(InovesaVersion(0, 14, -1)).groups)
+        self.assertEqual(backend_for(InovesaVersion(0, 9, 1)).groups["csr_intensity"], "CSRPower")
+
+    def test_current(self):
+        f = Lisa.File(filename)
+        self.assertIs(type(f._backend), Inovesa14Backend)  # bunch lengths of 0.15.-1 are wrong
+        self.assertIs(type(pickle.loads(pickle.dumps(f))._backend), Inovesa14Backend)
+
+
+class Inovesa9Test(unittest.TestCase):
+    """Files written by Inovesa 0.9.1 (axes per group, additional first time step)"""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = op.join(self.tmpdir, "v9-1.h5")
+        rng = np.random.default_rng(3)
+        self.time = np.arange(11, dtype=np.float64)
+        self.space = rng.random((2, 32))
+        self.profiles = rng.random((11, 32)).astype(np.float32)
+        self.length = rng.random(11).astype(np.float32)
+        with h5.File(self.filename, 'w') as f:
+            f.create_dataset("Info/Inovesa_v", data=np.array([0, 9, 1], dtype=np.int32))
+            f.create_group("Info/Parameters")
+            f.create_dataset("Info/AxisValues_t", data=self.time)
+            f.create_dataset("Info/AxisValues_z", data=self.space)
+            f.create_dataset("BunchProfile/data", data=self.profiles, chunks=(4, 32),
+                             compression="gzip")
+            f.create_dataset("BunchLength/data", data=self.length)
+        with open(op.join(self.tmpdir, "v9-1.cfg"), 'w') as cfg:
+            cfg.write("BunchCurrent=0.0012\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lazy(self):
+        f = Lisa.File(self.filename)
+        self.assertIs(type(f._backend), Inovesa9Backend)
+        profiles = f.bunch_profile(s.DATA)
+        self.assertIsInstance(profiles, VirtualDataset)  # not copied
+        self.assertEqual(profiles.shape, (10, 32))
+        assert_array_equal(profiles[()], self.profiles[1:])
+        assert_array_equal(profiles[3], self.profiles[4])
+        assert_array_equal(profiles[-2::-3, 5], self.profiles[1:][-2::-3, 5])
+        assert_allclose(f.bunch_length(s.DATA)[()], np.sqrt(self.length[1:]))
+        assert_array_equal(f.bunch_profile(s.TIME), self.time[1:])
+        assert_array_equal(f.bunch_profile(s.XAXIS), self.space[0])
+        self.assertEqual(f.parameters("BunchCurrent"), 0.0012)
+
+    def test_decode_threads(self):
+        f = Lisa.File(self.filename, threads=2)
+        assert_array_equal(f.bunch_profile(s.DATA)[2:7], self.profiles[3:8])
+        assert_array_equal(f.take("bunch_profile", [9, 0, 4]), self.profiles[1:][[9, 0, 4]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os.path as op
+import shutil
+import tempfile
+import unittest
+
+import h5py as h5
+import numpy as np
+from numpy.testing import assert_array_equal
+
+import Lisa
+from Lisa.data.batch import normalize_rows, plan_reads, read_batch
+
+s = Lisa.Axis
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.values = np.arange(1000 * 6, dtype=np.float32).reshape(1000, 6)
+        self.h5file = h5.File(op.join(self.tmpdir, "batch.h5"), 'w')
+        self.chunked = self.h5file.create_dataset("chunked", data=self.values, chunks=(16, 6),
+                                                  compression="gzip")
+        self.contiguous = self.h5file.create_dataset("contiguous", data=self.values)
+
+    def tearDown(self):
+        self.h5file.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_normalize_rows(self):
+        self.assertListEqual(normalize_rows(slice(None, None, 300), 1000).tolist(),
+                             [0, 300, 600, 900])
+        self.assertListEqual(normalize_rows([5, -1, 5], 1000).tolist(), [5, 999, 5])
+        self.assertListEqual(normalize_rows(range(3, 9, 2), 1000).tolist(), [3, 5, 7])
+        self.assertListEqual(normalize_rows(np.arange(10) % 4 == 0, 10).tolist(), [0, 4, 8])
+        with self.assertRaises(IndexError):
+            normalize_rows([1000], 1000)
+        with self.assertRaises(IndexError):
+            normalize_rows([True, False], 10)
+
+    def test_plan(self):
+        # a stride is one hyperslab across all chunks
+        self.assertEqual(plan_reads(np.arange(0, 1000, 50)), [(slice(0, 951, 50), slice(0, 20))])
+        # irregular rows are read with one point selection
+        plan = plan_reads(np.array([1, 2, 9, 12, 13, 14, 15, 40, 77]))
+        self.assertEqual(plan[0], (slice(12, 16, 1), slice(3, 7)))
+        self.assertEqual(plan[1][0], [1, 2, 9, 40, 77])
+        self.assertListEqual(plan[1][1].tolist(), [0, 1, 2, 7, 8])
+        self.assertEqual(plan_reads(np.array([5])), [(slice(5, 6), slice(0, 1))])
+
+    def test_read_batch(self):
+        for dataset in (self.chunked, self.contiguous):
+            for rows in ([999, 3, 500, 3, 17, 16, 4], list(range(0, 1000, 37)), [],
+                         [5, 6, 7, 100, 101, 102]):
+                reads = []
+                result = read_batch(dataset, np.asarray(rows, dtype=np.int64), (slice(1, 4),),
+                                    on_read=reads.append)
+                assert_array_equal(result, self.values[rows, 1:4].reshape(len(rows), 3))
+                self.assertLessEqual(len(reads), 3)
+        reads = []
+        read_batch(self.chunked, np.arange(0, 1000, 50), on_read=reads.append)
+        self.assertEqual(len(reads), 1)
+        out = np.empty((3,), dtype=np.float64)
+        self.assertIs(read_batch(self.chunked, np.array([9, 2, 4]), (2,), out), out)
+        assert_array_equal(out, self.values[[9, 2, 4], 2])
+
+
+class FileTakeTest(unittest.TestCase):
+    def setUp(self):
+        self.file = Lisa.File(op.join(op.dirname(__file__), "data", "v15-1.h5"))
+
+    def test_take(self):
+        for what in ("phase_space", "csr_spectrum", "bunch_profile", "csr_intensity"):
+            data = getattr(self.file, what)(s.DATA)[()]
+            indices = [len(data) - 1, 0, len(data) - 1]
+            assert_array_equal(self.file.take(what, indices), data[indices])
+            assert_array_equal(self.file.take(what, slice(None, None, 2)), data[::2])
+        ps = self.file.phase_space(s.DATA)[()]
+        assert_array_equal(self.file.take("phase_space", [1, 0], x=slice(10, 20)),
+                           ps[[1, 0], 10:20])
+        with self.assertRaises(Lisa.data.file.DataError):
+            self.file.take("impedance", [0])
+
+    def test_data_take(self):
+        d = Lisa.Data(self.file)
+        factor = self.file.phase_space(s.DATA).attrs["CoulombPerNBLPerNES"]
+        ps = self.file.phase_space(s.DATA)[()]
+        taken = d.take("phase_space", [1, 0, 1], unit="CpNBLpNES")
+        self.assertEqual(taken.dtype, np.float64)
+        assert_array_equal(taken, ps[[1, 0, 1]] * factor)
+        self.assertEqual(d.take("phase_space", [1], unit="CpNBLpNES", precision="native").dtype,
+                         ps.dtype)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import multiprocessing
+import os
+import os.path as op
+import shutil
+import tempfile
+import unittest
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+import Lisa
+from Lisa.data.cache import DatasetCache, dataset_cache
+from Lisa.data.shared import SharedStore, shared_store
+from Lisa.internals import config_options
+
+s = Lisa.Axis
+
+
+class DatasetCacheTest(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = DatasetCache(budget=3 * 80)
+        for key in "abc":
+            self.assertTrue(cache.put(key, np.zeros(10)))
+        self.assertIsNotNone(cache.get("a"))  # a is now most recently used
+        cache.put("d", np.zeros(10))
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+        self.assertEqual(cache.nbytes, 240)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_budget(self):
+        cache = DatasetCache(budget=100)
+        self.assertFalse(cache.put("a", np.zeros(20)))
+        self.assertEqual(len(cache), 0)
+        cache.put("b", np.zeros(10))
+        cache.set_budget(50)
+        self.assertEqual(len(cache), 0)
+
+    def test_hits_and_misses(self):
+        cache = DatasetCache(budget=1000)
+        cache.put("a", np.zeros(10))
+        cache.get("a")
+        cache.get("b")  # never cached, not counted
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 0))
+        cache.put("b", np.zeros(120))  # evicts "a"
+        cache.get("a")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        cache.clear()
+        cache.get("b")  # cleared keys are forgotten
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+class PreloadTest(unittest.TestCase):
+    def setUp(self):
+        self.filename = op.join(op.dirname(__file__), "data", "v15-1.h5")
+        dataset_cache.clear()
+
+    def tearDown(self):
+        dataset_cache.set_budget(None)
+        dataset_cache.clear()
+
+    def test_preload_shared_between_files(self):
+        f = Lisa.File(self.filename)
+        self.assertTrue(f.preload_full("bunch_profile"))
+        data = f.bunch_profile(s.DATA)
+        self.assertIsInstance(data, Lisa.data.file.AttributedNPArray)
+        assert_array_equal(data, np.array(f.file.get("BunchProfile/data")))
+        # a second File object for the same file uses the same cache entries
+        self.assertIs(Lisa.File(self.filename).bunch_profile(s.DATA), data)
+
+    def test_preload_stats(self):
+        """Only reads of preloaded datasets are counted"""
+        f = Lisa.File(self.filename)
+        before = dataset_cache.stats()
+        self.assertTrue(f.preload_full("bunch_profile"))
+        for _ in range(3):
+            f.bunch_profile(s.DATA)
+            f.energy_spread(s.DATA)  # not preloaded
+        stats = dataset_cache.stats()
+        self.assertEqual(stats["hits"] - before["hits"], 3)
+        self.assertEqual(stats["misses"] - before["misses"], 0)
+        dataset_cache.set_budget(0)  # evicts the preloaded data
+        f.bunch_profile(s.DATA)
+        self.assertEqual(dataset_cache.stats()["misses"] - before["misses"], 1)
+
+    def test_preload_over_budget(self):
+        dataset_cache.set_budget(1024)
+        f = Lisa.File(self.filename)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            self.assertFalse(f.preload_full("phase_space", s.DATA))
+        self.assertEqual(len(w), 1)
+        self.assertNotIsInstance(f.phase_space(s.DATA), np.ndarray)
+
+    def test_preload_all(self):
+        for workers in [0, 2]:
+            with self.subTest(workers=workers):
+                dataset_cache.clear()
+                f = Lisa.File(self.filename)
+                self.assertTrue(f.preload_all(workers=workers, progress=False))
+                raw = Lisa.File(self.filename, use_mmap=False)
+                for what in ["phase_space", "csr_spectrum", "bunch_length", "energy_profile"]:
+                    data = getattr(f, what)(s.DATA)
+                    self.assertIsInstance(data, Lisa.data.file.AttributedNPArray)
+                    assert_array_equal(data, np.asarray(getattr(raw, what)(s.DATA)))
+                    self.assertEqual(data.attrs, dict(getattr(raw, what)(s.DATA).attrs))
+
+    def test_preload_all_without_shared_memory(self):
+        """Python < 3.8: read in this process, worker processes raise an error"""
+        with mock.patch.object(Lisa.data.shared, "shared_memory", None), \
+                mock.patch.object(Lisa.data.file, "shared_memory", None):
+            f = Lisa.File(self.filename)
+            with self.assertRaises(RuntimeError):
+                f.preload_all(workers=2, progress=False)
+            self.assertTrue(f.preload_all(progress=False))
+            self.assertIsInstance(f.phase_space(s.DATA), Lisa.data.file.AttributedNPArray)
+            self.assertFalse(shared_store.available)
+            config_options.set("use_shared_store", True)
+            try:
+                with self.assertRaises(RuntimeError):
+                    Lisa.File(self.filename)
+            finally:
+                config_options.set("use_shared_store", False)
+
+    def test_preload_all_ceiling(self):
+        f = Lisa.File(self.filename)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            self.assertFalse(f.preload_all(workers=0, max_bytes=2 ** 16, progress=False))
+        self.assertGreater(len(w), 0)
+        self.assertLessEqual(dataset_cache.nbytes, 2 ** 16)
+        self.assertNotIsInstance(f.phase_space(s.DATA), np.ndarray)
+
+
+def _attach(directory, key):
+    """Used by SharedStoreTest in another process"""
+    array = SharedStore(directory).get(key, (4, 5), np.float32)
+    return None if array is None else array.tolist()
+
+
+def _preloaded_type(filename):
+    """Used by SharedStoreTest in another process (started with use_shared_store=1)"""
+    return type(Lisa.File(filename).phase_space(s.DATA)).__name__
+
+
+class SharedStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = SharedStore(self.tmpdir)
+        self.key = ("test", self.tmpdir)
+        self.values = np.arange(20, dtype=np.float32).reshape(4, 5)
+        if not self.store.available:
+            self.skipTest("no file locks on this system")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def load(self, target):
+        target[...] = self.values
+
+    def test_publish_and_attach(self):
+        self.assertIsNone(self.store.get(self.key, (4, 5), np.float32))
+        array = self.store.load(self.key, (4, 5), np.float32, self.load)
+        assert_array_equal(array, self.values)
+        self.assertFalse(array.flags.writeable)
+        self.assertIs(self.store.load(self.key, (4, 5), np.float32, None), array)
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            self.assertEqual(pool.submit(_attach, self.tmpdir, self.key).result(),
+                             self.values.tolist())
+        # removed when the last array using it is deleted
+        view = array[1:]
+        del array
+        self.assertIsNotNone(_attach(self.tmpdir, self.key))
+        del view
+        self.assertIsNone(_attach(self.tmpdir, self.key))
+
+    def test_preload_full(self):
+        filename = op.join(op.dirname(__file__), "data", "v15-1.h5")
+        dataset_cache.clear()
+        config_options.set("use_shared_store", True)
+        os.environ["use_shared_store"] = "1"
+        try:
+            f = Lisa.File(filename)
+            self.assertTrue(f.preload_full("phase_space", s.DATA))
+            ps = f.phase_space(s.DATA)
+            self.assertFalse(ps.flags.writeable)
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                self.assertEqual(pool.submit(_preloaded_type, filename).result(),
+                                 "AttributedNPArray")
+        finally:
+            config_options.set("use_shared_store", False)
+            del os.environ["use_shared_store"]
+            dataset_cache.clear()
+        del ps
+        self.assertEqual(len(shared_store), 0)
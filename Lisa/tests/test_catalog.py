@@ -0,0 +1,155 @@
+import os
+import os.path as op
+import shutil
+import tempfile
+import time
+import unittest
+
+import h5py
+
+import Lisa
+from Lisa.data.catalog import Catalog, CatalogError, CATALOG_NAME
+
+
+class CatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        source = op.join(op.dirname(__file__), "data", "v15-1.h5")
+        self.files = []
+        for name, current in [("a.h5", 1e-3), ("b.h5", 5e-3), ("c.h5", 2e-4)]:
+            filename = op.join(self.dir, name)
+            shutil.copy(source, filename)
+            with h5py.File(filename, 'a') as f:
+                f["Info/Parameters"].attrs["BunchCurrent"] = current
+            with open(filename + ".cfg", 'w') as f:
+                f.write("BunchCurrent={}\nRevolutionFrequency = 2.7e6\n".format(current))
+            self.files.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_entries(self):
+        catalog = Catalog(self.dir)
+        self.assertEqual(sorted(catalog.refresh(self.files)), self.files)
+        self.assertTrue(op.isfile(op.join(self.dir, CATALOG_NAME)))
+        self.assertEqual(catalog.value(self.files[0], "version"), Lisa.File(self.files[0]).version)
+        self.assertEqual(catalog.value(self.files[0], "GridSize"), 256)
+        self.assertEqual(catalog.value(self.files[0], "RevolutionFrequency"), 9e6)  # from h5
+        self.assertEqual(catalog.datasets(self.files[0])["PhaseSpace/data"],
+                         {"shape": [2, 256, 256], "dtype": "float32"})
+        with self.assertRaises(CatalogError):
+            catalog.value(op.join(self.dir, "missing.h5"), "GridSize")
+
+    def test_incremental_refresh(self):
+        Catalog(self.dir).refresh(self.files)
+        catalog = Catalog(self.dir)  # reopen the persisted catalog
+        self.assertEqual(catalog.refresh(self.files), [])
+        time.sleep(0.01)
+        with open(self.files[1] + ".cfg", 'a') as f:
+            f.write("Comment = changed\n")
+        self.assertEqual(catalog.refresh(self.files), [self.files[1]])
+        self.assertEqual(catalog.value(self.files[1], "Comment"), "changed")
+        catalog.refresh(self.files[:2])
+        with self.assertRaises(CatalogError):
+            catalog.entry(self.files[2])
+
+    def test_query(self):
+        catalog = Catalog(self.dir)
+        catalog.refresh(self.files)
+        self.assertEqual(catalog.query("BunchCurrent > 5e-4", self.files), self.files[:2])
+        self.assertEqual(catalog.query("version >= '0.14' and version < '0.16'", self.files),
+                         self.files)
+        # partial versions compare on the given parts, 0.15.-1 files are 0.15
+        self.assertEqual(catalog.query("version >= '0.15'", self.files), self.files)
+        self.assertEqual(catalog.query("version == '0.15' and version < '0.15.0'", self.files),
+                         self.files)
+        self.assertEqual(catalog.query("version < '0.15'", self.files), [])
+        self.assertEqual(catalog.query("version > '0.15.-2'", self.files), [])
+        with self.assertRaises(CatalogError):
+            catalog.query("version >= 0.10", self.files)  # the same as 0.1
+        self.assertEqual(catalog.query("NotSaved > 1 or GridSize != 256", self.files), [])
+        self.assertEqual(catalog.query("filename in ['a.h5', 'c.h5']", self.files),
+                         [self.files[0], self.files[2]])
+        for query in ["__import__('os')", "GridSize.real", "BunchCurrent >"]:
+            with self.assertRaises(CatalogError):
+                catalog.query(query, self.files)
+
+    def test_multifile(self):
+        mf = Lisa.MultiFile(self.dir, "*.h5")
+        self.assertEqual(mf.strlst(), [self.files[1], self.files[0], self.files[2]])
+        self.assertFalse(mf._sort_changed)
+        self.assertEqual(mf.query("BunchCurrent < 2e-3"), [self.files[0], self.files[2]])
+        filtered = mf.filter("BunchCurrent >= 1e-3")
+        self.assertEqual(filtered.strlst(), [self.files[1], self.files[0]])
+        self.assertEqual(len(filtered.objlst()), 2)
+
+    def add_file(self, name, current):
+        filename = op.join(self.dir, name)
+        shutil.copy(self.files[0], filename)
+        with h5py.File(filename, 'a') as f:
+            f["Info/Parameters"].attrs["BunchCurrent"] = current
+        return filename
+
+    def test_multifile_refresh(self):
+        mf = Lisa.MultiFile(self.dir, "*.h5")
+        objects = mf.objlst()
+        self.assertEqual(mf.refresh(), ([], [], []))
+        self.assertIs(mf.objlst()[0], objects[0])  # unchanged, nothing rebuilt
+        d = self.add_file("d.h5", 3e-3)
+        os.remove(self.files[2])
+        time.sleep(0.01)
+        with h5py.File(self.files[0], 'a') as f:
+            f["Info/Parameters"].attrs["BunchCurrent"] = 1e-2
+        self.assertEqual(mf.refresh(), ([d], [self.files[2]], [self.files[0]]))
+        self.assertEqual(mf.strlst(), [self.files[0], self.files[1], d])
+        self.assertEqual([f.filename for f in mf.objlst()], mf.strlst())
+        self.assertIs(mf.objlst()[1], objects[0])  # b.h5 is kept
+        self.assertIsNot(mf.objlst()[0], objects[1])  # a.h5 was modified
+        filtered = mf.filter("BunchCurrent < 5e-3")
+        self.assertEqual(filtered.strlst(), [d])
+        e = self.add_file("e.h5", 1e-4)
+        self.add_file("f.h5", 1)
+        self.assertEqual(filtered.refresh(), ([e], [], []))
+        self.assertEqual(filtered.strlst(), [d, e])
+
+    def test_watch(self):
+        mf = Lisa.MultiFile(self.dir, "*.h5")
+        watcher = Lisa.data.watch.Watcher(mf, None, 1, settle=10)
+        self.assertEqual(watcher.poll(now=0), [])
+        d = self.add_file("d.h5", 3e-3)
+        self.assertEqual(watcher.poll(now=1), [])
+        self.assertEqual(watcher.pending, [d])
+        time.sleep(0.01)
+        with h5py.File(d, 'a') as f:  # still written
+            f["Info/Parameters"].attrs["Comment"] = "more"
+        self.assertEqual(watcher.poll(now=8), [])
+        self.assertEqual(watcher.poll(now=12), [])
+        self.assertEqual(watcher.poll(now=18), [d])
+        self.assertEqual(watcher.pending, [])
+        completed = []
+        watcher = mf.watch(completed.extend, interval=0.02, settle=0)
+        try:
+            e = self.add_file("e.h5", 1e-4)
+            for _ in range(200):
+                if completed:
+                    break
+                time.sleep(0.02)
+        finally:
+            watcher.stop()
+        self.assertEqual(completed, [e])
+
+    def test_read_only_directory(self):
+        os.chmod(self.dir, 0o500)
+        try:
+            catalog = Catalog(self.dir)
+            if os.access(self.dir, os.W_OK):  # e.g. running as root
+                self.skipTest("directory is writable")
+            self.assertEqual(catalog.filename, ":memory:")
+            catalog.refresh(self.files)
+            self.assertEqual(catalog.value(self.files[2], "BunchCurrent"), 2e-4)
+        finally:
+            os.chmod(self.dir, 0o700)
+
+
+if __name__ == '__main__':
+    unittest.main()
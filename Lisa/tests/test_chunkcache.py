@@ -0,0 +1,104 @@
+import os.path as op
+import unittest
+
+from numpy.testing import assert_array_equal
+
+import Lisa
+from Lisa.data.chunkcache import ChunkCacheTuner, chunk_indices
+
+s = Lisa.Axis
+
+
+class ChunkCacheTunerTest(unittest.TestCase):
+    def test_chunk_indices(self):
+        shape, chunks = (100, 256, 256), (10, 64, 64)
+        idx = chunk_indices((slice(5, 25), 3), shape, chunks)
+        self.assertEqual([i.tolist() for i in idx], [[0, 1, 2], [0], [0, 1, 2, 3]])
+        idx = chunk_indices((slice(None, None, 30), Ellipsis, [-1, 0]), shape, chunks)
+        self.assertEqual([i.tolist() for i in idx], [[0, 3, 6, 9], [0, 1, 2, 3], [0, 3]])
+        self.assertEqual(len(chunk_indices(slice(5, 5), shape, chunks)[0]), 0)
+
+    def test_initial_size(self):
+        # all chunks of one snapshot fit
+        tuner = ChunkCacheTuner((100, 256, 256), (10, 64, 64), 4, 2 ** 20, 2 ** 30)
+        self.assertEqual(tuner.nbytes, 16 * 10 * 64 * 64 * 4)
+        self.assertEqual(ChunkCacheTuner((100, 256, 256), (10, 64, 64), 4, 2 ** 20, 2 ** 21).nbytes,
+                         2 ** 21)
+
+    def test_thrashing(self):
+        tuner = ChunkCacheTuner((1000, 64), (10, 64), 8, 0, 2 ** 20)
+        self.assertEqual(tuner.capacity, 1)  # one chunk per snapshot
+        proposed = None
+        for _ in range(20):  # single element time series touch 100 chunks each
+            proposed = tuner.record((slice(None), 3)) or proposed
+        self.assertEqual(proposed, 100 * tuner.chunk_bytes)
+        tuner.resize(proposed)
+        tuner.record((slice(None), 5))
+        hits = tuner.hits
+        tuner.record((slice(None), 7))  # all chunks fit into the cache now
+        self.assertEqual(tuner.hits - hits, 100)
+        self.assertEqual(tuner.info()["reopens"], 1)
+
+    def test_no_thrashing_when_streaming(self):
+        tuner = ChunkCacheTuner((1000, 64), (10, 64), 8, 0, 2 ** 20)
+        for start in range(0, 1000, 10):
+            self.assertIsNone(tuner.record(slice(start, start + 10)))
+        self.assertEqual((tuner.hits, tuner.misses), (0, 100))
+
+    def test_snapshots(self):
+        """Integer keys (single snapshots) are recorded like the equivalent selections"""
+        snapshots, selections = [ChunkCacheTuner((100, 256, 256), (10, 64, 64), 4, 0, 2 ** 26)
+                                 for _ in range(2)]
+        for i in [3, 15, -1, 4, 22, 3, 99, 15] * 3:
+            self.assertEqual(snapshots.record(i), selections.record((i, slice(None))))
+        self.assertEqual(snapshots.info(), selections.info())
+
+
+class FileChunkCacheTest(unittest.TestCase):
+    def test_reopen(self):
+        f = Lisa.File(op.join(op.dirname(__file__), "data", "v15-1.h5"))
+        ps = f.phase_space(s.DATA)
+        info = f.chunk_cache_info()["/PhaseSpace/data"]
+        self.assertEqual(info["nbytes"], 16 * 2 ** 20)
+        self.assertEqual(ps.id.get_access_plist().get_chunk_cache()[1], info["nbytes"])
+        expected = ps[()]
+        del ps  # open datasets cannot be reopened with a different chunk cache
+        tuner = f._chunk_cache_tuners["/PhaseSpace/data"]
+        tuner.nbytes = tuner.chunk_bytes  # too small: pixels in different chunks evict each other
+        profile = f.bunch_profile(s.DATA)
+        axis = f.phase_space(s.XAXIS)
+        pixels = [(10, 10), (100, 10), (10, 100), (100, 100)]
+        for _ in range(7):
+            for x, e in pixels:
+                assert_array_equal(f.select("phase_space", x=slice(x, x + 1), e=slice(e, e + 1)),
+                                   expected[:, x:x + 1, e:e + 1])
+        info = f.chunk_cache_info()["/PhaseSpace/data"]
+        self.assertEqual(info["reopens"], 1)
+        self.assertEqual(info["nbytes"], 4 * tuner.chunk_bytes)
+        self.assertGreater(info["hits"], 0)
+        # only the thrashing dataset is dropped, other groups and axes are kept
+        self.assertIs(f._data[f._met2gr["bunch_profile"]][s.DATA], profile)
+        self.assertIs(f._data[f._met2gr["phase_space"]][s.XAXIS], axis)
+        self.assertEqual(f.phase_space(s.DATA).id.get_access_plist().get_chunk_cache()[1],
+                         4 * tuner.chunk_bytes)
+
+    def test_accessor(self):
+        f = Lisa.File(op.join(op.dirname(__file__), "data", "v15-1.h5"))
+        expected = f.phase_space(s.DATA)[()]
+        tuner = f._chunk_cache_tuners["/PhaseSpace/data"]
+        tuner.nbytes = tuner.chunk_bytes  # too small: chunks of a snapshot evict each other
+        f._h5_objects, f._data = {}, {}  # reopened with the small cache
+        accessor = Lisa.Data(f).accessor("phase_space")
+        for i in [0, 1] * 10:
+            assert_array_equal(accessor[i], expected[i])
+        info = f.chunk_cache_info()["/PhaseSpace/data"]
+        self.assertEqual(info["hits"] + info["misses"], 20 * len(tuner._snapshot_grid))
+        self.assertEqual(info["reopens"], 1)
+        self.assertGreater(info["nbytes"], tuner.chunk_bytes)
+        assert_array_equal(accessor[1], expected[1])
+        del accessor
+        f.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os.path as op
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+from numpy.testing import assert_array_equal, assert_allclose
+
+import Lisa
+from Lisa.data.file import StitchedFile
+from Lisa.data.virtual import ConcatDataset
+
+s = Lisa.Axis
+filename = op.join(op.dirname(__file__), "data", "v15-1.h5")
+
+
+class ConcatDatasetTest(unittest.TestCase):
+    def test_read(self):
+        parts = [np.arange(30.).reshape(10, 3), np.arange(100, 112.).reshape(4, 3),
+                 np.arange(200, 221.).reshape(7, 3)]
+        dataset = ConcatDataset(parts, {}, "concat")
+        expected = np.concatenate(parts)
+        self.assertEqual(dataset.shape, expected.shape)
+        for key in [(), np.s_[3], np.s_[-1], np.s_[12], np.s_[2:19:3], np.s_[13:20:4],
+                    np.s_[::-2], np.s_[[20, 0, 11, 11]], np.s_[9:14, 1], np.s_[5:5],
+                    np.s_[..., 2], np.s_[expected[:, 0] > 50]]:
+            assert_array_equal(dataset[key], expected[key])
+            self.assertEqual(np.shape(dataset[key]), expected[key].shape)
+
+
+class StitchedFileTest(unittest.TestCase):
+    """Two continuation runs, the second restarts the time axis at 0"""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = [op.join(self.tmpdir, "run1.h5"), op.join(self.tmpdir, "run2.h5")]
+        for name in self.files:
+            shutil.copy(filename, name)
+        with h5py.File(self.files[1], 'a') as f:
+            f["BunchProfile/data"][...] = 2 * f["BunchProfile/data"][...]
+        original = Lisa.File(filename)
+        self.times = original.bunch_profile(s.TIME)
+        self.profiles = original.bunch_profile(s.DATA)[()]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_concat(self):
+        f = Lisa.File.concat(self.files)
+        self.assertIsInstance(f, StitchedFile)
+        # the first snapshot of the second run is the last one of the first run
+        expected = np.concatenate([self.profiles, 2 * self.profiles[1:]])
+        assert_allclose(f.bunch_profile(s.TIME),
+                        np.concatenate([self.times, self.times[1:] + self.times[-1]]))
+        self.assertIsInstance(f.bunch_profile(s.DATA), ConcatDataset)
+        assert_array_equal(f.bunch_profile(s.DATA)[()], expected)
+        assert_array_equal(f.select("bunch_profile", t=(0.8, 1.3)), expected[8:14])
+        assert_array_equal(f.take("bunch_profile", [15, 2, 11]), expected[[15, 2, 11]])
+        blocks = [block.copy() for _, block in f.iter_time("bunch_profile", batch=4)]
+        assert_array_equal(np.concatenate(blocks), expected)
+        self.assertEqual(len(f.phase_space(s.DATA)), 4)  # not saved at every time step
+        assert_array_equal(f.bunch_profile(s.XAXIS), Lisa.File(filename).bunch_profile(s.XAXIS))
+        self.assertEqual(f.parameters("BunchCurrent"), Lisa.File(filename).parameters(
+            "BunchCurrent"))
+        assert_array_equal(Lisa.Data(f).bunch_profile(s.DATA, unit="c/s")[12],
+                           2 * Lisa.Data(filename).bunch_profile(s.DATA, unit="c/s")[2])
+        assert_array_equal(pickle.loads(pickle.dumps(f)).bunch_profile(s.DATA)[()], expected)
+
+    def test_time_offsets(self):
+        f = Lisa.File.concat(self.files, time_offsets=[0, 5])  # absolute times, no overlap
+        assert_allclose(f.bunch_profile(s.TIME), np.concatenate([self.times, self.times + 5]))
+        self.assertEqual(len(f.bunch_profile(s.DATA)), 22)
+        with self.assertRaises(ValueError):
+            Lisa.File.concat(self.files, time_offsets=[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
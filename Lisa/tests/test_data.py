@@ -2,7 +2,10 @@
 import os
 import unittest
 
+import numpy as np
+
 import Lisa
+from Lisa.internals import config_options
 
 s = Lisa.Axis
 
@@ -51,3 +54,146 @@ class TestData(unittest.TestCase):
                   ("cpspev", 8.1199889971263548e-05), ("apspev", 730.79900974137183)]:
             with self.subTest(msg="Checking cpevps apevps", unit=u[0]):
                 self.assertEqual(self.data.unit_factor("phase_space", Lisa.Axis.DATA, unit=u[0]), u[1])
+
+    def test_iter_time(self):
+        full = self.data.bunch_profile(Lisa.Axis.DATA, unit="c/s")
+        times = self.data.bunch_profile(Lisa.Axis.TIME, unit="s")
+        blocks = [(t.copy(), b.copy())
+                  for t, b in self.data.iter_time("bunch_profile", "c/s", batch=3, time_unit="s")]
+        self.assertListEqual(np.concatenate([b for _, b in blocks]).tolist(), full.tolist())
+        self.assertListEqual(np.concatenate([t for t, _ in blocks]).tolist(), times.tolist())
+
+    def test_select(self):
+        factor = self.file.phase_space(Lisa.Axis.DATA).attrs["CoulombPerNBLPerNES"]
+        sel = self.data.select("phase_space", unit="CpNBLpNES", t=slice(0, 1),
+                               x=(-5e-12, 5e-12, "s"))
+        idx = self.file.index_range("phase_space", Lisa.Axis.XAXIS, -5e-12, 5e-12, "s")
+        self.assertListEqual(sel.tolist(),
+                             (self.file.phase_space(Lisa.Axis.DATA)[0:1, idx] * factor).tolist())
+        time = self.data.select("bunch_profile", Lisa.Axis.TIME, unit="s", t=slice(2, 4))
+        self.assertListEqual(time.tolist(),
+                             self.data.bunch_profile(Lisa.Axis.TIME, unit="s")[2:4].tolist())
+
+    def test_scaled_view(self):
+        raw = self.file.phase_space(Lisa.Axis.DATA)
+        factor = raw.attrs["CoulombPerNBLPerNES"]
+        view = self.data.phase_space(Lisa.Axis.DATA, unit="CpNBLpNES")
+        self.assertEqual(view.shape, raw.shape)
+        self.assertEqual(view.dtype, np.float64)
+        self.assertEqual(len(view), raw.shape[0])
+        self.assertListEqual(view[1].tolist(), (raw[1] * factor).tolist())
+        self.assertListEqual(view[1].tolist(),
+                             self.data.phase_space(Lisa.Axis.DATA, unit="CpNBLpNES",
+                                                   sub_idx=1).tolist())
+        self.assertListEqual(view[::-1, 0, 0].tolist(), (raw[()][::-1, 0, 0] * factor).tolist())
+        self.assertListEqual(np.asarray(view).tolist(), (raw[()] * factor).tolist())
+        self.assertListEqual(view.tolist(), (raw[()] * factor).tolist())
+        self.assertAlmostEqual(float(np.max(view)), float(np.max(raw[()] * factor)))
+
+        raw_view = self.data.bunch_profile(Lisa.Axis.XAXIS, unit=None)
+        self.assertEqual(raw_view.dtype, np.float64)
+        doubled = raw_view * 2
+        self.assertIsInstance(doubled, Lisa.data.views.ScaledView)
+        self.assertListEqual(doubled[:5].tolist(), (self.file.bunch_profile(Lisa.Axis.XAXIS)[:5]
+                                                    * np.float64(2.0)).tolist())
+        raw_view /= 4
+        self.assertListEqual(raw_view[:5].tolist(), (self.file.bunch_profile(Lisa.Axis.XAXIS)[:5]
+                                                     * np.float64(0.25)).tolist())
+        raw_view += 1
+        self.assertIsInstance(raw_view, Lisa.data.views.ScaledView)
+        self.assertListEqual(raw_view[:5].tolist(), (self.file.bunch_profile(Lisa.Axis.XAXIS)[:5]
+                                                     * np.float64(0.25) + 1).tolist())
+
+    def test_precision(self):
+        raw = self.file.phase_space(Lisa.Axis.DATA)
+        factor = raw.attrs["CoulombPerNBLPerNES"]
+        self.assertEqual(self.data.phase_space(Lisa.Axis.DATA, unit="CpNBLpNES").dtype,
+                         np.float64)
+        native = self.data.phase_space(Lisa.Axis.DATA, unit="CpNBLpNES", precision="native")
+        self.assertEqual(native.dtype, raw.dtype)
+        self.assertEqual(native[1].dtype, raw.dtype)
+        np.testing.assert_allclose(native[1], raw[1] * factor, rtol=1e-6, atol=1e-35)
+        data32 = Lisa.Data(self.file, precision="float32")
+        self.assertEqual(data32.select("phase_space", unit="CpNBLpNES", t=0).dtype, np.float32)
+        self.assertEqual(data32.bunch_profile(Lisa.Axis.XAXIS, unit="s").dtype, np.float32)
+        self.assertEqual(data32.select("phase_space", unit="CpNBLpNES", precision="float64",
+                                       t=0).dtype, np.float64)
+        with self.assertRaises(ValueError):
+            Lisa.Data(self.file, precision="float16")
+
+        config_options.set("precision", "native")
+        try:
+            self.assertEqual(Lisa.Data(self.file).select("phase_space", t=0).dtype, raw.dtype)
+        finally:
+            config_options.set("precision", "float64")
+
+    def test_out(self):
+        raw = self.file.phase_space(Lisa.Axis.DATA)
+        factor = raw.attrs["CoulombPerNBLPerNES"]
+        out = np.empty(raw.shape[1:], dtype=np.float32)
+        result = self.data.phase_space(Lisa.Axis.DATA, unit="CpNBLpNES", sub_idx=1, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_allclose(out, raw[1] * factor, rtol=1e-6, atol=1e-35)
+        out = np.empty((1, 10) + raw.shape[2:])
+        result = self.data.select("phase_space", unit="CpNBLpNES", out=out, t=slice(0, 1),
+                                  x=slice(100, 110))
+        self.assertIs(result, out)
+        self.assertListEqual(out.tolist(), (raw[0:1, 100:110] * factor).tolist())
+        out = np.empty(self.file.bunch_profile(Lisa.Axis.XAXIS).shape)
+        self.data.bunch_profile(Lisa.Axis.XAXIS, unit="s", out=out)
+        self.assertListEqual(out.tolist(),
+                             self.data.bunch_profile(Lisa.Axis.XAXIS, unit="s").tolist())
+
+    def test_plot_units_without_time(self):
+        sp = Lisa.SimplePlotter(self.file)
+        d, label, prefix = sp._unit_and_label({}, s.REAL, 'z', 'impedance', 'ohm', "Impedance",
+                                              gen_sub=True)
+        self.assertEqual(label, "Impedance in " + prefix[0] + "Ohm")
+
+    def test_ps_data_precision(self):
+        ps = Lisa.PhaseSpace(self.file)
+        self.assertEqual(np.asarray(ps.ps_data(0)).dtype, np.float64)  # the configured default
+
+    def test_plot_frame_buffer(self):
+        sp = Lisa.SimplePlotter(self.file)
+        d, label, prefix = sp._unit_and_label({}, s.DATA, 'z', 'bunch_profile', 'c/s',
+                                              "Charge", gen_sub=True)
+        expected = self.data.bunch_profile(Lisa.Axis.DATA, unit="c/s")
+        first = d.unit_function(1)
+        np.testing.assert_allclose(first, expected[1] / prefix[1])
+        self.assertIs(d.unit_function(2), first)  # one buffer for all frames
+        np.testing.assert_allclose(first, expected[2] / prefix[1])
+        np.testing.assert_allclose(d.unit_function(slice(0, 3)), expected[0:3] / prefix[1])
+        d, _, _ = sp._unit_and_label({}, s.DATA, 'z', 'bunch_profile', 'c/s', "Charge",
+                                     gen_sub=True)
+        self.assertIs(d.unit_function(0), first)  # kept for the next frame of a video
+
+    def test_accessor(self):
+        accessor = self.data.accessor("bunch_profile", unit="c/s")
+        self.assertEqual(len(accessor), len(self.file.bunch_profile(Lisa.Axis.DATA)))
+        self.assertEqual(accessor.dtype, np.float64)
+        for i in range(len(accessor)):
+            self.assertListEqual(accessor[i].tolist(),
+                                 self.data.bunch_profile(Lisa.Axis.DATA, unit="c/s")[i].tolist())
+        self.assertListEqual(accessor.select(t=slice(0, 2), x=(-5e-12, 5e-12, "s")).tolist(),
+                             self.data.select("bunch_profile", unit="c/s", t=slice(0, 2),
+                                              x=(-5e-12, 5e-12, "s")).tolist())
+        out = np.empty(accessor.shape[1:], dtype=np.float32)
+        self.assertIs(accessor.select(out=out, t=1), out)
+        np.testing.assert_allclose(out, accessor[1], rtol=1e-6)
+        self.assertListEqual(np.asarray(accessor).tolist(),
+                             self.data.bunch_profile(Lisa.Axis.DATA, unit="c/s").tolist())
+
+        # handles dropped by the file (chunk cache reopened, refresh) are resolved again
+        self.file._generation += 1
+        self.assertListEqual(accessor[1].tolist(),
+                             self.data.bunch_profile(Lisa.Axis.DATA, unit="c/s")[1].tolist())
+        raw = self.data.accessor("bunch_profile", precision="native")
+        self.assertEqual(raw.dtype, self.file.bunch_profile(Lisa.Axis.DATA).dtype)
+        self.assertListEqual(raw[0].tolist(), self.file.bunch_profile(Lisa.Axis.DATA)[0].tolist())
+        self.file.preload_full("bunch_profile", Lisa.Axis.DATA)
+        try:
+            self.assertListEqual(accessor[1].tolist(),
+                                 self.data.bunch_profile(Lisa.Axis.DATA, unit="c/s")[1].tolist())
+        finally:
+            Lisa.data.dataset_cache.clear()
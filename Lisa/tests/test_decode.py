@@ -0,0 +1,94 @@
+import os.path as op
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py as h5
+import numpy as np
+from numpy.testing import assert_array_equal
+
+import Lisa
+from Lisa.data.decode import DecodedDataset, decodable
+
+s = Lisa.Axis
+filename = op.join(op.dirname(__file__), "data", "v15-1.h5")
+
+
+class DecodeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.values = np.round(np.random.default_rng(1).random((40, 33, 50)), 3).astype(np.float32)
+        self.h5file = h5.File(op.join(self.tmpdir, "decode.h5"), 'w')
+        self.h5file.create_dataset("shuffle", data=self.values, chunks=(4, 8, 16),
+                                   compression="gzip", shuffle=True)
+        self.h5file.create_dataset("gzip", data=self.values.astype(np.int16), chunks=(4, 8, 16),
+                                   compression="gzip")
+        sparse = self.h5file.create_dataset("sparse", shape=self.values.shape, chunks=(4, 8, 16),
+                                            dtype=np.float32, compression="gzip", fillvalue=7)
+        sparse[:8] = self.values[:8]
+        self.h5file.create_dataset("lzf", data=self.values, chunks=(4, 8, 16), compression="lzf")
+        self.h5file.create_dataset("plain", data=self.values)
+        self.pool = ThreadPoolExecutor(4)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        self.h5file.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_decodable(self):
+        self.assertTrue(decodable(self.h5file["shuffle"]))
+        self.assertTrue(decodable(self.h5file["gzip"]))
+        self.assertFalse(decodable(self.h5file["lzf"]))
+        self.assertFalse(decodable(self.h5file["plain"]))
+
+    def test_read(self):
+        keys = [(), np.s_[3], np.s_[::-1, 5, ::3], np.s_[1:30:7, :, -1:2:-5], np.s_[..., 7],
+                np.s_[[3, 1, 1]], np.s_[-1], np.s_[2, 3, 4], np.s_[0:0]]
+        for name in ("shuffle", "gzip", "sparse"):
+            expected = self.h5file[name][()]
+            for nbytes in (0, 2 ** 20):
+                dataset = DecodedDataset(self.h5file[name], self.pool, nbytes)
+                for key in keys * 2:  # second time from the cache of decoded chunks
+                    assert_array_equal(dataset[key], expected[key])
+                    self.assertEqual(np.shape(dataset[key]), expected[key].shape)
+
+
+class ThreadedFileTest(unittest.TestCase):
+    """Reads from several threads at once using one File object"""
+    def run_threads(self, file, readers=8, repeat=20):
+        expected = {what: getattr(Lisa.File(filename), what)(s.DATA)[()]
+                    for what in ("phase_space", "bunch_profile", "csr_spectrum")}
+        rng = np.random.default_rng(2)
+        jobs = []
+        for _ in range(readers * repeat):
+            what = ("phase_space", "bunch_profile", "csr_spectrum")[rng.integers(3)]
+            length = len(expected[what])
+            start = int(rng.integers(length))
+            jobs.append((what, slice(start, int(rng.integers(start, length)) + 1)))
+
+        def read(job):
+            what, t = job
+            assert_array_equal(file.select(what, t=t), expected[what][t])
+            assert_array_equal(getattr(file, what)(s.DATA)[t], expected[what][t])
+            return True
+
+        with ThreadPoolExecutor(readers) as pool:
+            self.assertTrue(all(pool.map(read, jobs)))
+
+    def test_shared_handle(self):
+        self.run_threads(Lisa.File(filename, threads=0))
+
+    def test_decode_threads(self):
+        f = Lisa.File(filename, threads=4)
+        self.assertIsInstance(f.phase_space(s.DATA), DecodedDataset)
+        self.run_threads(f)
+        d = Lisa.Data(f)
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda i: d.phase_space(s.DATA, unit="CpNBLpNES")[i % 2],
+                                    range(16)))
+        assert_array_equal(results[0], d.phase_space(s.DATA, unit="CpNBLpNES")[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
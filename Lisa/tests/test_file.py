@@ -6,13 +6,71 @@ from numpy.testing import assert_array_equal, assert_allclose
 # rethink importing it
 import Lisa
 from Lisa.data.utils import DataNotInFile
+from Lisa.data.file import AttributedNPArray
+from Lisa.data.virtual import VirtualDataset, OffsetDataset, TransformedDataset
 
 s = Lisa.Axis
 
 import os.path as op
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 import unittest
 
+
+def contiguous_copy(src, dst):
+    """Copy an Inovesa result file storing every dataset contiguous and uncompressed"""
+    with h5py.File(src, 'r') as fsrc, h5py.File(dst, 'w') as fdst:
+        def copy(name, obj):
+            if isinstance(obj, h5py.Dataset):
+                fdst.create_dataset(name, data=obj[()]).attrs.update(obj.attrs)
+            else:
+                fdst.require_group(name).attrs.update(obj.attrs)
+        fsrc.visititems(copy)
+
+def growing_copy(src, dst, rows):
+    """
+    Copy an Inovesa result file for SWMR writing. Time dependent datasets are resizable and only
+    the first rows time steps are copied.
+    """
+    with h5py.File(src, 'r') as fsrc, h5py.File(dst, 'w', libver='latest') as fdst:
+        length = len(fsrc["Info/AxisValues_t"])
+
+        def copy(name, obj):
+            if not isinstance(obj, h5py.Dataset):
+                fdst.require_group(name).attrs.update(obj.attrs)
+            elif obj.ndim > 0 and obj.shape[0] == length and obj.size > 0:
+                fdst.create_dataset(name, data=obj[:rows], maxshape=(None,) + obj.shape[1:],
+                                    chunks=(4,) + obj.shape[1:]).attrs.update(obj.attrs)
+            else:
+                fdst.create_dataset(name, data=obj[()]).attrs.update(obj.attrs)
+        fsrc.visititems(copy)
+
+
+# appends the missing time steps to a file created with growing_copy in SWMR mode (like Inovesa)
+swmr_writer = """
+import sys, h5py
+src, dst = sys.argv[1:3]
+with h5py.File(src, 'r') as fsrc, h5py.File(dst, 'a', libver='latest') as fdst:
+    fdst.swmr_mode = True
+    print("ready", flush=True)
+    sys.stdin.readline()
+    growing = []
+    fdst.visititems(lambda name, obj: growing.append(obj) if isinstance(obj, h5py.Dataset) and
+                    obj.maxshape and obj.maxshape[0] is None else None)
+    for ds in growing:
+        rows = len(ds)
+        ds.resize(len(fsrc[ds.name]), axis=0)
+        ds[rows:] = fsrc[ds.name][rows:]
+        ds.flush()
+    print("done", flush=True)
+"""
+
+
 class FileTest(unittest.TestCase):
     def setUp(self):
         self.file_dir_path = op.join(op.dirname(__file__), "data")
@@ -169,3 +227,197 @@ class FileTest(unittest.TestCase):
         f = Lisa.File(op.join(self.file_dir_path, "v9-1.h5"))
         self.assertEqual(f.parameters("BunchCurrent"), 9.0E-4)
 
+
+    def test_iter_time(self):
+        f = Lisa.File(op.join(self.file_dir_path, "v15-1.h5"))
+        ps = f.phase_space(s.DATA)
+        self.assertEqual(f.time_batch("phase_space", batch=1) % ps.chunks[0], 0)
+        buffers = set()
+        blocks = []
+        for times, block in f.iter_time("phase_space", batch=1):
+            buffers.add(block.__array_interface__['data'][0])
+            blocks.append(block.copy())
+            self.assertEqual(len(times), len(block))
+        self.assertEqual(len(buffers), 1)
+        assert_array_equal(np.concatenate(blocks), ps[()])
+        for times, block in f.iter_time("bunch_length", factor=2.0):
+            assert_allclose(block, np.asarray(f.bunch_length(s.DATA)) * 2)
+            assert_array_equal(times, f.bunch_length(s.TIME))
+        with self.assertRaises(Lisa.data.DataError):
+            next(f.iter_time("impedance"))
+
+    def test_select(self):
+        f = Lisa.File(op.join(self.file_dir_path, "v15-1.h5"))
+        ps = np.array(f.phase_space(s.DATA))
+        with self.subTest(msg="index ranges"):
+            assert_array_equal(f.select("phase_space", t=slice(0, 1), x=slice(10, 20), e=5),
+                               ps[0:1, 10:20, 5])
+        with self.subTest(msg="physical ranges"):
+            xax = np.array(f.phase_space(s.XAXIS)) * f.phase_space(s.XAXIS).attrs["Second"]
+            eax = np.array(f.phase_space(s.EAXIS)) * f.phase_space(s.EAXIS).attrs["ElectronVolt"]
+            xsel = np.flatnonzero((xax >= -5e-12) & (xax <= 5e-12))
+            esel = np.flatnonzero((eax >= -1e6) & (eax <= 1e6))
+            sel = f.select("phase_space", x=(-5e-12, 5e-12, "s"), e=(-1e6, 1e6, "ev"))
+            assert_array_equal(sel, ps[:, xsel[0]:xsel[-1] + 1, esel[0]:esel[-1] + 1])
+            self.assertEqual(sel.attrs, f.phase_space(s.DATA).attrs)
+        with self.subTest(msg="time range in inovesa units"):
+            tax = np.array(f.bunch_profile(s.TIME))
+            sel = f.select("bunch_profile", t=(tax[2], tax[5]))
+            assert_array_equal(sel, np.array(f.bunch_profile(s.DATA))[2:6])
+        with self.subTest(msg="empty range"):
+            self.assertEqual(f.select("bunch_profile", t=(-2, -1)).shape[0], 0)
+        with self.subTest(msg="Raises"):
+            with self.assertRaises(DataNotInFile):
+                f.select("bunch_profile", e=(0, 1))
+
+    def test_memmap_contiguous(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename = op.join(tmpdir, "contiguous.h5")
+        contiguous_copy(op.join(self.file_dir_path, "v15-1.h5"), filename)
+        f = Lisa.File(filename)
+        ps = f.phase_space(s.DATA)
+        self.assertIsInstance(ps, Lisa.data.file.AttributedNPArray)
+        base = ps
+        while base is not None and not isinstance(base, np.memmap):
+            base = base.base
+        self.assertIsInstance(base, np.memmap)
+        self.assertFalse(ps.flags.writeable)
+        assert_array_equal(ps, f.file.get("PhaseSpace/data")[()])
+        self.assertEqual(ps.attrs["CoulombPerNBLPerNES"],
+                         f.file.get("PhaseSpace/data").attrs["CoulombPerNBLPerNES"])
+        with self.subTest(msg="chunked datasets are not mapped"):
+            f = Lisa.File(op.join(self.file_dir_path, "v15-1.h5"))
+            self.assertIsInstance(f.phase_space(s.DATA), h5py.Dataset)
+        with self.subTest(msg="disabled"):
+            self.assertIsInstance(Lisa.File(filename, use_mmap=False).phase_space(s.DATA),
+                                  h5py.Dataset)
+        with self.subTest(msg="all groups"):
+            self._blfunc = "calc_bl"
+            self.specs["source_map"] = [s.XAXIS, s.EAXIS, s.XDATA, s.YDATA]
+            self.do_test(Lisa.File(filename))
+
+    def test_lazy_bunch_length(self):
+        f = Lisa.File(op.join(self.file_dir_path, "v15-1.h5"))
+        bl = f.bunch_length(s.DATA)
+        self.assertIsInstance(bl, VirtualDataset)
+        raw = f.file.get("BunchLength/data")
+        self.assertEqual(bl.shape, raw.shape)
+        self.assertEqual(bl.attrs, raw.attrs)
+        full = Lisa.data.utils.calc_bl(np.array(f.file.get(self._axis_datasets[s.XAXIS])),
+                                       np.array(f.file.get("BunchProfile/data")))
+        self.assertEqual(bl.dtype, full.dtype)
+        for key in [3, -1, slice(2, 5), slice(None, None, -2), [4, 1, 1], np.arange(11) > 7]:
+            with self.subTest(key=key):
+                assert_allclose(bl[key], full[key])
+
+
+class LiveFileTest(unittest.TestCase):
+    def setUp(self):
+        self.src = op.join(op.dirname(__file__), "data", "v15-1.h5")
+        self.dir = tempfile.mkdtemp()
+        self.filename = op.join(self.dir, "live.h5")
+        growing_copy(self.src, self.filename, 5)
+        self.writer = subprocess.Popen([sys.executable, "-c", swmr_writer, self.src, self.filename],
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                       universal_newlines=True)
+        self.assertEqual(self.writer.stdout.readline().strip(), "ready")
+
+    def append(self):
+        self.writer.stdin.write("go\n")
+        self.writer.stdin.flush()
+        self.assertEqual(self.writer.stdout.readline().strip(), "done")
+
+    def tearDown(self):
+        self.writer.stdin.close()
+        self.writer.wait()
+        self.writer.stdout.close()
+        Lisa.data.dataset_cache.clear()
+        shutil.rmtree(self.dir)
+
+    def test_refresh(self):
+        f = Lisa.File(self.filename, live=True)
+        full = Lisa.File(self.src)
+        self.assertTrue(f.preload_full("bunch_profile"))
+        self.assertTrue(f.preload_full("bunch_length"))
+        self.assertEqual(len(f.bunch_profile(s.DATA)), 5)
+        self.assertEqual(len(f.csr_spectrum(s.DATA)), 5)
+        self.append()
+        grown = f.refresh()
+        self.assertEqual(grown["/BunchProfile/data"], (5, 11))
+        for what in ["bunch_profile", "bunch_length", "csr_spectrum"]:
+            with self.subTest(what=what):
+                assert_allclose(np.asarray(getattr(f, what)(s.DATA)),
+                                np.asarray(getattr(full, what)(s.DATA)))
+                assert_array_equal(getattr(f, what)(s.TIME), getattr(full, what)(s.TIME))
+        # preloaded data is extended
+        self.assertIsInstance(f.bunch_profile(s.DATA), AttributedNPArray)
+        self.assertIsInstance(f.bunch_length(s.DATA), AttributedNPArray)
+
+    def test_refresh_not_live(self):
+        with self.assertRaises(Lisa.data.DataError):
+            Lisa.File(self.src).refresh()
+
+
+class VirtualDatasetTest(unittest.TestCase):
+    def setUp(self):
+        self.source = np.arange(60.).reshape(10, 6)
+
+    def test_offset(self):
+        offset = OffsetDataset(AttributedNPArray(self.source, {"a": 1}, "src"), 1, 8)
+        expected = self.source[1:8]
+        self.assertEqual(offset.shape, expected.shape)
+        self.assertEqual(offset.attrs, {"a": 1})
+        for key in [0, -1, slice(1, 4), slice(None, None, -1), (slice(2, 5), 3), (Ellipsis, 2),
+                    [3, 0, 3], (np.arange(7) % 2 == 0, slice(1, 3)), ()]:
+            with self.subTest(key=key):
+                assert_array_equal(offset[key], expected[key])
+        with self.assertRaises(IndexError):
+            offset[7]
+
+    def test_transformed(self):
+        sqrt = TransformedDataset(OffsetDataset(AttributedNPArray(self.source, {}, "src"), 2),
+                                  np.sqrt)
+        assert_array_equal(np.array(sqrt), np.sqrt(self.source[2:]))
+        assert_array_equal(sqrt[1:3, ::2], np.sqrt(self.source[3:5, ::2]))
+
+
+def _phase_space_sum(data, t):
+    """Used by PickleTest in worker processes"""
+    return float(np.sum(data.phase_space(s.DATA, unit="cpnblpnes")[t]))
+
+
+class PickleTest(unittest.TestCase):
+    def setUp(self):
+        self.filename = op.join(op.dirname(__file__), "data", "v15-1.h5")
+
+    def test_file(self):
+        f = Lisa.File(self.filename, use_mmap=False, threads=2)
+        f.select("phase_space", t=0)
+        f2 = pickle.loads(pickle.dumps(f))
+        self.assertIsNone(f2._h5file)  # opened on first access
+        self.assertEqual(f2.version, f.version)
+        self.assertEqual((f2._use_mmap, f2._threads), (False, 2))
+        self.assertEqual(f2._chunk_cache_sizes["/PhaseSpace/data"],
+                         f._chunk_cache_tuners["/PhaseSpace/data"].nbytes)
+        assert_array_equal(f2.phase_space(s.DATA)[()], f.phase_space(s.DATA)[()])
+        self.assertIsNotNone(f2._h5file)
+
+    def test_data_and_plotters(self):
+        d = pickle.loads(pickle.dumps(Lisa.Data(self.filename, precision="float32")))
+        self.assertEqual(d.precision, "float32")
+        self.assertEqual(d.bunch_profile(s.DATA, unit="c/s").dtype, np.float32)
+        ps = Lisa.PhaseSpace(self.filename)
+        ps.ps_data(0)
+        ps2 = pickle.loads(pickle.dumps(ps))
+        self.assertEqual(ps2._ps_data, {})
+        assert_array_equal(ps2.ps_data(0), ps.ps_data(0))
+        sp = pickle.loads(pickle.dumps(Lisa.SimplePlotter(self.filename)))
+        self.assertTrue(hasattr(sp, "bunch_profile_video"))
+        self.assertEqual(sp.current, Lisa.File(self.filename).parameters("BunchCurrent"))
+
+    def test_process_pool(self):
+        d = Lisa.Data(self.filename)
+        with ProcessPoolExecutor(2) as pool:
+            sums = list(pool.map(_phase_space_sum, [d, d], [0, 1]))
+        self.assertEqual(sums, [_phase_space_sum(d, 0), _phase_space_sum(d, 1)])
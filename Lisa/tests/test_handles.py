@@ -0,0 +1,102 @@
+import os
+import os.path as op
+import shutil
+import tempfile
+import unittest
+
+from numpy.testing import assert_array_equal
+
+import Lisa
+from Lisa.data.handles import HandlePool
+
+s = Lisa.Axis
+filename = op.join(op.dirname(__file__), "data", "v15-1.h5")
+
+
+def open_descriptors():
+    """Number of open file descriptors of this process (None if unknown)"""
+    if not op.isdir("/proc/self/fd"):
+        return None
+    return len(os.listdir("/proc/self/fd"))
+
+
+class FileCloseTest(unittest.TestCase):
+    def test_close(self):
+        f = Lisa.File(filename)
+        expected = f.bunch_profile(s.DATA)[()]
+        f.close()
+        self.assertTrue(f.closed)
+        assert_array_equal(f.bunch_profile(s.DATA)[()], expected)  # opened again
+        self.assertFalse(f.closed)
+
+    def test_context_manager(self):
+        with Lisa.File(filename) as f:
+            f.phase_space(s.DATA)[0]
+        self.assertTrue(f.closed)
+
+
+class HandlePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = []
+        for i in range(12):
+            self.files.append(op.join(self.tmpdir, "run{:02d}.h5".format(i)))
+            shutil.copy(filename, self.files[-1])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_pool(self):
+        pool = HandlePool(3)
+        files = [Lisa.File(name, pool=pool) for name in self.files[:5]]
+        self.assertEqual(len(pool), 3)
+        self.assertEqual([f.closed for f in files], [True, True, False, False, False])
+        files[2].bunch_profile(s.XAXIS)  # most recently used now
+        files[0].bunch_profile(s.DATA)[()]
+        self.assertEqual([f.closed for f in files], [False, True, False, True, False])
+        with self.assertRaises(ValueError):
+            HandlePool(0)
+
+    def test_memory_maps(self):
+        """Memory mapped datasets use a descriptor each and are unmapped with their file"""
+        contiguous = op.join(self.tmpdir, "contiguous.h5")
+        Lisa.rechunk(filename, contiguous, layout="contiguous")
+        pool = HandlePool(4)
+        files = [Lisa.File(contiguous, pool=pool, use_mmap=True) for _ in range(3)]
+        expected = files[0].phase_space(s.DATA)[1].copy()
+        files[0].bunch_profile(s.DATA)
+        self.assertEqual(files[0].descriptors, 3)  # the h5 file and two memory maps
+        files[1].phase_space(s.XAXIS)
+        self.assertEqual([f.closed for f in files], [False, False, True])
+        self.assertEqual(pool.descriptors, 4)
+        kept = files[1].phase_space(s.DATA)
+        files[1].bunch_profile(s.XAXIS)  # maps are counted on the next access
+        self.assertEqual([f.closed for f in files], [True, False, True])
+        self.assertEqual(files[0].descriptors, 0)
+        self.assertEqual(pool.descriptors, 2)
+        before = open_descriptors()
+        files[1].close()
+        assert_array_equal(kept[1], expected)  # still mapped while it is used
+        if before is not None:
+            self.assertEqual(open_descriptors(), before - 1)
+            del kept
+            self.assertEqual(open_descriptors(), before - 2)
+
+    def test_multifile(self):
+        before = open_descriptors()
+        with Lisa.MultiFile(self.tmpdir, "*.h5", max_open=4) as mf:
+            objects = mf.objlst(sorted=False)
+            self.assertEqual(len(objects), 12)
+            self.assertTrue(all(f.closed for f in objects))  # version taken from the catalog
+            for f in objects:
+                self.assertEqual(f.version, Lisa.File(filename).version)
+                f.phase_space(s.DATA)[1]
+                self.assertLessEqual(len(mf._pool), 4)
+                if before is not None:
+                    self.assertLessEqual(open_descriptors() - before, 4 + 1)  # + catalog
+        self.assertEqual(len(mf._pool), 0)
+        self.assertTrue(all(f.closed for f in objects))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os.path as op
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+from numpy.testing import assert_array_equal
+
+import Lisa
+from Lisa.data.catalog import Catalog
+from Lisa.data.integrity import valid_extent, nonfinite_regions
+
+s = Lisa.Axis
+filename = op.join(op.dirname(__file__), "data", "v15-1.h5")
+
+
+class ValidExtentTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.h5file = h5py.File(op.join(self.tmpdir, "extent.h5"), 'w')
+
+    def tearDown(self):
+        self.h5file.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_valid_extent(self):
+        values = np.random.default_rng(4).random((100, 8, 8)).astype(np.float32) + 1
+        for written in (0, 1, 7, 8, 9, 63, 100):
+            with self.subTest(written=written):
+                allocated = self.h5file.create_dataset("allocated{}".format(written),
+                                                       shape=values.shape, chunks=(8, 4, 8),
+                                                       dtype=np.float32, compression="gzip")
+                allocated[:written] = values[:written]
+                self.assertEqual(valid_extent(allocated), written)
+                nan = np.full(values.shape, np.nan, dtype=np.float32)
+                nan[:written] = values[:written]
+                self.assertEqual(valid_extent(nan, rows=16), written)
+
+    def test_nonfinite(self):
+        values = np.ones((50, 3))
+        values[4, 1] = np.inf
+        values[10:13] = np.nan
+        values[40] = np.nan
+        self.assertEqual(nonfinite_regions(values, rows=8), [[4, 5], [10, 13], [40, 41]])
+        self.assertEqual(nonfinite_regions(values, stop=40, rows=8), [[4, 5], [10, 13]])
+
+
+class ScanTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.crashed = op.join(self.tmpdir, "crashed.h5")
+        self.complete = op.join(self.tmpdir, "complete.h5")
+        shutil.copy(filename, self.complete)
+        shutil.copy(filename, self.crashed)
+        with h5py.File(self.crashed, 'a') as f:  # walltime after 7 of 11 time steps
+            for name in ("Info/AxisValues_t", "BunchProfile/data", "CSR/Spectrum/data",
+                         "CSR/Intensity/data", "EnergySpread/data"):
+                f[name][7:] = 0
+            f["WakePotential/data"][2, 5] = np.nan
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_scan(self):
+        results = Lisa.scan(self.tmpdir, workers=2)
+        self.assertEqual(results[self.complete]["issues"], [])
+        self.assertEqual(results[self.complete]["valid"], 11)
+        crashed = results[self.crashed]
+        self.assertEqual(crashed["valid"], 7)
+        self.assertEqual(crashed["groups"]["bunch_profile"]["valid"], 7)
+        self.assertEqual(crashed["groups"]["phase_space"]["valid"], 2)
+        self.assertEqual(crashed["groups"]["wake_potential"]["nonfinite"], [[2, 3]])
+        self.assertTrue(any(i.startswith("inconsistent lengths") for i in crashed["issues"]))
+
+        catalog = Catalog(self.tmpdir)
+        self.assertEqual(catalog.scan_result(self.crashed), crashed)
+        with h5py.File(self.crashed, 'a') as f:
+            f["BunchProfile/data"][7:] = 1
+        self.assertIsNone(catalog.scan_result(self.crashed))  # changed since
+        multifile = Lisa.MultiFile(self.tmpdir, "*.h5")
+        results = Lisa.scan(multifile, check_finite=False)
+        self.assertEqual(results[self.crashed]["groups"]["bunch_profile"]["valid"], 11)
+
+    def test_empty_groups(self):
+        no_csr = op.join(self.tmpdir, "no_csr.h5")
+        shutil.copy(filename, no_csr)
+        with h5py.File(no_csr, 'a') as f:  # CSR off, the groups stay zero
+            f["CSR/Spectrum/data"][...] = 0
+            f["CSR/Intensity/data"][...] = 0
+        result = Lisa.scan(no_csr, catalog=False)[no_csr]
+        self.assertEqual(result["valid"], 11)
+        self.assertEqual(result["issues"], [])
+        self.assertTrue(result["groups"]["csr_intensity"]["empty"])
+        self.assertFalse(result["groups"]["bunch_profile"]["empty"])
+        f = Lisa.File(no_csr, clamp_time=True)
+        self.assertEqual(len(f.bunch_profile(s.TIME)), 11)
+        self.assertEqual(f.bunch_profile(s.DATA).shape, (11, 256))
+        self.assertEqual(len(f.csr_intensity(s.DATA)), 11)
+        f.close()
+
+        with h5py.File(no_csr, 'a') as f:  # and crashed after 7 time steps
+            for name in ("Info/AxisValues_t", "BunchProfile/data", "EnergySpread/data"):
+                f[name][7:] = 0
+        result = Lisa.scan(no_csr, catalog=False)[no_csr]
+        self.assertEqual(result["valid"], 7)
+        f = Lisa.File(no_csr, clamp_time=True)
+        self.assertEqual(f.bunch_profile(s.DATA).shape, (7, 256))
+        self.assertEqual(len(f.csr_intensity(s.DATA)), 7)
+
+    def test_clamp_time(self):
+        f = Lisa.File(self.crashed, clamp_time=True)
+        original = Lisa.File(self.crashed)
+        self.assertEqual(len(f.bunch_profile(s.TIME)), 7)
+        self.assertEqual(f.bunch_profile(s.DATA).shape, (7, 256))
+        assert_array_equal(f.bunch_profile(s.DATA)[-1], original.bunch_profile(s.DATA)[6])
+        self.assertEqual(len(f.phase_space(s.DATA)), 2)
+        self.assertEqual(len(f.select("csr_spectrum", t=(0.5, 1))), 2)
+        self.assertEqual(len(Lisa.Data(f).bunch_profile(s.DATA, unit="c/s")), 7)
+        f.preload_full("bunch_profile")
+        self.assertEqual(f.bunch_profile(s.DATA).shape, (7, 256))
+        self.assertEqual(len(Lisa.File(self.complete, clamp_time=True).bunch_profile(s.TIME)), 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
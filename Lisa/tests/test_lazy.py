@@ -0,0 +1,170 @@
+import os.path as op
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import h5py as h5
+import numpy as np
+from numpy.testing import assert_array_equal, assert_allclose
+
+import Lisa
+from Lisa.data import lazy
+from Lisa.data.lazy import expression, Expression
+
+s = Lisa.Axis
+filename = op.join(op.dirname(__file__), "data", "v15-1.h5")
+
+
+class CountingDataset(object):
+    """Array that records the rows of every read"""
+    def __init__(self, array, chunks):
+        self.array = array
+        self.chunks = chunks
+        self.reads = []
+
+    shape = property(lambda self: self.array.shape)
+    dtype = property(lambda self: self.array.dtype)
+
+    def __getitem__(self, key):
+        self.reads.append(range(*key[0].indices(len(self.array))))
+        return self.array[key]
+
+
+class ExpressionTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.array = rng.normal(size=(23, 12, 10)).astype(np.float32)
+        self.source = CountingDataset(self.array, (4, 12, 10))
+        self.times = np.linspace(0, 2.2, 23)
+        self.expr = expression(self.source, self.times)
+        patcher = mock.patch.object(lazy, "block_bytes", 1)  # blocks of one chunk
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_indexing(self):
+        for key in [np.s_[::-1], np.s_[3], np.s_[-2, 5:9], np.s_[1:20:3, ::2, -1],
+                    np.s_[..., 4], np.s_[:, [1, 5, 2]], np.s_[::-3, 10:2:-2], np.s_[5:5]]:
+            assert_array_equal(self.expr[key].compute(), self.array[key], err_msg=str(key))
+            assert_array_equal(self.expr[2:19][key].compute(), self.array[2:19][key])
+        self.assertEqual(self.expr[4:9, 2].shape, (5, 10))
+        with self.assertRaises(IndexError):
+            self.expr[[1, 2]]
+        with self.assertRaises(IndexError):
+            self.expr[23]
+
+    def test_elementwise(self):
+        a = self.array
+        column = np.arange(10, dtype=np.float32)
+        aligned = np.ones((23, 12, 10)) * np.arange(23)[:, None, None]
+        expr = (np.sqrt(abs(self.expr)) * 2 + column) / (aligned + 1)
+        self.assertIsInstance(expr, Expression)
+        self.assertEqual(self.source.reads, [])  # nothing read yet
+        expected = (np.sqrt(abs(a)) * 2 + column) / (aligned + 1)
+        assert_allclose(expr.compute(), expected, rtol=1e-6)
+        self.assertEqual(expr.dtype, expected.dtype)
+        for key in [np.s_[3:9, 4], np.s_[::-2, :, 1:8:3], np.s_[7], np.s_[:, [0, 3]]]:
+            assert_allclose(expr[key].compute(), expected[key], rtol=1e-6, err_msg=str(key))
+        assert_allclose(np.asarray(self.expr - self.expr[::-1]), a - a[::-1])
+        with self.assertRaises(ValueError):
+            self.expr[:5] + self.expr[:6]
+
+    def test_reductions(self):
+        a = self.array
+        for name in ["sum", "mean", "min", "max", "var", "std"]:
+            for axis in [0, (1, 2), None, (0, 2), -1]:
+                assert_allclose(np.asarray(getattr(self.expr, name)(axis=axis)),
+                                getattr(np, name)(a, axis=axis), rtol=1e-5, atol=1e-6,
+                                err_msg="{} {}".format(name, axis))
+            assert_allclose(getattr(self.expr[3:17], name)(axis=0, keepdims=True).compute(),
+                            getattr(np, name)(a[3:17], axis=0, keepdims=True), rtol=1e-5)
+        assert_allclose(np.mean(self.expr, axis=0).compute(), a.mean(axis=0), rtol=1e-5,
+                        atol=1e-6)
+        self.assertEqual(self.expr.mean(axis=0).dtype, np.float32)
+        self.assertEqual(self.expr.mean(axis=0, dtype=np.float64).dtype, np.float64)
+        assert_allclose(self.expr.var(axis=0, ddof=1).compute(), a.var(axis=0, ddof=1),
+                        rtol=1e-5)
+        with self.assertRaises(ValueError):
+            self.expr.max(axis=3)
+
+    def test_diff(self):
+        a = self.array
+        diff = np.diff(a, axis=0)
+        assert_allclose(self.expr.diff().compute(), diff)
+        assert_allclose(self.expr.diff(2).compute(), np.diff(a, 2, axis=0))
+        assert_allclose(self.expr.diff(axis=1)[4:9].compute(), np.diff(a, axis=1)[4:9])
+        assert_allclose(self.expr.diff()[1:4].compute(), diff[1:4])
+        assert_allclose(self.expr.diff()[::-2, 3].compute(), diff[::-2, 3])
+        assert_array_equal(next(self.expr.diff().iter())[0], self.times[1:5])
+
+    def test_chunked_execution(self):
+        a = self.array
+        mean = self.expr[:10].mean(axis=0, dtype=np.float64)
+        result = (self.expr[3:21, 2:9] - mean[2:9]).astype(np.float32).compute()
+        assert_allclose(result, (a[3:21, 2:9] - a[:10, 2:9].mean(axis=0, dtype=np.float64))
+                        .astype(np.float32), rtol=1e-6)
+        self.assertEqual(result.dtype, np.float32)
+        # one read per block, blocks are aligned to the chunks and every row is read once
+        self.assertEqual(self.source.reads, [range(0, 4), range(4, 8), range(8, 10),
+                                             range(3, 4), range(4, 8), range(8, 12),
+                                             range(12, 16), range(16, 20), range(20, 21)])
+        self.source.reads = []
+        self.expr.mean(axis=0).compute()  # a new expression, read again
+        mean.compute()  # computed only once
+        self.assertEqual(self.source.reads, [range(0, 4), range(4, 8), range(8, 12),
+                                             range(12, 16), range(16, 20), range(20, 23)])
+
+    def test_iter(self):
+        blocks = list((self.expr * 2)[1:].iter())
+        self.assertEqual([len(b) for _, b in blocks], [3, 4, 4, 4, 4, 3])
+        assert_array_equal(np.concatenate([t for t, _ in blocks]), self.times[1:])
+        assert_array_equal(np.concatenate([b for _, b in blocks]), self.array[1:] * 2)
+        blocks = list(expression(self.array).iter(batch=10))
+        assert_array_equal(blocks[-1][0], np.arange(20, 23))
+        with self.assertRaises(ValueError):
+            next(self.expr.mean(axis=0).iter())
+
+    def test_no_views(self):
+        """Sources that are arrays are not changed by fused operations"""
+        array = self.array.copy()
+        (expression(array) * 3 + 1).compute()
+        assert_array_equal(array, self.array)
+
+
+class DataLazyTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Lisa.Data(filename)
+
+    def test_units(self):
+        expected = self.data.select("bunch_profile", unit="c/s", t=slice(2, 9))
+        expr = self.data.lazy("bunch_profile", unit="c/s", t=slice(2, 9))
+        assert_allclose(expr.compute(), expected)
+        times, block = next(expr.iter())
+        assert_allclose(times, Lisa.File(filename).bunch_profile(s.TIME)[2:9])
+        times, _ = next(self.data.lazy("bunch_profile", time_unit="s").iter())
+        assert_allclose(times, self.data.bunch_profile(s.TIME, unit="s"))
+        native = self.data.lazy("phase_space", unit="cpnblpnes", precision="native")
+        self.assertEqual(native.dtype, np.float32)
+
+    def test_hdf5(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = op.join(tmpdir, "ps.h5")
+            array = np.random.default_rng(1).random((30, 16, 8), dtype=np.float32)
+            with h5.File(path, 'w') as f:
+                f.create_dataset("ps", data=array, chunks=(8, 16, 8), compression="gzip")
+            with h5.File(path, 'r') as f:
+                expr = expression(f["ps"])
+                self.assertEqual(expr._plan(), (0, 8 * (lazy.block_bytes // (16 * 8 * 4) // 8)))
+                diffs = (expr[5:25] - expr[:10].mean(axis=0)).compute()
+            assert_allclose(diffs, array[5:25] - array[:10].mean(axis=0), atol=1e-6)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_microstructure(self):
+        ps = Lisa.PhaseSpace(filename)
+        ps.microstructure_movie(extract_slice="idx:0", mean_range=(0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os.path as op
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+from numpy.testing import assert_array_equal
+
+import Lisa
+from Lisa.data import DataNotInFile
+from Lisa.data.writer import chunk_shape, layouts
+
+
+class RechunkTest(unittest.TestCase):
+    def setUp(self):
+        self.src = op.join(op.dirname(__file__), "data", "v15-1.h5")
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_chunk_shape(self):
+        shape = (10000, 256, 256)
+        self.assertEqual(chunk_shape(shape, 4, "snapshot"), (4, 256, 256))
+        self.assertEqual(chunk_shape(shape, 4, "timeseries"), (10000, 26, 1))
+        self.assertEqual(chunk_shape(shape, 4, "balanced"), (64, 64, 64))
+        self.assertEqual(chunk_shape(shape, 4, "timeseries", max_rows=100), (100, 256, 10))
+        self.assertEqual(chunk_shape((10, 256, 256), 4, "snapshot", max_rows=1), (1, 256, 256))
+        self.assertIsNone(chunk_shape(shape, 4, "contiguous"))
+        self.assertIsNone(chunk_shape((0, 256, 256), 4, "snapshot"))
+        with self.assertRaises(ValueError):
+            chunk_shape(shape, 4, "random")
+
+    def test_rechunk(self):
+        for layout in layouts:
+            with self.subTest(layout=layout):
+                dst = op.join(self.dir, layout + ".h5")
+                report = Lisa.rechunk(self.src, dst, layout=layout, max_bytes=2 ** 17)
+                self.assertIn("snapshot", report["benchmark"])
+                self.assertEqual(Lisa.File(dst).version, Lisa.File(self.src).version)
+                with h5py.File(self.src, 'r') as src, h5py.File(dst, 'r') as new:
+                    self.assertEqual(dict(new["Info/Parameters"].attrs),
+                                     dict(src["Info/Parameters"].attrs))
+                    names = []
+                    src.visititems(lambda n, o: names.append(n)
+                                   if isinstance(o, h5py.Dataset) else None)
+                    self.assertEqual(report["datasets"], len(names))
+                    for name in names:
+                        assert_array_equal(new[name][()], src[name][()])
+                        self.assertEqual(dict(new[name].attrs), dict(src[name].attrs))
+                    groups = []
+                    src.visititems(lambda n, o: groups.append(n)
+                                   if isinstance(o, h5py.Group) else None)
+                    for name in [""] + groups:
+                        group = src[name or "/"]
+                        self.assertEqual(sorted(new[name or "/"]), sorted(group), name)
+                        for key in group:
+                            link = group.get(key, getlink=True)
+                            if isinstance(link, h5py.SoftLink):
+                                self.assertEqual(new[name or "/"].get(key, getlink=True).path,
+                                                 link.path)
+                    self.assertEqual(sorted(new["PhaseSpace"]),
+                                     ["axis0", "axis1", "axis2", "data"])
+                    chunks = new["PhaseSpace/data"].chunks
+                    if layout == "contiguous":
+                        self.assertIsNone(chunks)
+                    else:
+                        for name in names:
+                            if new[name].chunks is not None:
+                                self.assertEqual(new[name].maxshape, src[name].maxshape)
+                        # blocks of 2**17 bytes are smaller than one snapshot
+                        self.assertEqual(chunks[0], 1)
+                        self.assertLessEqual(np.prod(chunks) * 4, 2 ** 20)
+
+
+class ReduceTest(unittest.TestCase):
+    def setUp(self):
+        self.src = op.join(op.dirname(__file__), "data", "v15-1.h5")
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_reduce(self):
+        s = Lisa.Axis
+        dst = op.join(self.dir, "reduced.h5")
+        report = Lisa.reduce(self.src, dst, time_stride=3, crop="auto", max_bytes=2 ** 12)
+        x = slice(*report["selection"][s.XAXIS])
+        e = slice(*report["selection"][s.EAXIS])
+        self.assertLess(x.stop - x.start, 256)
+        original, reduced = Lisa.File(self.src), Lisa.File(dst)
+        self.assertEqual(reduced.version, original.version)
+        assert_array_equal(reduced.bunch_profile(s.TIME), original.bunch_profile(s.TIME)[::3])
+        assert_array_equal(reduced.bunch_profile(s.XAXIS), original.bunch_profile(s.XAXIS)[x])
+        assert_array_equal(reduced.bunch_profile(s.DATA)[()],
+                           original.bunch_profile(s.DATA)[::3, x])
+        # the phase space is saved only twice, it is not reduced in time
+        assert_array_equal(reduced.phase_space(s.DATA)[()], original.phase_space(s.DATA)[:, x, e])
+        assert_array_equal(reduced.impedance(s.REAL), original.impedance(s.REAL))
+        # the cropped part holds (almost) no charge
+        np.testing.assert_allclose(np.sum(reduced.bunch_profile(s.DATA), axis=1),
+                                   np.sum(original.bunch_profile(s.DATA)[::3], axis=1), rtol=1e-3)
+        with h5py.File(dst, 'r') as new:
+            self.assertEqual(new["BunchPopulation/data"].dtype, np.float32)  # float64 before
+            self.assertEqual(dict(new["BunchProfile/data"].attrs),
+                             dict(original.bunch_profile(s.DATA).attrs))
+            self.assertEqual(new["PhaseSpace"].get("axis1", getlink=True).path,
+                             "/Info/AxisValues_z")
+        profile = Lisa.Data(dst).bunch_profile(s.DATA, unit="c/s")
+        assert_array_equal(profile[1], Lisa.Data(self.src).bunch_profile(s.DATA, unit="c/s")[3, x])
+
+    def test_select(self):
+        s = Lisa.Axis
+        dst = op.join(self.dir, "reduced.h5")
+        Lisa.reduce(self.src, dst, time_range=(0.5, 1, "ts"), crop={"x": slice(100, 150)},
+                    dtype=None, groups=["bunch_profile", "csr_intensity"])
+        original, reduced = Lisa.File(self.src), Lisa.File(dst)
+        assert_array_equal(reduced.csr_intensity(s.DATA)[()], original.csr_intensity(s.DATA)[5:])
+        assert_array_equal(reduced.bunch_profile(s.DATA)[()],
+                           original.bunch_profile(s.DATA)[5:, 100:150])
+        with self.assertRaises(DataNotInFile):
+            reduced.phase_space(s.DATA)
+        with self.assertRaises(ValueError):
+            Lisa.reduce(self.src, dst, time_stride=0)
+        with self.assertRaises(DataNotInFile):
+            Lisa.reduce(self.src, dst, groups=["bunch_profiles"])
+        with self.assertRaises(DataNotInFile):
+            Lisa.reduce(self.src, dst, crop={"t": (0, 1)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Per call overhead of reading single snapshots with unit conversion.
+
+Compares Data.<group>(axis, unit)[i] and Data.select (dataset, factor and dtype are resolved on
+every call) with a bound Data.accessor (resolved once) and a plain h5py read as lower bound.
+
+Usage::
+
+    python benchmarks/accessor_overhead.py [/path/to/result.h5] [group] [unit]
+"""
+
+import os
+import sys
+import timeit
+
+import h5py as h5
+
+import Lisa
+
+default_file = os.path.join(os.path.dirname(__file__), os.pardir, "Lisa", "tests", "data",
+                            "v15-1.h5")
+
+
+def run(filename, what="bunch_profile", unit="c/s", number=2000):
+    """
+    Time the different ways to read one snapshot
+    :return: dictionary method -> microseconds per call
+    """
+    data = Lisa.Data(filename)
+    length = len(getattr(data._file, what)(Lisa.Axis.DATA))
+    accessor = data.accessor(what, Lisa.Axis.DATA, unit=unit)
+    h5file = h5.File(filename, 'r')
+    dataset = h5file[getattr(data._file, what)(Lisa.Axis.DATA).name]
+    factor = accessor.factor
+    calls = {
+        "Data.{}(...)[i]".format(what):
+            lambda i: getattr(data, what)(Lisa.Axis.DATA, unit=unit)[i],
+        "Data.select(..., t=i)": lambda i: data.select(what, unit=unit, t=i),
+        "Data.accessor(...)[i]": lambda i: accessor[i],
+        "h5py dataset[i] * factor": lambda i: dataset[i] * factor,
+    }
+    results = {}
+    for name, call in calls.items():
+        counter = iter(range(number * 3))
+        seconds = min(timeit.repeat(lambda: call(next(counter) % length), number=number,
+                                    repeat=3))
+        results[name] = seconds / number * 1e6
+    h5file.close()
+    return results
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    filename = args[0] if len(args) > 0 else default_file
+    what = args[1] if len(args) > 1 else "bunch_profile"
+    unit = args[2] if len(args) > 2 else "c/s"
+    for name, us in run(filename, what, unit).items():
+        print("{:<32} {:8.1f} us/call".format(name, us))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+:Author: Patrick Schreiber
+
+Scaling of parallel phase_space snapshot reads from a single Lisa.File.
+
+Creates a copy of a result file with a larger, gzip compressed phase space (chunked like Inovesa
+does) and reads all snapshots with File.select from 1, 2, 4 and 8 threads, once with
+decompression by HDF5 (threads=0, serialized by the h5py lock) and once with chunks decompressed
+by Lisa (threads=<readers>, see Lisa.data.decode).
+
+Usage::
+
+    python benchmarks/parallel_reads.py [/path/to/result.h5] [snapshots]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py as h5
+import numpy as np
+
+import Lisa
+
+default_file = os.path.join(os.path.dirname(__file__), os.pardir, "Lisa", "tests", "data",
+                            "v15-1.h5")
+
+
+def make_file(template, filename, snapshots=512, size=256):
+    """
+    Copy template to filename and replace the phase space with snapshots random snapshots
+    """
+    shutil.copy(template, filename)
+    rng = np.random.default_rng(0)
+    x = np.linspace(-4, 4, size, dtype=np.float32)
+    gauss = np.exp(-(x[:, None] ** 2 + x[None, :] ** 2) / 2)
+    with h5.File(filename, 'a') as f:
+        attrs = dict(f["PhaseSpace/data"].attrs)
+        del f["PhaseSpace/data"]
+        data = f.create_dataset("PhaseSpace/data", shape=(snapshots, size, size),
+                                dtype=np.float32, chunks=(64, 64, 64), compression="gzip",
+                                shuffle=True)
+        for start in range(0, snapshots, 64):
+            block = gauss * rng.normal(1, 0.05, (min(64, snapshots - start), size, size))
+            data[start:start + 64] = np.round(block, 3)
+        data.attrs.update(attrs)
+
+
+def read_all(filename, readers, threads):
+    """
+    Read every snapshot, split into contiguous blocks per reader thread
+    :return: snapshots per second
+    """
+    f = Lisa.File(filename, threads=threads)
+    length = len(f.phase_space(Lisa.Axis.DATA))
+    blocks = np.array_split(np.arange(length), readers)
+
+    def work(block):
+        for i in block:
+            f.select("phase_space", t=int(i)).sum()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(readers) as pool:
+        list(pool.map(work, blocks))
+    return length / (time.perf_counter() - start)
+
+
+def run(template, snapshots=512, readers=(1, 2, 4, 8)):
+    """
+    :return: dictionary (readers, decode threads) -> snapshots per second
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, "parallel.h5")
+        make_file(template, filename, snapshots)
+        results = {}
+        for n in readers:
+            for threads in (0, n):
+                results[(n, threads)] = read_all(filename, n, threads)
+        return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    template = args[0] if len(args) > 0 else default_file
+    snapshots = int(args[1]) if len(args) > 1 else 512
+    for (readers, threads), rate in run(template, snapshots).items():
+        print("{:2d} readers, threads={:<2d} {:8.1f} snapshots/s".format(readers, threads, rate))
@@ -11,6 +11,7 @@ requires = [
         'numpy',
         'h5py',
         'moviepy',
+        'tqdm',
         'unittest2'
     ]
 